@@ -1,71 +1,64 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-import google.generativeai as genai
+from flask import Flask, render_template, request, url_for, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
 import os
-from datetime import datetime
-from generate_files import FileGenerator
-from github_handler import GitHubHandler
-import shutil
-import requests
-import mistralai
-from mistralai import Mistral
+from batch_generate import (BatchManager, BatchRunner, BatchNotFoundError, BatchRunningError, DEFAULT_GIT_PUSH_CONCURRENCY,
+                            parse_batch_items)
+from github_handler import get_github_handler, rate_limiter
+from checkpoints import CheckpointStore
+from job_queue import (AdmissionPolicy, ClientLimitError, JobQueue, JobStateError, QueueFullError,
+                       parse_client_weights, JOB_COMPLETED, JOB_FAILED)
+from llm_providers import find_provider_layer
+from metrics import REGISTRY, Trace, current_trace, load_trace, prune_traces, stage
+from pipeline import build_provider_from_env, generate_repository, update_repository
+from resilience import ResilientProvider
+from router import ProviderRouter
+from repo_index import RepositoryIndex, SORT_RELEVANCE
+from preview_resolver import DEFAULT_PREVIEW_IMAGE, FULL_NAME_PATTERN, PreviewResolver
+import json
+import math
+import re
+import threading
+import time
+from typing import Optional
 
 load_dotenv()
 
 app = Flask(__name__)
 
-# Function to get the valid API key
-def get_api_key():
-    api_keys = {
-        "GOOGLE_API_KEY": "gemini",
-        "OPENAI_API_KEY": "openai",
-        "MISTRAL_API_KEY": "mistral"
-    }
-
-    for env_var, api_name in api_keys.items():
-        api_key = os.getenv(env_var)
-        if api_key:
-            print(f"Using {api_name} API with key from {env_var}")
-            return api_key, api_name
-
-    raise ValueError("No valid API key found in environment variables")
-
-# Configure the selected API
-api_key, api_name = get_api_key()
-
-if api_name == "gemini":
-    import google.generativeai as genai
-    genai.configure(api_key=api_key)
-    model = 'gemini-pro'  # Define model for the gemini API
-    generative_model = genai.GenerativeModel(model)
-elif api_name == "openai":
-    import openai
-    openai.api_key = api_key
-    model = "gpt-3.5-turbo"  # o "gpt-4" se hai accesso
-    generative_model = openai.ChatCompletion
-elif api_name == "mistral":
-    from mistralai import Mistral
-    model = "mistral-medium"  # o "mistral-small" o "mistral-large-latest"
-    generative_model = Mistral(api_key=api_key)
-else:
-    raise ValueError("Unsupported API")
+# Services of the process, created by init_services() rather than at import
+# time so that each server worker builds its own clients, connection pools and
+# background threads after the fork. The provider keeps its client and
+# connection pool for the lifetime of the worker.
+provider = None
+response_cache = None
+preview_resolver = None
+repository_index = None
+checkpoint_store = None
+job_queue = None
+batch_manager = None
+_services_lock = threading.Lock()
+
+# Limits how many repositories are pushed to GitHub at the same time, shared
+# by single jobs and batches
+push_semaphore = threading.BoundedSemaphore(DEFAULT_GIT_PUSH_CONCURRENCY)
 
 REPOS_PER_PAGE = 50
 
+# How generated projects reach GitHub: "disk" writes them to data/projects and
+# pushes the directory, "memory" keeps them in memory and pushes git objects
+# built directly, "api" creates the commit through the GitHub Git Data API.
+PROJECT_BUILD_MODE = os.getenv('PROJECT_BUILD_MODE', 'disk')
+
 def is_repo_link_valid(repo_url):
     """
     Checks if a repository link is valid by making a HEAD request.
     Returns True if valid (status code 200-399), False if 404, and None for other errors.
     """
-    try:
-        response = requests.head(repo_url, allow_redirects=True, timeout=5)
-        return 200 <= response.status_code < 400
-    except requests.exceptions.RequestException:
-        return None
+    return preview_resolver.is_url_valid(repo_url)
 
 def get_github_repo_info(repo_url):
     """
-    Extracts repository information from GitHub API and tests different preview image URLs.
+    Extracts repository information from GitHub API and resolves its preview image.
     """
     try:
         # Extract username and repository name from URL
@@ -90,32 +83,15 @@ def get_github_repo_info(repo_url):
             headers['Authorization'] = f"token {os.getenv('GITHUB_TOKEN')}"
 
         # Make request to GitHub API
-        response = requests.get(api_url, headers=headers, timeout=5)
+        rate_limiter.acquire()
+        response = preview_resolver.session.get(api_url, headers=headers, timeout=5)
+        rate_limiter.update_from_headers(response.headers)
 
         if response.status_code == 200:
             repo_data = response.json()
 
-            # Try different approaches to get an image
-            image_url = None
-
-            # Lista di possibili URL per le preview images
-            preview_urls = [
-                f"https://opengraph.githubassets.com/1/{username}/{repo_name}",  # OG Image
-                f"https://repository-images.githubusercontent.com/{repo_data['id']}/social",  # Social Card
-                f"https://raw.githubusercontent.com/{username}/{repo_name}/master/preview.png",  # Custom preview
-                repo_data['owner']['avatar_url'],  # Owner avatar
-                "https://github.githubassets.com/images/modules/logos_page/GitHub-Mark.png"  # Default
-            ]
-
-            # Test each URL until we find one that works
-            for url in preview_urls:
-                try:
-                    preview_response = requests.head(url, allow_redirects=True, timeout=2)
-                    if preview_response.status_code == 200:
-                        image_url = url
-                        break
-                except:
-                    continue
+            # Probe the candidate preview images concurrently, best match first
+            image_url = preview_resolver.resolve(f"{username}/{repo_name}", repo_id=repo_data['id'])
 
             return {
                 "title": repo_data['full_name'],
@@ -136,115 +112,435 @@ def index():
 @app.route('/api/repositories')
 def get_repositories():
     page = request.args.get('page', 1, type=int)
-    sort_by = request.args.get('sort', 'recent')
-    search_term = request.args.get('search', '', type=str).lower()
-
-    # Map frontend sort options to GitHub API parameters
-    sort_mapping = {
-        'recent': ('created', 'desc'),
-        'name': ('full_name', 'asc'),
-        'rating': ('stars', 'desc')  # Using stars as a proxy for rating
-    }
-
-    sort_param, direction = sort_mapping.get(sort_by, ('created', 'desc'))
+    search_term = request.args.get('search', '', type=str).strip()
+    sort_by = request.args.get('sort', SORT_RELEVANCE if search_term else 'recent')
 
     try:
-        github_handler = GitHubHandler()
-        result = github_handler.get_all_repositories(
+        # Fill the index on the first request if the background refresh hasn't yet
+        if not repository_index.has_synced():
+            repository_index.refresh(full=True)
+
+        result = repository_index.query(
             page=page,
             per_page=REPOS_PER_PAGE,
-            sort=sort_param,
-            direction=direction
+            sort=sort_by,
+            search=search_term
         )
-
-        if result is None:
-            return jsonify({'error': 'Failed to fetch repositories'}), 500
-
-        # Filter repositories by search term if provided
-        if search_term:
-            filtered_repos = [
-                repo for repo in result['repositories']
-                if search_term in repo['repo_name'].lower() or
-                (repo['link_preview']['description'] and
-                 search_term in repo['link_preview']['description'].lower())
-            ]
-
-            # Recalculate pagination for filtered results
-            total_filtered = len(filtered_repos)
-            total_pages = (total_filtered + REPOS_PER_PAGE - 1) // REPOS_PER_PAGE
-
-            # Paginate filtered results
-            start_idx = (page - 1) * REPOS_PER_PAGE
-            end_idx = start_idx + REPOS_PER_PAGE
-            paginated_repos = filtered_repos[start_idx:end_idx]
-
-            return jsonify({
-                'repositories': paginated_repos,
-                'total_pages': total_pages,
-                'current_page': page
-            })
-
         return jsonify(result)
 
     except Exception as e:
         app.logger.error(f"Error fetching repositories: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def run_generation_job(payload, reporter):
+    """
+    Runs the full generation pipeline for a queued job: generates the project
+    files, creates the GitHub repository and returns the repository details.
+    A job with a repo_name updates that repository instead.
+    """
+    user_prompt = payload['prompt']
+    repo_name = payload.get('repo_name')
+
+    def on_event(event, **data):
+        reporter.emit(event, **data)
+        if event == 'tree_ready':
+            reporter.set_stage('generating', repo_name=data['repo_name'], total_files=len(data['files']),
+                               files={file_path: 'pending' for file_path in data['files']})
+        elif event == 'file_started':
+            reporter.set_file_status(data['file_path'], 'generating')
+        elif event == 'file_done':
+            reporter.set_file_status(data['file_path'], 'done')
+        elif event == 'push_started':
+            reporter.set_stage('pushing')
+
+    reporter.set_stage('planning')
+    trace = Trace(reporter.job_id)
+    trace_token = current_trace.set(trace)
+    try:
+        with stage('job'):
+            if repo_name:
+                result, repo_info = update_repository(
+                    repo_name, user_prompt, provider, get_github_handler(),
+                    on_event=on_event, push_semaphore=push_semaphore
+                )
+            else:
+                result, repo_info = generate_repository(
+                    user_prompt, provider, get_github_handler(),
+                    build_mode=PROJECT_BUILD_MODE, on_event=on_event, push_semaphore=push_semaphore,
+                    checkpoint=checkpoint_store.open(f"job:{reporter.job_id}")
+                )
+    finally:
+        current_trace.reset(trace_token)
+        if JOB_TRACE_DIR:
+            try:
+                trace.save(JOB_TRACE_DIR)
+                prune_job_traces()
+            except OSError as e:
+                app.logger.error(f"Error saving trace of job {reporter.job_id}: {str(e)}")
+    repository_index.add_repository_info(repo_info, prompt=user_prompt)
+    reporter.set_stage('completed', repo_url=repo_info['url'])
+    return result
+
+# Per-job stage timelines, served by /jobs/<job_id>/trace (empty to disable)
+JOB_TRACE_DIR = os.getenv('JOB_TRACE_DIR', os.path.join('data', 'traces'))
+JOB_TRACE_MAX_AGE = float(os.getenv('JOB_TRACE_MAX_AGE', str(7 * 24 * 60 * 60)))
+JOB_TRACE_MAX_FILES = int(os.getenv('JOB_TRACE_MAX_FILES', '10000'))
+# Seconds between two cleanups of the trace directory by a process
+TRACE_PRUNE_INTERVAL = 60
+_last_trace_prune = None
+_trace_prune_lock = threading.Lock()
+
+def prune_job_traces():
+    """Deletes the traces beyond JOB_TRACE_MAX_AGE or JOB_TRACE_MAX_FILES, at most once per interval."""
+    global _last_trace_prune
+    with _trace_prune_lock:
+        now = time.monotonic()
+        if _last_trace_prune is not None and now - _last_trace_prune < TRACE_PRUNE_INTERVAL:
+            return
+        _last_trace_prune = now
+    deleted = prune_traces(JOB_TRACE_DIR, JOB_TRACE_MAX_AGE, JOB_TRACE_MAX_FILES)
+    if deleted:
+        app.logger.info(f"Deleted {deleted} old job traces")
+
+# Request header identifying the client for admission control, such as an API
+# key or the client address set by a trusted proxy. The remote address is used
+# when it is empty or missing.
+JOB_CLIENT_HEADER = os.getenv('JOB_CLIENT_HEADER', '')
+
+def get_client_id():
+    if JOB_CLIENT_HEADER:
+        client_id = request.headers.get(JOB_CLIENT_HEADER, '').strip()
+        if client_id:
+            return client_id[:200]
+    return request.remote_addr or ''
+
+def rejected_job_response(error: QueueFullError):
+    """
+    Responds to a rejected job: 429 when the client is over its own limits,
+    503 when the queue is, with the seconds to wait in a Retry-After header.
+    """
+    status_code = 429 if isinstance(error, ClientLimitError) else 503
+    headers = {}
+    if error.retry_after is not None:
+        headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return jsonify({'error': str(error)}), status_code, headers
+
 @app.route('/generate', methods=['POST'])
 def generate_code():
+    user_prompt = request.form.get('prompt')
+    if not user_prompt:
+        return jsonify({'error': 'No prompt provided'}), 400
+
     try:
-        user_prompt = request.form.get('prompt')
-        if not user_prompt:
-            return jsonify({'error': 'No prompt provided'}), 400
-
-        # Initialize the file generator with all necessary parameters
-        file_generator = FileGenerator(
-            generative_model=generative_model,
-            api_name=api_name,
-            model_name=model
-        )
-        output_dir = None  # Initialize output_dir here
-
-        try:
-            # Generate the project and separate output_dir and repo_title
-            output_dir, repo_name = file_generator.generate_project(user_prompt)
-
-            # Create the GitHub repository
-            github_handler = GitHubHandler()
-            repo_url = github_handler.create_repository(repo_name, output_dir)
-
-            # Clean up the local directory
-            shutil.rmtree(output_dir)
-
-            # Get the repository details from GitHub
-            repo_info = github_handler.get_repository_info(repo_name)
-
-            # Return the newly created repository details
-            return jsonify({
-                'repo_name': repo_info['name'],
-                'repo_url': repo_info['url'],
-                'repo_timestamp': repo_info['created_at'].strftime('%B %d, %Y'),
-                'repo_id': repo_name,
-                'link_preview': {
-                    'title': repo_info['name'],
-                    'description': repo_info['description'],
-                    'stars': repo_info['stars']
-                }
-            })
-
-        except Exception as e:
-            if output_dir and os.path.exists(output_dir):
-                shutil.rmtree(output_dir)  # Clean up only if output_dir exists
-            raise e
+        job_id = job_queue.submit({'prompt': user_prompt}, client_id=get_client_id())
+    except QueueFullError as e:
+        return rejected_job_response(e)
+    except Exception as e:
+        app.logger.error(f"Error queueing generation job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('get_job_status', job_id=job_id),
+        'events_url': url_for('stream_job_events', job_id=job_id)
+    }), 202
+
+# Names GitHub accepts for a repository
+REPO_NAME_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,100}$')
 
+@app.route('/repositories/<repo_name>/update', methods=['POST'])
+def update_repository_code(repo_name):
+    user_prompt = request.form.get('prompt')
+    if not user_prompt:
+        return jsonify({'error': 'No prompt provided'}), 400
+    if not REPO_NAME_PATTERN.match(repo_name):
+        return jsonify({'error': 'Invalid repository name'}), 400
+
+    try:
+        job_id = job_queue.submit({'prompt': user_prompt, 'repo_name': repo_name}, client_id=get_client_id())
+    except QueueFullError as e:
+        return rejected_job_response(e)
     except Exception as e:
-        app.logger.error(f"Error generating code: {str(e)}")
+        app.logger.error(f"Error queueing update job: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('get_job_status', job_id=job_id),
+        'events_url': url_for('stream_job_events', job_id=job_id)
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def get_job_status(job_id):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/trace')
+def get_job_trace(job_id):
+    if not JOB_TRACE_DIR or not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return jsonify({'error': 'Trace not found'}), 404
+    trace = load_trace(JOB_TRACE_DIR, job_id)
+    if trace is None:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify(trace)
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """
+    Queues a failed job again. The new attempt reuses the directory tree and
+    the files saved by the failed one and only generates what is missing.
+    """
+    try:
+        event_id = job_queue.retry(job_id)
+    except JobStateError as e:
+        return jsonify({'error': str(e)}), 409
+    except QueueFullError as e:
+        return rejected_job_response(e)
+    if event_id is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('get_job_status', job_id=job_id),
+        'events_url': url_for('stream_job_events', job_id=job_id, last_event_id=event_id)
+    }), 202
+
+SSE_POLL_INTERVAL = 0.5
+SSE_KEEPALIVE_INTERVAL = 15
+
+@app.route('/jobs/<job_id>/events')
+def stream_job_events(job_id):
+    """
+    Streams the events of a generation job as Server-Sent Events.
+    Clients reconnecting with a Last-Event-ID header, or a last_event_id query
+    parameter, resume after that event.
+    """
+    if job_queue.get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', 0, type=int), type=int)
+
+    def generate(last_id):
+        last_sent = time.monotonic()
+        while True:
+            for event in job_queue.get_events(job_id, after_id=last_id):
+                last_id = event['id']
+                yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                last_sent = time.monotonic()
+                if event['event'] in (JOB_COMPLETED, JOB_FAILED):
+                    return
+            if time.monotonic() - last_sent >= SSE_KEEPALIVE_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(SSE_POLL_INTERVAL)
+
+    return Response(
+        stream_with_context(generate(last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def add_batch_result_to_index(record, repo_info):
+    if repo_info is not None:
+        repository_index.add_repository_info(repo_info, prompt=record['prompt'])
+
+@app.route('/batches', methods=['POST'])
+def create_batch():
+    upload = request.files.get('file')
+    text = upload.read().decode('utf-8') if upload else request.get_data(as_text=True)
+
+    try:
+        items = parse_batch_items(text.splitlines())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # A batch counts against its client's limits like that many jobs
+    try:
+        job_queue.admit(client_id=get_client_id(), cost=len(items))
+    except QueueFullError as e:
+        return rejected_job_response(e)
+
+    try:
+        batch_id = batch_manager.create(text)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Error creating batch: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify({
+        'batch_id': batch_id,
+        'status_url': url_for('get_batch_status', batch_id=batch_id)
+    }), 202
+
+@app.route('/batches/<batch_id>')
+def get_batch_status(batch_id):
+    batch = batch_manager.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(batch)
+
+@app.route('/batches/<batch_id>/resume', methods=['POST'])
+def resume_batch(batch_id):
+    try:
+        batch_manager.start(batch_id)
+    except BatchNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except BatchRunningError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({
+        'batch_id': batch_id,
+        'status_url': url_for('get_batch_status', batch_id=batch_id)
+    }), 202
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    if response_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **response_cache.stats()})
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/llm/stats')
+def get_llm_stats():
+    stats = {'providers': []}
+    resilient_provider = find_provider_layer(provider, ResilientProvider)
+    if resilient_provider is not None:
+        stats.update(resilient_provider.stats())
+        router = next((health.provider for health in resilient_provider.providers
+                       if isinstance(health.provider, ProviderRouter)), None)
+        if router is not None:
+            stats['routing'] = router.stats()
+    return jsonify(stats)
+
+MAX_PREVIEW_BATCH = 100
+
+@app.route('/api/previews', methods=['POST'])
+def resolve_previews():
+    """
+    Resolves the preview images of a page of repository cards in one call.
+    Expects {"repositories": [{"full_name": "user/repo", "repo_id": 123}, ...]}.
+    """
+    data = request.get_json(silent=True) or {}
+    repos = data.get('repositories')
+    if not isinstance(repos, list):
+        return jsonify({'error': 'repositories must be a list'}), 400
+    if len(repos) > MAX_PREVIEW_BATCH:
+        return jsonify({'error': f'At most {MAX_PREVIEW_BATCH} repositories per request'}), 400
+
+    repos = [{'full_name': repo} if isinstance(repo, str) else repo for repo in repos]
+    if not all(isinstance(repo, dict) and isinstance(repo.get('full_name'), str) and
+               FULL_NAME_PATTERN.match(repo['full_name']) for repo in repos):
+        return jsonify({'error': 'Every repository needs a full_name like "user/repo"'}), 400
+
+    # Only the name and numeric ID are used: every probed URL comes from the configured hosts
+    repos = [
+        {'full_name': repo['full_name'],
+         'repo_id': repo['repo_id'] if type(repo.get('repo_id')) is int else None}
+        for repo in repos
+    ]
+    return jsonify({'previews': preview_resolver.resolve_many(repos)})
+
+@app.route('/api/github/rate-limit')
+def get_github_rate_limit():
+    return jsonify(rate_limiter.metrics())
+
 @app.route('/privacy')
 def privacy():
     return render_template('privacy.html')
 
+def init_services():
+    """
+    Creates the services of this process and starts their background threads.
+    Safe to call more than once; gunicorn calls it when each worker starts
+    (see gunicorn.conf.py), and the first request does otherwise.
+    """
+    global provider, response_cache, preview_resolver, repository_index, checkpoint_store, job_queue, batch_manager
+    with _services_lock:
+        if job_queue is not None:
+            return
+
+        # Configure the selected API
+        provider, response_cache = build_provider_from_env()
+
+        # Resolves repository preview images concurrently, with a per-repository cache
+        preview_resolver = PreviewResolver(
+            max_workers=int(os.getenv('PREVIEW_MAX_WORKERS', '16')),
+            timeout=float(os.getenv('PREVIEW_TIMEOUT', '2')),
+            ttl=float(os.getenv('PREVIEW_CACHE_TTL', '3600')),
+            negative_ttl=float(os.getenv('PREVIEW_NEGATIVE_CACHE_TTL', '300')),
+            opengraph_url=os.getenv('PREVIEW_OPENGRAPH_URL', 'https://opengraph.githubassets.com'),
+            social_url=os.getenv('PREVIEW_SOCIAL_URL', 'https://repository-images.githubusercontent.com'),
+            raw_url=os.getenv('PREVIEW_RAW_URL', 'https://raw.githubusercontent.com'),
+            avatar_url=os.getenv('PREVIEW_AVATAR_URL', 'https://github.com'),
+            default_image=os.getenv('PREVIEW_DEFAULT_IMAGE', DEFAULT_PREVIEW_IMAGE)
+        )
+
+        # Local index of the user's repositories, refreshed in the background
+        repository_index = RepositoryIndex(db_path=os.getenv('REPO_INDEX_DB_PATH', os.path.join('data', 'repositories.sqlite3')))
+        repository_index.start_background_refresh(
+            interval=float(os.getenv('REPO_INDEX_REFRESH_INTERVAL', '60')),
+            full_sync_interval=float(os.getenv('REPO_INDEX_FULL_SYNC_INTERVAL', '3600'))
+        )
+
+        # Progress of each generation, kept until its repository is created so that
+        # retrying a failed job continues where it stopped
+        checkpoint_store = CheckpointStore(
+            db_path=os.getenv('CHECKPOINT_DB_PATH', os.path.join('data', 'checkpoints.sqlite3')),
+            ttl=float(os.getenv('CHECKPOINT_TTL', str(7 * 24 * 60 * 60)))
+        )
+
+        # Batches of prompts share one file generation pool and the global push limit
+        batch_manager = BatchManager(
+            BatchRunner(
+                provider,
+                build_mode=PROJECT_BUILD_MODE,
+                push_semaphore=push_semaphore,
+                on_result=add_batch_result_to_index,
+                checkpoint_store=checkpoint_store
+            ),
+            batches_dir=os.getenv('BATCH_DIR', os.path.join('data', 'batches')),
+            lease_seconds=float(os.getenv('BATCH_LEASE_SECONDS', '60'))
+        )
+
+        queue = JobQueue(
+            handler=run_generation_job,
+            db_path=os.getenv('JOB_DB_PATH', os.path.join('data', 'jobs.sqlite3')),
+            num_workers=int(os.getenv('JOB_WORKERS', '2')),
+            max_in_flight=int(os.getenv('JOB_MAX_IN_FLIGHT', '10')),
+            lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', '60')),
+            ttl=float(os.getenv('JOB_TTL', str(7 * 24 * 60 * 60))),
+            admission=AdmissionPolicy(
+                rate=float(os.getenv('JOB_CLIENT_RATE', '10')) / 60,
+                burst=float(os.getenv('JOB_CLIENT_BURST', '5')),
+                max_in_flight=int(os.getenv('JOB_CLIENT_MAX_IN_FLIGHT', '3')),
+                max_queue_wait=float(os.getenv('JOB_MAX_QUEUE_WAIT', '900')),
+                weights=parse_client_weights(os.getenv('JOB_CLIENT_WEIGHTS', ''))
+            )
+        )
+        queue.start()
+        job_queue = queue  # Set last: it marks the services as ready
+
+def shutdown_services(timeout: Optional[float] = None):
+    """
+    Stops the background threads of this process. Running jobs are given up
+    to timeout seconds to finish, all together; the ones still running are
+    marked failed, and can be retried to continue from their checkpoint.
+    """
+    if job_queue is not None:
+        job_queue.stop(timeout)
+    if repository_index is not None:
+        repository_index.stop_background_refresh()
+
+@app.before_request
+def ensure_services():
+    if job_queue is None:
+        init_services()
+
 if __name__ == '__main__':
+    init_services()
     app.run(host='0.0.0.0', debug=False)
 
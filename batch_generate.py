@@ -0,0 +1,443 @@
+# batch_generate.py
+import argparse
+import json
+import logging
+import os
+import re
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from checkpoints import CheckpointStore
+from github_handler import GitHubHandler, get_github_handler
+from llm_providers import LLMProvider, ConcurrencyLimitedProvider
+from pipeline import generate_repository
+
+logger = logging.getLogger(__name__)
+
+RESULT_COMPLETED = 'completed'
+RESULT_FAILED = 'failed'
+
+BATCH_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+# Defaults of the batch limits, see the Configuration section of the README
+DEFAULT_BATCH_LLM_CONCURRENCY = int(os.getenv('BATCH_LLM_CONCURRENCY', '8'))
+DEFAULT_BATCH_PROJECT_CONCURRENCY = int(os.getenv('BATCH_PROJECT_CONCURRENCY', '4'))
+DEFAULT_GIT_PUSH_CONCURRENCY = int(os.getenv('GIT_PUSH_CONCURRENCY', '2'))
+DEFAULT_BATCH_LEASE_SECONDS = 60
+
+
+class BatchNotFoundError(Exception):
+    """Raised when a batch id doesn't exist."""
+
+
+class BatchRunningError(Exception):
+    """Raised when resuming a batch that is still running."""
+
+
+def parse_batch_items(lines: List[str]) -> List[dict]:
+    """
+    Parses the JSONL lines of a batch into items with an 'id' and a 'prompt'.
+
+    Each line holds either a 'prompt' or a 'title' and 'body', like
+    requests.jsonl. The id comes from 'id' or 'request_id' and defaults to
+    the line number. Blank lines are ignored.
+
+    Raises:
+        ValueError: If a line is not valid JSON, has no prompt or repeats an id
+    """
+    items = []
+    seen = set()
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_number} is not valid JSON: {e}")
+        if not isinstance(entry, dict):
+            raise ValueError(f"Line {line_number} is not a JSON object")
+
+        prompt = entry.get('prompt')
+        if not prompt and (entry.get('title') or entry.get('body')):
+            prompt = "\n\n".join(part for part in (entry.get('title'), entry.get('body')) if part)
+        if not prompt:
+            raise ValueError(f"Line {line_number} has no prompt")
+
+        item_id = str(entry.get('id') or entry.get('request_id') or f"line-{line_number}")
+        if item_id in seen:
+            raise ValueError(f"Line {line_number} repeats the id {item_id}")
+        seen.add(item_id)
+        items.append({'id': item_id, 'prompt': prompt})
+    return items
+
+
+def read_batch_items(input_path: str) -> List[dict]:
+    """Reads the items of a JSONL batch file, see parse_batch_items()."""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        return parse_batch_items(f.readlines())
+
+
+def load_results(output_path: str) -> Dict[str, dict]:
+    """
+    Reads a results JSONL file, keeping the latest record of each item.
+    A truncated last line left by a crash is ignored.
+    """
+    results = {}
+    if not os.path.exists(output_path):
+        return results
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[record['id']] = record
+    return results
+
+
+class BatchRunner:
+    """
+    Generates the repositories of a batch of prompts.
+
+    The file generations of every project share one thread pool, and LLM
+    calls and git pushes have their own global limits, so a batch keeps the
+    model busy without opening one pool and one push per project. Each
+    finished item is appended to the results file and flushed to disk right
+    away; running the same batch again skips the items already completed.
+    """
+
+    def __init__(self, provider: LLMProvider, github_handler: Optional[GitHubHandler] = None, build_mode: str = 'disk',
+                 llm_concurrency: int = DEFAULT_BATCH_LLM_CONCURRENCY,
+                 project_concurrency: int = DEFAULT_BATCH_PROJECT_CONCURRENCY,
+                 push_concurrency: int = DEFAULT_GIT_PUSH_CONCURRENCY,
+                 push_semaphore: Optional[threading.Semaphore] = None,
+                 on_result: Optional[Callable[[dict, Optional[dict]], None]] = None,
+                 checkpoint_store: Optional[CheckpointStore] = None):
+        """
+        Args:
+            provider: Provider used for every model call of the batch
+            github_handler: Handler used to create the repositories, the shared one by default
+            build_mode: Build mode of the repositories, see pipeline.BUILD_MODES
+            llm_concurrency: Maximum number of model calls running at once across the batch
+            project_concurrency: Maximum number of projects being planned or pushed at once
+            push_concurrency: Maximum number of repositories pushed at once, unless push_semaphore is given
+            push_semaphore: Push limit shared with other callers
+            on_result: Called with the result record and the repository information of each item
+            checkpoint_store: Saves the progress of each item, so a rerun continues
+                interrupted projects instead of starting them over
+        """
+        self.provider = ConcurrencyLimitedProvider(provider, max(1, llm_concurrency))
+        self.github_handler = github_handler
+        self.build_mode = build_mode
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.project_concurrency = max(1, project_concurrency)
+        self.push_semaphore = push_semaphore or threading.BoundedSemaphore(max(1, push_concurrency))
+        self.on_result = on_result
+        self.checkpoint_store = checkpoint_store
+        self._write_lock = threading.Lock()
+
+    def _write_result(self, output_path: str, record: dict):
+        with self._write_lock:
+            with open(output_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _run_item(self, item: dict, output_path: str, file_executor: ThreadPoolExecutor) -> dict:
+        started_at = time.time()
+        record = {'id': item['id'], 'prompt': item['prompt']}
+        repo_info = None
+        try:
+            checkpoint = None
+            if self.checkpoint_store is not None:
+                checkpoint = self.checkpoint_store.open(f"batch:{os.path.abspath(output_path)}:{item['id']}")
+            result, repo_info = generate_repository(
+                item['prompt'], self.provider, self.github_handler or get_github_handler(),
+                build_mode=self.build_mode, executor=file_executor,
+                max_workers=self.llm_concurrency, push_semaphore=self.push_semaphore,
+                checkpoint=checkpoint
+            )
+            record.update(status=RESULT_COMPLETED, result=result)
+        except Exception as e:
+            logger.error(f"Batch item {item['id']} failed: {str(e)}")
+            record.update(status=RESULT_FAILED, error=str(e))
+        record.update(started_at=started_at, finished_at=time.time())
+        self._write_result(output_path, record)
+
+        if self.on_result is not None:
+            try:
+                self.on_result(record, repo_info)
+            except Exception as e:
+                logger.error(f"Result hook failed for batch item {item['id']}: {str(e)}")
+        return record
+
+    def run(self, input_path: str, output_path: str, retry_failed: bool = True) -> dict:
+        """
+        Runs every item of the batch that isn't completed yet.
+
+        Args:
+            input_path: JSONL file of prompts
+            output_path: JSONL file the results are appended to
+            retry_failed: Also run the items whose last attempt failed
+
+        Returns:
+            dict: Number of items, completed, failed and skipped
+        """
+        items = read_batch_items(input_path)
+        previous = load_results(output_path)
+        todo = [
+            item for item in items
+            if previous.get(item['id'], {}).get('status') != RESULT_COMPLETED
+            and (retry_failed or item['id'] not in previous)
+        ]
+        logger.info(f"Running {len(todo)} of {len(items)} batch items from {input_path}")
+
+        records = []
+        with ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix='batch-file') as file_executor, \
+                ThreadPoolExecutor(max_workers=self.project_concurrency, thread_name_prefix='batch-project') as projects:
+            futures = [projects.submit(self._run_item, item, output_path, file_executor) for item in todo]
+            records = [future.result() for future in futures]
+
+        return {
+            'total': len(items),
+            'completed': sum(1 for record in records if record['status'] == RESULT_COMPLETED),
+            'failed': sum(1 for record in records if record['status'] == RESULT_FAILED),
+            'skipped': len(items) - len(todo)
+        }
+
+
+class BatchManager:
+    """
+    Keeps the batches submitted through the API under batches_dir, one
+    directory per batch holding input.jsonl and results.jsonl, and runs each
+    of them on a background thread.
+
+    The process running a batch is recorded in batches.sqlite3 with a
+    heartbeat, so that every server process sharing batches_dir sees the
+    batch as running and refuses to start it a second time. A batch whose
+    process died can be resumed once its heartbeat is lease_seconds old.
+    """
+
+    def __init__(self, runner: BatchRunner, batches_dir: str = os.path.join('data', 'batches'),
+                 lease_seconds: float = DEFAULT_BATCH_LEASE_SECONDS):
+        self.runner = runner
+        self.batches_dir = batches_dir
+        self.lease_seconds = lease_seconds
+        self.db_path = os.path.join(batches_dir, 'batches.sqlite3')
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._threads = {}  # batch_id -> running thread
+        self._lock = threading.Lock()
+        os.makedirs(batches_dir, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS batch_runs (
+                    batch_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    heartbeat_at REAL NOT NULL
+                )
+            """)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _paths(self, batch_id: str):
+        if not BATCH_ID_PATTERN.fullmatch(batch_id):
+            raise BatchNotFoundError(f"Batch {batch_id} not found")
+        batch_dir = os.path.join(self.batches_dir, batch_id)
+        return os.path.join(batch_dir, 'input.jsonl'), os.path.join(batch_dir, 'results.jsonl')
+
+    def _claim_run(self, batch_id: str):
+        """
+        Records this process as the one running a batch.
+
+        Raises:
+            BatchRunningError: If another process's heartbeat for the batch is still fresh
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT heartbeat_at FROM batch_runs WHERE batch_id = ?", (batch_id,)).fetchone()
+            if row is not None and row['heartbeat_at'] > time.time() - self.lease_seconds:
+                conn.execute("ROLLBACK")
+                raise BatchRunningError(f"Batch {batch_id} is already running")
+            conn.execute(
+                "INSERT OR REPLACE INTO batch_runs (batch_id, owner, heartbeat_at) VALUES (?, ?, ?)",
+                (batch_id, self.owner, time.time())
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _beat(self, batch_id: str, done: threading.Event):
+        # Renew well before expiry, so a slow beat does not let another process take the batch
+        while not done.wait(self.lease_seconds / 3):
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "UPDATE batch_runs SET heartbeat_at = ? WHERE batch_id = ? AND owner = ?",
+                    (time.time(), batch_id, self.owner)
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Error renewing the heartbeat of batch {batch_id}: {str(e)}")
+            finally:
+                conn.close()
+
+    def _release_run(self, batch_id: str):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM batch_runs WHERE batch_id = ? AND owner = ?", (batch_id, self.owner))
+        finally:
+            conn.close()
+
+    def _is_running(self, batch_id: str) -> bool:
+        """Whether some process sharing batches_dir is running the batch."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT heartbeat_at FROM batch_runs WHERE batch_id = ?", (batch_id,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None and row['heartbeat_at'] > time.time() - self.lease_seconds
+
+    def _run(self, batch_id: str):
+        input_path, output_path = self._paths(batch_id)
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._beat, args=(batch_id, done),
+                                     name=f'batch-heartbeat-{batch_id[:8]}', daemon=True)
+        heartbeat.start()
+        try:
+            summary = self.runner.run(input_path, output_path)
+            logger.info(f"Batch {batch_id} finished: {summary}")
+        except Exception as e:
+            logger.error(f"Batch {batch_id} stopped: {str(e)}")
+        finally:
+            done.set()
+            heartbeat.join()
+            try:
+                self._release_run(batch_id)
+            except sqlite3.Error as e:
+                logger.error(f"Error releasing batch {batch_id}: {str(e)}")
+            with self._lock:
+                self._threads.pop(batch_id, None)
+
+    def create(self, text: str) -> str:
+        """
+        Stores a new batch and starts it.
+
+        Raises:
+            ValueError: If the JSONL is invalid or has no items
+        """
+        if not parse_batch_items(text.splitlines()):
+            raise ValueError("The batch has no prompts")
+        batch_id = uuid.uuid4().hex
+        input_path, _ = self._paths(batch_id)
+        os.makedirs(os.path.dirname(input_path))
+        with open(input_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        self.start(batch_id)
+        return batch_id
+
+    def start(self, batch_id: str):
+        """
+        Runs the items of a batch that aren't completed yet, e.g. after a restart.
+
+        Raises:
+            BatchNotFoundError: If the batch doesn't exist
+            BatchRunningError: If the batch is already running, in this process or another one
+        """
+        input_path, _ = self._paths(batch_id)
+        if not os.path.exists(input_path):
+            raise BatchNotFoundError(f"Batch {batch_id} not found")
+        with self._lock:
+            if batch_id in self._threads:
+                raise BatchRunningError(f"Batch {batch_id} is already running")
+            self._claim_run(batch_id)
+            thread = threading.Thread(target=self._run, args=(batch_id,), name=f'batch-{batch_id[:8]}', daemon=True)
+            self._threads[batch_id] = thread
+            thread.start()
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        """Returns the progress and results of a batch, or None if it doesn't exist."""
+        try:
+            input_path, output_path = self._paths(batch_id)
+        except BatchNotFoundError:
+            return None
+        if not os.path.exists(input_path):
+            return None
+        items = read_batch_items(input_path)
+        results = load_results(output_path)
+        with self._lock:
+            running = batch_id in self._threads
+        running = running or self._is_running(batch_id)
+
+        completed = sum(1 for record in results.values() if record['status'] == RESULT_COMPLETED)
+        failed = sum(1 for record in results.values() if record['status'] == RESULT_FAILED)
+        if running:
+            status = 'running'
+        elif completed == len(items):
+            status = 'completed'
+        else:
+            status = 'incomplete'  # Stopped with failed or unfinished items, can be resumed
+        return {
+            'batch_id': batch_id,
+            'status': status,
+            'total': len(items),
+            'completed': completed,
+            'failed': failed,
+            'items': [
+                {'id': item['id'], **{key: value for key, value in results.get(item['id'], {'status': 'pending'}).items()
+                                      if key not in ('id', 'prompt')}}
+                for item in items
+            ]
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate one GitHub repository per prompt of a JSONL file.")
+    parser.add_argument('input', help="JSONL file with a 'prompt', or a 'title' and 'body', per line")
+    parser.add_argument('-o', '--output', help="Results JSONL file (default: <input>.results.jsonl)")
+    parser.add_argument('--llm-concurrency', type=int, default=DEFAULT_BATCH_LLM_CONCURRENCY,
+                        help="Maximum number of model calls running at once")
+    parser.add_argument('--project-concurrency', type=int, default=DEFAULT_BATCH_PROJECT_CONCURRENCY,
+                        help="Maximum number of projects in progress at once")
+    parser.add_argument('--push-concurrency', type=int, default=DEFAULT_GIT_PUSH_CONCURRENCY,
+                        help="Maximum number of repositories pushed at once")
+    parser.add_argument('--build-mode', choices=('disk', 'memory', 'api'),
+                        default=os.getenv('PROJECT_BUILD_MODE', 'disk'))
+    parser.add_argument('--no-retry-failed', action='store_true',
+                        help="Skip items that already failed in a previous run")
+    parser.add_argument('--checkpoint-db', default=os.getenv('CHECKPOINT_DB_PATH', os.path.join('data', 'checkpoints.sqlite3')),
+                        help="SQLite database keeping the progress of unfinished projects")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    from pipeline import build_provider_from_env
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    provider, _ = build_provider_from_env()
+    runner = BatchRunner(
+        provider, get_github_handler(), build_mode=args.build_mode,
+        llm_concurrency=args.llm_concurrency, project_concurrency=args.project_concurrency,
+        push_concurrency=args.push_concurrency, checkpoint_store=CheckpointStore(args.checkpoint_db)
+    )
+    output_path = args.output or os.path.splitext(args.input)[0] + '.results.jsonl'
+    summary = runner.run(args.input, output_path, retry_failed=not args.no_retry_failed)
+    print(json.dumps(summary))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# benchmarks/context_benchmark.py
+"""
+Measures how the size of file prompts grows with project size for different
+context token budgets.
+
+Usage:
+    python benchmarks/context_benchmark.py --files 10 50 100 --budgets 0 4000 8000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context_builder import ContextBuilder, estimate_tokens  # noqa: E402
+from generate_files import FileGenerator  # noqa: E402
+from llm_providers import FakeProvider  # noqa: E402
+
+
+def synthetic_file(index: int, lines: int) -> str:
+    """Returns a Python module that imports the previous module and declares a few functions."""
+    body = [f"from module_{index - 1} import helper_{index - 1}" if index else "import os", ""]
+    for function in range(lines // 10):
+        body.append(f"def helper_{index}_{function}(value):")
+        body.extend(f"    value = value + {step}  # step {step}" for step in range(8))
+        body.append("    return value\n")
+    body.append(f"helper_{index} = helper_{index}_0")
+    return "\n".join(body)
+
+
+def run(num_files: int, max_tokens: int, file_lines: int) -> dict:
+    file_list = [f"src/module_{index}.py" for index in range(num_files)]
+    generator = FileGenerator(FakeProvider(), context_builder=ContextBuilder(max_tokens=max_tokens))
+
+    prompt_tokens = []
+    start = time.perf_counter()
+    for index, file_path in enumerate(file_list):
+        context = generator._build_context(file_path, "A Python utility library", file_list)
+        prompt_tokens.append(estimate_tokens(context))
+        generator.current_files[file_path] = synthetic_file(index, file_lines)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'files': num_files,
+        'max_tokens': max_tokens,
+        'total_prompt_tokens': sum(prompt_tokens),
+        'max_prompt_tokens': max(prompt_tokens),
+        'build_seconds': round(elapsed, 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--budgets', type=int, nargs='+', default=[0, 4000, 8000],
+                        help="Context token budgets to compare, 0 means unbounded")
+    parser.add_argument('--file-lines', type=int, default=100)
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = [run(num_files, budget, args.file_lines) for num_files in args.files for budget in args.budgets]
+    for result in results:
+        print(f"{result['files']:>5} files  budget {result['max_tokens'] or 'none':>6}  "
+              f"total {result['total_prompt_tokens']:>10} tokens  "
+              f"max {result['max_prompt_tokens']:>8} tokens  {result['build_seconds']:.4f}s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
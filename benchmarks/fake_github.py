@@ -0,0 +1,173 @@
+# benchmarks/fake_github.py
+"""
+A local stand-in for the few GitHub REST endpoints the generator uses, so
+benchmarks can create and push repositories without touching the network.
+
+Creating a repository initialises a bare git repository under remotes_dir,
+which GitHubHandler pushes to when GITHUB_GIT_URL points at that directory.
+
+Usage:
+    python benchmarks/fake_github.py --port 8765 --remotes-dir /tmp/remotes
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class FakeGitHub:
+    """Runs the fake API on a background thread and keeps the repositories it created."""
+
+    def __init__(self, username: str, remotes_dir: str, host: str = '127.0.0.1', port: int = 0):
+        """
+        Args:
+            username: Login of the authenticated user
+            remotes_dir: Directory holding the bare repositories, as <username>/<name>.git
+            host: Interface to listen on
+            port: Port to listen on, 0 picks a free one
+        """
+        self.username = username
+        self.remotes_dir = remotes_dir
+        self.repos = {}  # name -> repository JSON
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeGitHub':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _user_json(self) -> dict:
+        return {
+            'login': self.username,
+            'id': 1,
+            'type': 'User',
+            'url': f'{self.url}/users/{self.username}',
+            'html_url': f'{self.url}/{self.username}'
+        }
+
+    def _create_repo(self, body: dict) -> Optional[dict]:
+        name = body.get('name')
+        with self._lock:
+            if not name or name in self.repos:
+                return None
+            repo_id, self._next_id = self._next_id, self._next_id + 1
+            now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            path = os.path.join(self.remotes_dir, self.username, f'{name}.git')
+            self.repos[name] = {
+                'id': repo_id,
+                'name': name,
+                'full_name': f'{self.username}/{name}',
+                'html_url': f'{self.url}/{self.username}/{name}',
+                'url': f'{self.url}/repos/{self.username}/{name}',
+                'description': body.get('description'),
+                'private': bool(body.get('private')),
+                'stargazers_count': 0,
+                'forks_count': 0,
+                'language': None,
+                'default_branch': 'master',
+                'created_at': now,
+                'updated_at': now,
+                'pushed_at': now,
+                'owner': self._user_json()
+            }
+        subprocess.run(['git', 'init', '--quiet', '--bare', path], check=True)
+        return self.repos[name]
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body=None):
+                payload = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.send_header('X-RateLimit-Limit', '5000')
+                self.send_header('X-RateLimit-Remaining', '5000')
+                self.send_header('X-RateLimit-Reset', str(int(time.time()) + 3600))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _read_json(self) -> dict:
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def _repo_name(self) -> Optional[str]:
+                parts = self.path.split('?')[0].strip('/').split('/')
+                if len(parts) == 3 and parts[0] == 'repos' and parts[1] == fake.username:
+                    return parts[2]
+                return None
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                path = self.path.split('?')[0].rstrip('/')
+                if path == '/user':
+                    return self._send(200, fake._user_json())
+                if path == '/user/repos':
+                    return self._send(200, list(fake.repos.values()))
+                repo = fake.repos.get(self._repo_name())
+                if repo is None:
+                    return self._send(404, {'message': 'Not Found'})
+                self._send(200, repo)
+
+            def do_POST(self):
+                with fake._lock:
+                    fake.requests += 1
+                if self.path.split('?')[0].rstrip('/') != '/user/repos':
+                    return self._send(404, {'message': 'Not Found'})
+                repo = fake._create_repo(self._read_json())
+                if repo is None:
+                    return self._send(422, {'message': 'Repository creation failed.'})
+                self._send(201, repo)
+
+            def do_DELETE(self):
+                with fake._lock:
+                    fake.requests += 1
+                    repo = fake.repos.pop(self._repo_name(), None)
+                self._send(204 if repo is not None else 404)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--username', default='benchmark')
+    parser.add_argument('--remotes-dir', required=True)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    fake = FakeGitHub(args.username, args.remotes_dir, args.host, args.port)
+    print(f"Fake GitHub API on {fake.url}, set GITHUB_API_URL={fake.url} "
+          f"and GITHUB_GIT_URL=file://{os.path.abspath(args.remotes_dir)}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
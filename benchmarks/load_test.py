@@ -0,0 +1,89 @@
+# benchmarks/load_test.py
+"""
+Measures the requests per second and latency of an endpoint of a running
+server for increasing numbers of concurrent clients.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+    python benchmarks/load_test.py --url http://127.0.0.1:5000/api/repositories --concurrency 1 8 32
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+import requests
+
+
+def run(url: str, concurrency: int, duration: float) -> dict:
+    """Sends requests from concurrency clients for duration seconds."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        nonlocal errors
+        session = requests.Session()  # One keep-alive connection per client
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                ok = session.get(url, timeout=30).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(fraction):
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2) if latencies else None
+
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+        'p50_ms': percentile(0.5),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/repositories')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--duration', type=float, default=10, help="Seconds each concurrency level runs")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in args.concurrency:
+        result = run(args.url, concurrency, args.duration)
+        results.append(result)
+        print(f"concurrency {concurrency:>4}  {result['requests_per_second']:>9.1f} req/s  "
+              f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  "
+              f"errors {result['errors']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
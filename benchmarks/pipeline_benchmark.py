@@ -0,0 +1,246 @@
+# benchmarks/pipeline_benchmark.py
+"""
+Measures the generation pipeline end to end without the network: the
+directory tree and every file come from a mock model with a fixed latency
+and output size, and the repository is created on a local fake GitHub API
+and pushed to a bare git repository.
+
+Each configuration runs in its own process, so the peak RSS it reports
+belongs to that run alone. The results can be saved as JSON and compared
+with a saved baseline; the run exits with status 1 when a configuration got
+slower, used more memory or sent bigger prompts than the threshold allows.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py --files 10 50 100 --concurrency 1 4 16 --output results.json
+    python benchmarks/pipeline_benchmark.py --baseline results.json --threshold 0.15
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_github import FakeGitHub  # noqa: E402
+
+USERNAME = 'benchmark'
+
+# Spread over a few directories and extensions, since related files share both
+DIRECTORIES = ['src', 'src/core', 'src/utils', 'src/api', 'tests', 'docs']
+EXTENSIONS = ['.py', '.py', '.js', '.json', '.md']
+# Boilerplate files that are generated in batches, placed in each directory in turn
+SMALL_FILE_NAMES = ['__init__.py', '.gitignore', 'requirements.txt', 'setup.cfg']
+SMALL_FILE_BYTES = 120
+
+BATCH_FILES_PATTERN = re.compile(r'each of these files: (\[.*?\])\. ')
+
+# Measurements compared against the baseline, all lower is better
+COMPARED_FIELDS = ('wall_seconds', 'peak_rss_mb', 'mean_prompt_bytes')
+
+
+def synthetic_file_list(num_files: int, small_files: int = 0):
+    """
+    Returns num_files distinct paths spread over DIRECTORIES and EXTENSIONS,
+    small_files of which are SMALL_FILE_NAMES spaced evenly through the list.
+    """
+    small_files = min(small_files, num_files, len(DIRECTORIES) * len(SMALL_FILE_NAMES))
+    file_list = [
+        f"{DIRECTORIES[index % len(DIRECTORIES)]}/module_{index}{EXTENSIONS[index % len(EXTENSIONS)]}"
+        for index in range(num_files - small_files)
+    ]
+    for index in range(small_files):
+        path = f"{DIRECTORIES[index % len(DIRECTORIES)]}/{SMALL_FILE_NAMES[index // len(DIRECTORIES)]}"
+        file_list.insert(index * num_files // small_files, path)
+    return file_list
+
+
+def mock_responder(file_list, title: str, file_bytes: int):
+    """
+    Returns a responder answering the tree prompt with file_list, a batch
+    prompt with a block of SMALL_FILE_BYTES per file and any other prompt with
+    file_bytes of code.
+    """
+    tree = json.dumps({'files': file_list, 'title': f'<title>{title}</title>'})
+    line = "value = compute(value, step)  # padding for the benchmark\n"
+    body = (line * (file_bytes // len(line) + 1))[:file_bytes]
+    code = f"```\n{body}\n```"
+    small_body = (line * (SMALL_FILE_BYTES // len(line) + 1))[:SMALL_FILE_BYTES]
+
+    def respond(prompt: str) -> str:
+        if "Generate a JSON response" in prompt:
+            return tree
+        batch = BATCH_FILES_PATTERN.search(prompt)
+        if batch:
+            return "".join(f"=== FILE: {path} ===\n{small_body}\n=== END FILE ===\n" for path in json.loads(batch.group(1)))
+        return code
+
+    return respond
+
+
+def run_single(num_files: int, concurrency: int, build_mode: str, latency: float, file_bytes: int,
+               small_files: int = 0) -> dict:
+    """Runs one project through generation and push in the current directory."""
+    from generate_files import FileGenerator
+    from github_handler import GitHubHandler
+    from llm_providers import FakeProvider
+
+    remotes_dir = os.path.abspath('remotes')
+    fake_github = FakeGitHub(USERNAME, remotes_dir).start()
+    os.environ.update({
+        'GITHUB_TOKEN': 'benchmark-token',
+        'GITHUB_USERNAME': USERNAME,
+        'GITHUB_API_URL': fake_github.url,
+        'GITHUB_GIT_URL': f'file://{remotes_dir}'
+    })
+
+    file_list = synthetic_file_list(num_files, small_files)
+    provider = FakeProvider(responder=mock_responder(file_list, f'Benchmark {num_files}', file_bytes),
+                            latency=latency, chunk_size=256)
+    generator = FileGenerator(provider, max_workers=concurrency, keep_in_memory=build_mode == 'memory')
+    github_handler = GitHubHandler()
+
+    try:
+        start = time.perf_counter()
+        output_dir, repo_name = generator.generate_project("A benchmark project")
+        generated = time.perf_counter()
+        if output_dir is None:
+            github_handler.create_repository_from_files(repo_name, generator.current_files)
+        else:
+            github_handler.create_repository(repo_name, output_dir)
+        pushed = time.perf_counter()
+    finally:
+        fake_github.stop()
+
+    # Check the push reached the remote rather than trusting the timings
+    remote = os.path.join(remotes_dir, USERNAME, f'{repo_name}.git')
+    pushed_files = subprocess.run(
+        ['git', '--git-dir', remote, 'ls-tree', '-r', '--name-only', 'master'],
+        check=True, capture_output=True, text=True
+    ).stdout.split()
+
+    file_prompts = [len(prompt.encode()) for prompt in provider.prompts if "Generate a JSON response" not in prompt]
+    wall = pushed - start
+    return {
+        'files': num_files,
+        'concurrency': concurrency,
+        'build_mode': build_mode,
+        'latency': latency,
+        'file_bytes': file_bytes,
+        'small_files': small_files,
+        'wall_seconds': round(wall, 4),
+        'generate_seconds': round(generated - start, 4),
+        'push_seconds': round(pushed - generated, 4),
+        'files_per_second': round(num_files / wall, 2),
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'llm_calls': len(provider.prompts),
+        'mean_prompt_bytes': round(statistics.mean(file_prompts)) if file_prompts else 0,
+        'max_prompt_bytes': max(file_prompts, default=0),
+        'pushed_files': len(pushed_files),
+        'github_requests': fake_github.requests
+    }
+
+
+def run_isolated(num_files: int, concurrency: int, build_mode: str, latency: float, file_bytes: int,
+                 small_files: int = 0) -> dict:
+    """Runs one configuration in a fresh process and working directory."""
+    with tempfile.TemporaryDirectory(prefix='pipeline-benchmark-') as work_dir:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--single',
+             '--files', str(num_files), '--concurrency', str(concurrency), '--build-mode', build_mode,
+             '--latency', str(latency), '--file-bytes', str(file_bytes), '--small-files', str(small_files)],
+            cwd=work_dir, capture_output=True, text=True
+        )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_key(result: dict) -> tuple:
+    return (result['files'], result['concurrency'], result['build_mode'], result['latency'], result['file_bytes'],
+            result.get('small_files', 0))
+
+
+def compare(results, baseline, threshold: float):
+    """Returns a description of every measurement worse than the baseline by more than threshold."""
+    previous = {run_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(run_key(result))
+        if old is None:
+            continue
+        for field in COMPARED_FIELDS:
+            if old.get(field) and result[field] > old[field] * (1 + threshold):
+                regressions.append(
+                    f"{result['files']} files, concurrency {result['concurrency']}, {result['build_mode']}: "
+                    f"{field} {old[field]} -> {result[field]} (+{(result[field] / old[field] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, nargs='+', default=[10, 50, 100, 250, 500])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--build-mode', nargs='+', choices=['disk', 'memory'], default=['disk', 'memory'])
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds the mock model waits before answering")
+    parser.add_argument('--file-bytes', type=int, default=2000, help="Size of each generated file")
+    parser.add_argument('--small-files', type=int, default=0,
+                        help="Boilerplate files among --files, generated in batches (at most "
+                             f"{len(DIRECTORIES) * len(SMALL_FILE_NAMES)})")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per configuration, the median is kept")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="Compare with the results saved in this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Relative increase over the baseline reported as a regression")
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        logging.basicConfig(level=logging.WARNING)
+        print(json.dumps(run_single(args.files[0], args.concurrency[0], args.build_mode[0],
+                                    args.latency, args.file_bytes, args.small_files)))
+        return
+
+    results = []
+    for build_mode in args.build_mode:
+        for concurrency in args.concurrency:
+            for num_files in args.files:
+                runs = sorted(
+                    (run_isolated(num_files, concurrency, build_mode, args.latency, args.file_bytes, args.small_files)
+                     for _ in range(max(1, args.repeat))),
+                    key=lambda result: result['wall_seconds']
+                )
+                result = runs[len(runs) // 2]
+                results.append(result)
+                print(f"{build_mode:>6}  concurrency {concurrency:>3}  {num_files:>5} files  "
+                      f"{result['wall_seconds']:>8.3f}s (generate {result['generate_seconds']:.3f}s, "
+                      f"push {result['push_seconds']:.3f}s)  {result['files_per_second']:>8.2f} files/s  "
+                      f"rss {result['peak_rss_mb']:>7.1f} MB  prompt {result['mean_prompt_bytes']:>7} B/file  "
+                      f"{result['llm_calls']} calls")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# checkpoints.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('data', 'checkpoints.sqlite3')
+
+# Checkpoints untouched for this many seconds are dropped when the store opens
+DEFAULT_CHECKPOINT_TTL = 7 * 24 * 60 * 60
+
+PUSH_PENDING = 'pending'
+PUSH_DONE = 'pushed'
+
+
+class GenerationCheckpoint:
+    """
+    Saved progress of one project generation: the directory tree, every
+    completed file and whether the repository was pushed.
+
+    The attributes hold the state loaded when the checkpoint was opened, and
+    each save_* method writes through to the store right away, so a retry
+    after a failure or a crash continues from the last completed step.
+    """
+
+    def __init__(self, store: 'CheckpointStore', key: str, file_list: Optional[List[str]] = None,
+                 title: Optional[str] = None, repo_name: Optional[str] = None,
+                 files: Optional[Dict[str, str]] = None, push_state: str = PUSH_PENDING,
+                 repo_url: Optional[str] = None):
+        self.store = store
+        self.key = key
+        self.file_list = file_list  # None until the directory tree is saved
+        self.title = title
+        self.repo_name = repo_name
+        self.files = files or {}
+        self.push_state = push_state
+        self.repo_url = repo_url
+
+    @property
+    def has_tree(self) -> bool:
+        return self.file_list is not None
+
+    def save_tree(self, file_list: List[str], title: str, repo_name: str):
+        """Saves the directory tree and the repository name chosen for it."""
+        self.file_list, self.title, self.repo_name = list(file_list), title, repo_name
+        self.store._update(self.key, file_list=json.dumps(self.file_list), title=title, repo_name=repo_name)
+
+    def save_file(self, file_path: str, content: str):
+        """Saves a completed file."""
+        self.files[file_path] = content
+        self.store._save_file(self.key, file_path, content)
+
+    def save_push(self, push_state: str, repo_url: Optional[str] = None):
+        """Saves the push state of the repository."""
+        self.push_state, self.repo_url = push_state, repo_url
+        self.store._update(self.key, push_state=push_state, repo_url=repo_url)
+
+    def clear(self):
+        """Deletes the checkpoint once the generation has fully succeeded."""
+        self.store.delete(self.key)
+
+
+class CheckpointStore:
+    """
+    Local SQLite store of generation checkpoints, keyed by a caller-chosen
+    string such as the job id.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, ttl: Optional[float] = DEFAULT_CHECKPOINT_TTL):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                key TEXT PRIMARY KEY,
+                file_list TEXT,
+                title TEXT,
+                repo_name TEXT,
+                push_state TEXT NOT NULL DEFAULT 'pending',
+                repo_url TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint_files (
+                key TEXT NOT NULL,
+                path TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (key, path)
+            )
+        """)
+        if ttl:
+            self.purge(ttl)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def open(self, key: str) -> GenerationCheckpoint:
+        """Returns the checkpoint saved under key, or a new empty one."""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM checkpoints WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO checkpoints (key, updated_at) VALUES (?, ?)", (key, time.time())
+            )
+            return GenerationCheckpoint(self, key)
+
+        files = {
+            file_row['path']: file_row['content']
+            for file_row in conn.execute("SELECT path, content FROM checkpoint_files WHERE key = ?", (key,))
+        }
+        return GenerationCheckpoint(
+            self, key,
+            file_list=json.loads(row['file_list']) if row['file_list'] else None,
+            title=row['title'],
+            repo_name=row['repo_name'],
+            files=files,
+            push_state=row['push_state'],
+            repo_url=row['repo_url']
+        )
+
+    def _update(self, key: str, **fields):
+        fields['updated_at'] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE checkpoints SET {columns} WHERE key = ?", (*fields.values(), key))
+
+    def _save_file(self, key: str, file_path: str, content: str):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoint_files (key, path, content) VALUES (?, ?, ?)",
+                (key, file_path, content)
+            )
+            conn.execute("UPDATE checkpoints SET updated_at = ? WHERE key = ?", (time.time(), key))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key: str):
+        """Deletes a checkpoint and its files."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM checkpoint_files WHERE key = ?", (key,))
+            conn.execute("DELETE FROM checkpoints WHERE key = ?", (key,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def purge(self, older_than: float) -> int:
+        """
+        Deletes the checkpoints not updated for older_than seconds.
+
+        Returns:
+            int: Number of checkpoints deleted
+        """
+        cutoff = time.time() - older_than
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM checkpoint_files WHERE key IN (SELECT key FROM checkpoints WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            deleted = conn.execute("DELETE FROM checkpoints WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if deleted:
+            logger.info(f"Dropped {deleted} expired generation checkpoints")
+        return deleted
@@ -0,0 +1,167 @@
+# context_builder.py
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Mapping, Optional
+
+# Default token budget for the context of a single file prompt
+DEFAULT_CONTEXT_MAX_TOKENS = int(os.getenv('CONTEXT_MAX_TOKENS', '8000'))
+
+# Weights used to rank previously generated files by relevance to the target file
+DEFAULT_RANKING_WEIGHTS = {
+    'references_target': 8.0,  # The file imports or mentions the target file
+    'shared_symbols': 2.0,     # Per symbol of the file that matches a word in the target path
+    'same_directory': 3.0,
+    'same_extension': 1.0,
+}
+
+# Lines kept in a digest: imports and top-level declarations in common languages
+SIGNATURE_PATTERN = re.compile(
+    r'^\s*(?:import\b|from\s+\S+\s+import\b|(?:async\s+)?def\b|class\b|function\b|export\b|'
+    r'module\.exports\b|(?:const|let|var)\s+\w+\s*=\s*(?:require|\(|async|function)|'
+    r'interface\b|type\s+\w+\s*=|struct\b|fn\b|func\b|package\b|'
+    r'(?:public|private|protected)\b|@app\.route\b|<(?:title|form|script|link)\b|[.#]?[\w-]+\s*\{)'
+)
+SYMBOL_PATTERN = re.compile(
+    r'^\s*(?:async\s+)?(?:def|class|function|interface|struct|fn|func|type)\s+([A-Za-z_]\w*)|'
+    r'^\s*(?:export\s+)?(?:const|let|var)\s+([A-Za-z_]\w*)',
+    re.MULTILINE
+)
+MAX_DIGEST_LINES = 40
+
+# File names mentioned in a file, such as "utils.py" in "./src/utils.py"
+FILE_NAME_PATTERN = re.compile(r'[\w-]+(?:\.[\w-]+)+')
+IMPORT_LINE_PATTERN = re.compile(r'\b(?:import|from|require)\b')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used for budgeting: about four characters per token."""
+    return (len(text) + 3) // 4
+
+
+class FileDigest:
+    """
+    Precomputed summary of a generated file used when it doesn't fit in full.
+    Only what ranking needs is kept, never a copy of the whole content.
+    """
+
+    def __init__(self, path: str, content: str):
+        self.path = path
+        self.tokens = estimate_tokens(content)
+        self.symbols = {match.group(1) or match.group(2) for match in SYMBOL_PATTERN.finditer(content)}
+        lower_content = content.lower()
+        self.file_names = set(FILE_NAME_PATTERN.findall(lower_content))
+        self.import_lines = [line for line in lower_content.splitlines() if IMPORT_LINE_PATTERN.search(line)]
+
+        signature_lines = [line.rstrip() for line in content.splitlines() if SIGNATURE_PATTERN.match(line)]
+        if not signature_lines:
+            signature_lines = content.splitlines()[:10]
+        omitted = len(signature_lines) - MAX_DIGEST_LINES
+        signature_lines = signature_lines[:MAX_DIGEST_LINES]
+        if omitted > 0:
+            signature_lines.append(f"... ({omitted} more declarations)")
+        self.summary = (
+            f"Summary of {path} ({len(content.splitlines())} lines, declarations only):\n"
+            + "\n".join(signature_lines)
+        )
+        self.summary_tokens = estimate_tokens(self.summary)
+
+
+class ContextBuilder:
+    """
+    Builds the context of a file prompt within a token budget.
+
+    Candidate files are ranked by how relevant they are to the file being
+    generated. The most relevant ones are included in full while they fit in
+    the budget, and the rest are replaced by a digest of their imports and
+    declarations, or left out when even the digest doesn't fit. Digests are
+    computed once per file content and reused for every later prompt.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = DEFAULT_CONTEXT_MAX_TOKENS,
+                 weights: Optional[Dict[str, float]] = None):
+        self.max_tokens = max_tokens
+        self.weights = {**DEFAULT_RANKING_WEIGHTS, **(weights or {})}
+        self._digests = {}  # (path, content hash) -> FileDigest
+        self._lock = threading.Lock()
+
+    def digest(self, path: str, content: str) -> FileDigest:
+        """Returns the digest of a file, computing it on first use."""
+        key = (path, hashlib.sha1(content.encode('utf-8')).hexdigest())
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = FileDigest(path, content)
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def score(self, target_path: str, candidate: FileDigest) -> float:
+        """Scores how relevant a generated file is as context for target_path."""
+        target_dir, target_name = os.path.split(target_path)
+        target_module = os.path.splitext(target_name)[0].lower()
+        score = 0.0
+
+        module_pattern = re.compile(rf'\b(?:import|from|require)\b.*\b{re.escape(target_module)}\b')
+        if target_module and (
+            target_name.lower() in candidate.file_names
+            or any(module_pattern.search(line) for line in candidate.import_lines)
+        ):
+            score += self.weights['references_target']
+
+        target_words = {word for word in re.split(r'[^a-z0-9]+', target_path.lower()) if len(word) > 2}
+        shared = {symbol for symbol in candidate.symbols if symbol.lower() in target_words}
+        score += self.weights['shared_symbols'] * len(shared)
+
+        if os.path.dirname(candidate.path) == target_dir:
+            score += self.weights['same_directory']
+        if os.path.splitext(candidate.path)[1] == os.path.splitext(target_path)[1]:
+            score += self.weights['same_extension']
+        return score
+
+    @staticmethod
+    def header(user_request: str, directory_tree: List[str]) -> List[str]:
+        """Returns the sections every context of a project starts with."""
+        return [
+            f"User Request: \"{user_request}\"",
+            f"Directory Tree: {json.dumps(directory_tree)}"
+        ]
+
+    def select(self, file_path: str, candidates: Mapping[str, str],
+               digests: Optional[Mapping[str, FileDigest]] = None,
+               header_tokens: int = 0) -> List[str]:
+        """
+        Picks the previously generated files included in the context of
+        file_path, in full or as a digest, within what the budget leaves
+        after header_tokens.
+
+        Returns:
+            list: One section per included file, in candidate order
+        """
+        if self.max_tokens and self.max_tokens > 0:
+            remaining = self.max_tokens - header_tokens
+        else:
+            remaining = float('inf')  # No budget: include every candidate in full
+
+        digests = digests or {}
+        candidate_digests = [
+            digests[path] if path in digests else self.digest(path, candidates[path]) for path in candidates
+        ]
+        order = {digest.path: index for index, digest in enumerate(candidate_digests)}
+        ranked = sorted(candidate_digests, key=lambda digest: (-self.score(file_path, digest), order[digest.path]))
+
+        selected = {}
+        for digest in ranked:
+            full_tokens = estimate_tokens(f"Content of {digest.path}:\n") + digest.tokens
+            if full_tokens <= remaining:
+                full_text = f"Content of {digest.path}:\n{candidates[digest.path]}"
+                selected[digest.path] = full_text
+                remaining -= full_tokens
+            elif digest.summary_tokens <= remaining:
+                selected[digest.path] = digest.summary
+                remaining -= digest.summary_tokens
+
+        return [selected[path] for path in candidates if path in selected]
+
@@ -1,16 +1,74 @@
 import os
 import re
 import json
+import contextvars
+import logging
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from typing import List, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from checkpoints import GenerationCheckpoint
+from context_builder import ContextBuilder, FileDigest, estimate_tokens
+from generated_files import GeneratedFiles
+from llm_providers import LLMProvider
+from prompt_builder import FILE_SYSTEM_PROMPT, ProjectPrompt
+from metrics import stage, BATCHED_FILES, CONTEXT_TOKENS, FILE_BYTES, LLM_PROMPT_TOKENS, LLM_RESPONSE_TOKENS
+from stream_parsing import FenceStripper, JSONObjectExtractor, split_file_blocks
+
+logger = logging.getLogger(__name__)
+
+# Default number of files generated concurrently for a single project
+DEFAULT_GENERATION_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '4'))
+
+# Default maximum number of small files generated together in one model call, 1 disables batching
+DEFAULT_BATCH_SIZE = int(os.getenv('GENERATION_BATCH_SIZE', '8'))
+
+# Files that are usually a few lines of boilerplate or configuration
+SMALL_FILE_NAMES = {
+    '__init__.py', 'py.typed', '.gitignore', '.gitattributes', '.dockerignore', '.editorconfig',
+    '.env', '.env.example', '.env.sample', '.nvmrc', '.python-version', '.flake8', '.prettierrc',
+    '.eslintrc', '.eslintrc.json', '.babelrc', '.gitkeep', 'requirements.txt', 'requirements-dev.txt',
+    'runtime.txt', 'Procfile', 'MANIFEST.in', 'setup.cfg', 'tox.ini', 'pytest.ini', 'mypy.ini'
+}
+
+
+class GenerationAbandonedError(Exception):
+    """Raised in the file generations still running once another file of the project failed."""
+
 
 class FileGenerator:
-    def __init__(self, generative_model, api_name, model_name):
-        self.generative_model = generative_model
-        self.api_name = api_name
-        self.model_name = model_name
-        self.current_files = {}  # Stores content of files already generated
+    def __init__(self, provider: LLMProvider, max_workers: Optional[int] = None,
+                 on_event: Optional[Callable[..., None]] = None,
+                 context_builder: Optional[ContextBuilder] = None, keep_in_memory: bool = False,
+                 executor: Optional[Executor] = None, checkpoint: Optional[GenerationCheckpoint] = None,
+                 batch_size: Optional[int] = None):
+        self.provider = provider
+        self.context_builder = context_builder or ContextBuilder()
+        self.api_name = provider.name
+        self.model_name = provider.model_name
+        self.max_workers = max(1, max_workers or DEFAULT_GENERATION_CONCURRENCY)
+        self.batch_size = DEFAULT_BATCH_SIZE if batch_size is None else batch_size
+        self.on_event = on_event  # Called as on_event(event, **data) while the project is generated
+        self._abandoned = threading.Event()  # Set when a file failed, so the others stop writing
+        self.current_files = GeneratedFiles()  # Files already generated, streamed to disk once output_dir is claimed
+        self.keep_in_memory = keep_in_memory  # Only keep files in current_files, never write them to disk
+        self.file_digests = {}  # path -> FileDigest of the generated files, computed when first needed
+        self._project_prompts = {}  # (user request, directory tree) -> ProjectPrompt
+        self._prompts_lock = threading.Lock()
+        self.batched_files = set()  # Small files generated in batches, left out of every context meanwhile
+        self.previous_files = set()  # Files rewritten by update_project, whose old version is still in output_dir
         self.output_dir = None
+        self.executor = executor  # Shared pool for file generations, one is created per project when None
+        self.checkpoint = checkpoint  # Saves the tree and each completed file, and resumes from them
+
+    def _emit(self, event: str, **data):
+        """
+        Reports a generation event to the on_event hook.
+        Events are "tree_ready", "file_started" and "file_done". Files restored
+        from a checkpoint are reported by a "file_done" event with resumed=True.
+        """
+        if self.on_event is not None:
+            self.on_event(event, **data)
 
     def get_directory_tree(self, user_prompt: str) -> Tuple[List[str], str]:
         """
@@ -20,6 +78,9 @@ class FileGenerator:
           "files": ["file1.ext", "folder/file2.ext", "folder/subfolder/file3.ext"],
           "title": "<title>Repository Title</title>"
         }
+        The object may be wrapped in markdown fences or surrounded by text. It
+        is returned as soon as it is complete, without waiting for the rest of
+        the response.
         """
         directory_prompt = (
             f"Based on this user request: \"{user_prompt}\"\n"
@@ -34,34 +95,31 @@ class FileGenerator:
             "Include ONLY the JSON, no explanations or other text."
         )
 
+        extractor = JSONObjectExtractor(required_keys=("files",))
         try:
-            if self.api_name == "gemini":
-                response = self.generative_model.generate_content(directory_prompt)
-                response_text = response.text
-            elif self.api_name == "openai":
-                response = self.generative_model.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful code generator assistant."},
-                        {"role": "user", "content": directory_prompt}
-                    ]
-                )
-                response_text = response.choices[0].message.content
-            elif self.api_name == "mistral":
-                response = self.generative_model.chat.complete(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": directory_prompt}]
-                )
-                response_text = response.choices[0].message.content
-            else:
-                raise ValueError("Unsupported API")
-
-            response_text = response_text.strip()
-            print("DEBUG: Raw response text:", response_text)
-            if not response_text:
+            with stage('tree') as span:
+                stream = iter(self.provider.stream(
+                    directory_prompt, system="You are a helpful code generator assistant."
+                ))
+                received = []
+                for chunk in stream:
+                    received.append(chunk)
+                    # Stop reading as soon as the object is complete; fences and prose may follow
+                    if extractor.feed(chunk) is not None:
+                        self._drain_stream(stream)
+                        break
+                response_text = "".join(received)
+                span.update(prompt_tokens=estimate_tokens(directory_prompt), response_tokens=estimate_tokens(response_text))
+            LLM_PROMPT_TOKENS.observe(estimate_tokens(directory_prompt), stage='tree')
+            LLM_RESPONSE_TOKENS.observe(estimate_tokens(response_text), stage='tree')
+
+            logger.debug("Raw directory tree response: %s", response_text)
+            if not response_text.strip():
                 raise ValueError("API returned an empty response. Check your prompt or API configuration.")
 
-            response_json = json.loads(response_text)
+            response_json = extractor.finish()
+            if response_json is None:
+                raise ValueError("Failed to parse JSON response: no JSON object with a \"files\" key found")
             file_list = response_json.get("files")
             repo_title = response_json.get("title", "<title>Default Repo Title</title>")
 
@@ -72,118 +130,451 @@ class FileGenerator:
 
             return file_list, repo_title
 
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Failed to parse JSON response: {str(e)}")
         except Exception as e:
             raise ValueError(f"Failed to process directory tree response: {str(e)}")
 
+    def _drain_stream(self, stream: Iterator[str]):
+        """
+        Reads the rest of a response in the background, so the provider
+        completes the call (and caches the response) while generation goes on.
+        """
+        def drain():
+            try:
+                for _ in stream:
+                    pass
+            except Exception as e:
+                logger.debug("Discarded the tail of a response: %s", e)
+
+        threading.Thread(target=contextvars.copy_context().run, args=(drain,), daemon=True).start()
+
+    def _project_prompt(self, user_request: str, directory_tree: List[str]) -> ProjectPrompt:
+        """Returns the prompt builder of the project, building its shared prefix on first use."""
+        key = (user_request, tuple(directory_tree))
+        with self._prompts_lock:
+            project_prompt = self._project_prompts.get(key)
+            if project_prompt is None:
+                project_prompt = self._project_prompts[key] = ProjectPrompt(user_request, directory_tree)
+        return project_prompt
+
+    def _context_candidates(self, file_paths: List[str], directory_tree: List[str]) -> List[str]:
+        """Returns the generated files related to any of file_paths, in directory tree order."""
+        # Walk the tree rather than current_files so the order does not depend
+        # on which worker finished first.
+        return [
+            path for path in dict.fromkeys(directory_tree)
+            if path not in file_paths and path in self.current_files and path not in self.batched_files
+            and any(self._are_files_related(file_path, path) for file_path in file_paths)
+        ]
+
+    def _context_sections(self, file_path: str, project_prompt: ProjectPrompt,
+                          candidates: List[str]) -> List[str]:
+        """
+        Returns the candidates included in the context of file_path, most
+        relevant first, in full or as a summary while they fit in the context
+        token budget.
+        """
+        with stage('context', file=file_path, candidates=len(candidates)) as span:
+            # Files are only read for their digest once, and again when included in full
+            digests = {path: self._digest(path) for path in candidates}
+            sections = self.context_builder.select(
+                file_path, self.current_files.subset(candidates), digests, project_prompt.header_tokens
+            )
+            span['tokens'] = project_prompt.header_tokens + sum(estimate_tokens(section) for section in sections)
+        CONTEXT_TOKENS.observe(span['tokens'])
+        return sections
 
     def _build_context(self, file_path: str, user_request: str, directory_tree: List[str]) -> str:
         """
         Builds the context for generating a file. It includes:
           - The original user request.
           - The complete directory tree (as JSON).
-          - The contents of any previously generated files that are related.
+          - The previously generated files that are related, most relevant first,
+            in full or as a summary while they fit in the context token budget.
         """
-        context_parts = []
-        context_parts.append(f"User Request: \"{user_request}\"")
-        context_parts.append(f"Directory Tree: {json.dumps(directory_tree)}")
+        project_prompt = self._project_prompt(user_request, directory_tree)
+        candidates = self._context_candidates([file_path], directory_tree)
+        return project_prompt.context(self._context_sections(file_path, project_prompt, candidates))
 
-        # Add contents of previously generated files that are related.
-        for path, content in self.current_files.items():
-            if self._are_files_related(file_path, path):
-                context_parts.append(f"Content of {path}:\n{content}")
-
-        return "\n\n".join(context_parts)
+    def _digest(self, path: str) -> FileDigest:
+        digest = self.file_digests.get(path)
+        if digest is None:
+            digest = self.file_digests[path] = self.context_builder.digest(path, self.current_files[path])
+        return digest
 
     def _are_files_related(self, file1: str, file2: str) -> bool:
         """
         Two files are considered related if they are in the same directory
-        or if they have the same file extension.
+        and have the same file extension. Either one alone links nearly every
+        file of a project, which serializes generation and fills the context
+        with unrelated files; imports can't be used since they are only known
+        once the files are generated.
+        """
+        return (os.path.dirname(file1) == os.path.dirname(file2)
+                and os.path.splitext(file1)[1] == os.path.splitext(file2)[1])
+
+    def _build_dependency_graph(self, file_list: List[str]) -> Dict[str, List[str]]:
+        """
+        Maps every file to the earlier files in the list whose content ends up
+        in its context. Generating a file only after its dependencies gives the
+        same prompts as generating the whole list sequentially.
+        """
+        dependencies = {}
+        for index, file_path in enumerate(file_list):
+            dependencies[file_path] = [
+                earlier for earlier in dict.fromkeys(file_list[:index])
+                if earlier != file_path and self._are_files_related(file_path, earlier)
+            ]
+        return dependencies
+
+    def _is_small_file(self, file_path: str) -> bool:
+        """Whether a file is usually short enough to be generated along with others."""
+        return os.path.basename(file_path) in SMALL_FILE_NAMES
+
+    def _plan_batches(self, file_list: List[str]) -> List[List[str]]:
+        """
+        Groups the small files still to generate into batches of at most
+        batch_size files, in list order and of even sizes.
+        """
+        small_files = [path for path in file_list if path not in self.current_files and self._is_small_file(path)]
+        if self.batch_size < 2 or len(small_files) < 2:
+            return []
+        batch_count = -(-len(small_files) // self.batch_size)
+        size = -(-len(small_files) // batch_count)
+        return [small_files[index:index + size] for index in range(0, len(small_files), size)]
+
+    def _generate_files_parallel(self, file_list: List[str], user_request: str):
         """
-        if os.path.dirname(file1) == os.path.dirname(file2):
-            return True
-        if os.path.splitext(file1)[1] == os.path.splitext(file2)[1]:
-            return True
-        return False
+        Generates every file in file_list on a bounded thread pool.
+        Files are submitted in list order as soon as all of their dependencies
+        are done, so unrelated files are generated concurrently while the
+        context of each file stays identical to a sequential run.
+
+        Small files are generated in batches, one model call per batch. They
+        are left out of the context of the other files, so no file waits for
+        them, and each batch waits for every file related to its files instead,
+        earlier or later in the list.
+        """
+        file_list = list(dict.fromkeys(file_list))
+        position = {path: index for index, path in enumerate(file_list)}
+        batches = self._plan_batches(file_list)
+        self.batched_files = {path for batch in batches for path in batch}
+        dependencies = self._build_dependency_graph(file_list)
+
+        # A unit is what one call generates: a single file or a batch
+        unit_dependencies = {}
+        for batch in batches:
+            unit_dependencies[tuple(batch)] = [
+                path for path in file_list if path not in self.batched_files
+                and any(self._are_files_related(member, path) for member in batch)
+            ]
+        for path in file_list:
+            if path not in self.batched_files and path not in self.current_files:
+                unit_dependencies[(path,)] = [dep for dep in dependencies[path] if dep not in self.batched_files]
+        unit_position = {unit: position[unit[0]] for unit in unit_dependencies}
+        remaining = {unit: set(deps) for unit, deps in unit_dependencies.items()}
+        dependents = {path: [] for path in file_list}
+        for unit, deps in unit_dependencies.items():
+            for dep in deps:
+                dependents[dep].append(unit)
+
+        # Files restored from a checkpoint are already done
+        for path in file_list:
+            if path in self.current_files:
+                for dependent in dependents[path]:
+                    remaining[dependent].discard(path)
+
+        pending = sorted((unit for unit in unit_dependencies if not remaining[unit]), key=unit_position.get)
+        running = {}
+        self._abandoned.clear()
+        executor = self.executor or ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                while pending and len(running) < self.max_workers:
+                    unit = pending.pop(0)
+                    for file_path in unit:
+                        self._emit("file_started", file_path=file_path, index=position[file_path], total=len(file_list))
+                    # Run in a copy of this context so the job trace follows the file
+                    future = executor.submit(contextvars.copy_context().run,
+                                             self._generate_unit, unit, user_request, file_list)
+                    running[future] = unit
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                # Handle completions in list order to keep scheduling deterministic
+                for future in sorted(done, key=lambda f: unit_position[running[f]]):
+                    unit = running.pop(future)
+                    file_sizes = future.result()
+                    for file_path in unit:
+                        if self.checkpoint is not None:
+                            self.checkpoint.save_file(file_path, self.current_files[file_path])
+                        self._emit("file_done", file_path=file_path, index=position[file_path],
+                                   total=len(file_list), size=file_sizes[file_path])
+
+                        for dependent in dependents[file_path]:
+                            remaining[dependent].discard(file_path)
+                            if not remaining[dependent]:
+                                pending.append(dependent)
+                pending.sort(key=unit_position.get)
+        finally:
+            if running:
+                # A unit failed: drop the queued ones and stop the running ones before the
+                # caller cleans up the project, so none of them writes to it afterwards
+                self._abandoned.set()
+                for future in running:
+                    future.cancel()
+                wait(running)
+            if self.executor is None:
+                executor.shutdown(wait=True)
+            self.batched_files = set()
+
+    def _generate_unit(self, file_paths: Tuple[str, ...], user_request: str,
+                       directory_tree: List[str]) -> Dict[str, int]:
+        if len(file_paths) == 1:
+            return {file_paths[0]: self.generate_file(file_paths[0], user_request, directory_tree)}
+        return self.generate_batch(list(file_paths), user_request, directory_tree)
 
-    def generate_file(self, file_path: str, user_request: str, directory_tree: List[str]) -> str:
+    def generate_file(self, file_path: str, user_request: str, directory_tree: List[str]) -> int:
         """
         Generates the content for a specific file using the user request,
         the directory tree, and any already generated files.
+        The content is streamed into current_files as the model produces it,
+        with the markdown fences around it removed on the way.
+        Returns the size of the file in bytes.
         """
-        context = self._build_context(file_path, user_request, directory_tree)
-        prompt = (
-            f"Based on the following context:\n{context}\n\n"
-            f"Generate the clean content for the file \"{file_path}\". "
-            "Do not include any markdown formatting, code block tags, or additional explanations. "
-            "Output only the raw file content."
-        )
+        project_prompt = self._project_prompt(user_request, directory_tree)
+        candidates = self._context_candidates([file_path], directory_tree)
+        sections = self._context_sections(file_path, project_prompt, candidates)
+        if file_path in self.previous_files:
+            # The old version stays in place until the new one is committed
+            with open(os.path.join(self.output_dir, file_path), 'r', encoding='utf-8', errors='replace') as f:
+                sections.append(f"Current content of {file_path}, to be updated:\n{f.read()}")
+        prompt = project_prompt.file_prompt(file_path, sections)
 
-        if self.api_name == "gemini":
-            response = self.generative_model.generate_content(prompt)
-            content = response.text
-        elif self.api_name == "openai":
-            response = self.generative_model.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "You are a helpful code generator."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            content = response.choices[0].message.content
-        elif self.api_name == "mistral":
-            response = self.generative_model.chat.complete(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            content = response.choices[0].message.content
-        else:
-            raise ValueError("Unsupported API")
+        writer = self.current_files.open(file_path)
+        fences = FenceStripper()
+        response_length = 0
+        try:
+            with stage('file', file=file_path) as span:
+                for chunk in self.provider.stream(prompt, system=FILE_SYSTEM_PROMPT):
+                    if self._abandoned.is_set():
+                        raise GenerationAbandonedError(f"Generation of {file_path} abandoned")
+                    response_length += len(chunk)
+                    writer.write(fences.feed(chunk))
+                writer.write(fences.finish())
+                # Same estimate as estimate_tokens, without joining the response
+                span.update(prompt_tokens=estimate_tokens(prompt), response_tokens=(response_length + 3) // 4)
+            with stage('write', file=file_path, size=writer.size):
+                writer.commit()
+        except BaseException:
+            writer.discard()
+            raise
+        LLM_PROMPT_TOKENS.observe(span['prompt_tokens'], stage='file')
+        LLM_RESPONSE_TOKENS.observe(span['response_tokens'], stage='file')
+        FILE_BYTES.observe(writer.size)
+        return writer.size
+
+    def generate_batch(self, file_paths: List[str], user_request: str, directory_tree: List[str]) -> Dict[str, int]:
+        """
+        Generates several small files with a single model call, whose response
+        holds a delimited block per file. Files missing from the response, or
+        whose block is malformed, are generated by a call of their own.
+        Returns the size of each file in bytes.
+        """
+        project_prompt = self._project_prompt(user_request, directory_tree)
+        candidates = self._context_candidates(file_paths, directory_tree)
+        # Ranked for the first file only: small files mostly need the project layout
+        sections = self._context_sections(file_paths[0], project_prompt, candidates)
+        for file_path in file_paths:
+            if file_path in self.previous_files:
+                with open(os.path.join(self.output_dir, file_path), 'r', encoding='utf-8', errors='replace') as f:
+                    sections.append(f"Current content of {file_path}, to be updated:\n{f.read()}")
+        prompt = project_prompt.batch_prompt(file_paths, sections)
+
+        with stage('batch', files=len(file_paths)) as span:
+            response_text = "".join(self.provider.stream(prompt, system=FILE_SYSTEM_PROMPT))
+            span.update(prompt_tokens=estimate_tokens(prompt), response_tokens=estimate_tokens(response_text))
+        LLM_PROMPT_TOKENS.observe(span['prompt_tokens'], stage='batch')
+        LLM_RESPONSE_TOKENS.observe(span['response_tokens'], stage='batch')
+
+        if self._abandoned.is_set():
+            raise GenerationAbandonedError(f"Generation of {', '.join(file_paths)} abandoned")
+        blocks = split_file_blocks(response_text, file_paths)
+        file_sizes = {}
+        for file_path in file_paths:
+            if file_path in blocks:
+                with stage('write', file=file_path, size=len(blocks[file_path].encode('utf-8'))):
+                    self.current_files[file_path] = blocks[file_path]
+                file_sizes[file_path] = self.current_files.size(file_path)
+                FILE_BYTES.observe(file_sizes[file_path])
+        BATCHED_FILES.inc(len(file_sizes), result='batched')
 
-        # Remove any markdown formatting (e.g., ``` markers)
-        content = content.strip()
-        content = re.sub(r'```[\w\s]*\n', '', content)
-        content = re.sub(r'```', '', content)
-        return content
+        missing = [file_path for file_path in file_paths if file_path not in file_sizes]
+        if missing:
+            logger.warning("Batch response is missing %s, generating them one by one", ", ".join(missing))
+            BATCHED_FILES.inc(len(missing), result='fallback')
+            for file_path in missing:
+                file_sizes[file_path] = self.generate_file(file_path, user_request, directory_tree)
+        return file_sizes
 
-    def generate_project(self, user_request: str) -> Tuple[str, str]:
+    def _claim_output_dir(self, repo_name: str) -> str:
         """
-        Generates an entire project iteratively.
+        Creates the output directory of the project and returns the repository
+        name, with a timestamp suffix when the directory is already taken.
+        The directory is claimed atomically since concurrent projects may share a title.
+        """
+        os.makedirs(os.path.join('data', 'projects'), exist_ok=True)
+        base_name = repo_name
+        attempt = 0
+        while True:
+            self.output_dir = os.path.join('data', 'projects', repo_name)
+            try:
+                os.mkdir(self.output_dir)
+                return repo_name
+            except FileExistsError:
+                attempt += 1
+                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+                repo_name = f"{base_name}-{timestamp}" if attempt == 1 else f"{base_name}-{timestamp}-{attempt}"
+
+    def generate_project(self, user_request: str) -> Tuple[Optional[str], str]:
+        """
+        Generates an entire project.
           1. Generate the directory tree (JSON) based on the user request.
-          2. For each file in the tree:
-             - Generate the file content using the user request, the directory tree, and previously generated files.
+          2. For each file in the tree, in parallel where possible:
+             - Generate the file content using the user request, the directory tree, and related files generated before it.
              - Save the file in the output directory.
+             Small boilerplate files are generated several per call, after the files related to them.
           3. If README.md was not generated, create it.
-        Returns the output directory and the repository name.
-        """
-        # Step 1: Get the directory tree and repository title.
-        file_list, title_tag = self.get_directory_tree(user_request)
-        title_match = re.search(r'<title>(.*?)</title>', title_tag)
-        repo_title = title_match.group(1) if title_match else "AI Generated Project"
-        repo_name = re.sub(r'[^\w\s-]', '', repo_title).strip().lower().replace(' ', '-')
-
-        self.output_dir = os.path.join('data', 'projects', repo_name)
-        if os.path.exists(self.output_dir):
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            repo_name = f"{repo_name}-{timestamp}"
-            self.output_dir = os.path.join('data', 'projects', repo_name)
-        os.makedirs(self.output_dir, exist_ok=True)
+        With a checkpoint, the tree and the files it already holds are restored
+        instead of generated again.
+        Returns the output directory and the repository name. The output directory
+        is None when the generator keeps the files in memory.
+        """
+        # Step 1: Get the directory tree and repository title, unless a checkpoint has them.
+        checkpoint = self.checkpoint
+        if checkpoint is not None and checkpoint.has_tree:
+            file_list, repo_title, repo_name = checkpoint.file_list, checkpoint.title, checkpoint.repo_name
+        else:
+            file_list, title_tag = self.get_directory_tree(user_request)
+            title_match = re.search(r'<title>(.*?)</title>', title_tag)
+            repo_title = title_match.group(1) if title_match else "AI Generated Project"
+            repo_name = re.sub(r'[^\w\s-]', '', repo_title).strip().lower().replace(' ', '-')
+
+        if not self.keep_in_memory:
+            repo_name = self._claim_output_dir(repo_name)
+            self.current_files = GeneratedFiles(self.output_dir)
+        if checkpoint is not None and (not checkpoint.has_tree or checkpoint.repo_name != repo_name):
+            checkpoint.save_tree(file_list, repo_title, repo_name)
+        self._emit("tree_ready", files=file_list, repo_name=repo_name, title=repo_title)
 
-        # Step 2: Iteratively generate each file.
-        for file_path in file_list:
-            full_path = os.path.join(self.output_dir, file_path)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            file_content = self.generate_file(file_path, user_request, file_list)
-            self.current_files[file_path] = file_content
-            with open(full_path, 'w', encoding='utf-8') as f:
-                f.write(file_content)
+        if checkpoint is not None:
+            for index, file_path in enumerate(file_list):
+                if file_path in checkpoint.files:
+                    self.current_files[file_path] = checkpoint.files[file_path]
+                    self._emit("file_done", file_path=file_path, index=index, total=len(file_list),
+                               size=self.current_files.size(file_path), resumed=True)
+
+        # Step 2: Generate the files, running independent ones concurrently.
+        self._generate_files_parallel(file_list, user_request)
 
         # Step 3: Generate a README.md if not already provided.
+        if "README.md" not in self.current_files and checkpoint is not None and "README.md" in checkpoint.files:
+            self.current_files["README.md"] = checkpoint.files["README.md"]
         if "README.md" not in self.current_files:
-            readme_content = self.generate_file("README.md", f"Create a README.md for the project: {repo_title}", file_list)
-            self.current_files["README.md"] = readme_content
-            with open(os.path.join(self.output_dir, "README.md"), 'w', encoding='utf-8') as f:
-                f.write(readme_content)
+            self._emit("file_started", file_path="README.md", index=len(file_list), total=len(file_list) + 1)
+            readme_size = self.generate_file("README.md", f"Create a README.md for the project: {repo_title}", file_list)
+            if checkpoint is not None:
+                checkpoint.save_file("README.md", self.current_files["README.md"])
+            self._emit("file_done", file_path="README.md", index=len(file_list), total=len(file_list) + 1,
+                       size=readme_size)
 
         return self.output_dir, repo_name
+
+    def plan_update(self, user_request: str, file_list: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        Asks the AI model which files of an existing project a change request
+        affects. The expected JSON format is:
+        {
+          "files": ["changed.ext", "new/file.ext"],
+          "delete": ["removed.ext"]
+        }
+        Returns the files to create or rewrite and the existing files to delete.
+        """
+        update_prompt = (
+            f"An existing project contains these files: {json.dumps(file_list)}\n"
+            f"Change request: \"{user_request}\"\n"
+            "Generate a JSON response containing two keys: \"files\" and \"delete\".\n"
+            "- \"files\" should list the paths of the files to create or rewrite for this change.\n"
+            "- \"delete\" should list the paths of existing files to remove, usually none.\n"
+            "List only the files the change requires.\n\n"
+            "Include ONLY the JSON, no explanations or other text."
+        )
+
+        extractor = JSONObjectExtractor(required_keys=("files",))
+        with stage('plan') as span:
+            response_text = "".join(self.provider.stream(
+                update_prompt, system="You are a helpful code generator assistant."
+            ))
+            span.update(prompt_tokens=estimate_tokens(update_prompt), response_tokens=estimate_tokens(response_text))
+        LLM_PROMPT_TOKENS.observe(span['prompt_tokens'], stage='plan')
+        LLM_RESPONSE_TOKENS.observe(span['response_tokens'], stage='plan')
+
+        extractor.feed(response_text)
+        response_json = extractor.finish()
+        if response_json is None:
+            raise ValueError("Failed to process update plan response: no JSON object with a \"files\" key found")
+
+        def paths(key):
+            value = response_json.get(key) or []
+            if not isinstance(value, list):
+                raise ValueError(f"Update plan '{key}' is not a valid list")
+            # Only relative paths inside the project, never its .git directory
+            normalized = [os.path.normpath(path.strip().lstrip('/')) for path in value if isinstance(path, str)]
+            return list(dict.fromkeys(
+                path for path in normalized
+                if path not in ('', '.') and not path.startswith('..') and path.split(os.sep)[0] != '.git'
+            ))
+
+        targets = paths("files")
+        existing = set(file_list) - set(targets)
+        return targets, [path for path in paths("delete") if path in existing]
+
+    def update_project(self, user_request: str, project_dir: str, file_list: List[str],
+                       repo_name: str) -> Tuple[List[str], List[str]]:
+        """
+        Applies a change request to an existing project checked out in
+        project_dir. Only the files the change affects are generated, with
+        the rest of the project as their context and the old version of each
+        rewritten file in its prompt.
+        Returns the files created or rewritten and the files deleted.
+        """
+        self.output_dir = project_dir
+        self.current_files = GeneratedFiles(project_dir)
+
+        # A symbolic link in the repository may point outside the checkout: such
+        # paths are never read into a prompt, written or deleted
+        root = os.path.realpath(project_dir)
+
+        def inside_project(path):
+            return os.path.commonpath([root, os.path.realpath(os.path.join(root, path))]) == root
+
+        unsafe = [path for path in file_list if not inside_project(path)]
+        if unsafe:
+            logger.warning("Ignoring files linked outside the project: %s", ", ".join(unsafe))
+        file_list = [path for path in file_list if path not in unsafe]
+
+        targets, deleted = self.plan_update(user_request, file_list)
+        targets = [path for path in targets if inside_project(path)]
+        for path in deleted:
+            os.remove(os.path.join(project_dir, path))
+        directory_tree = [path for path in file_list if path not in deleted]
+        directory_tree += [path for path in targets if path not in file_list]
+        self._emit("tree_ready", files=targets, repo_name=repo_name, title=repo_name)
+
+        # Every file that is not regenerated counts as done, read from disk on demand
+        target_set = set(targets)
+        for path in directory_tree:
+            if path not in target_set:
+                self.current_files.track(path)
+        self.previous_files = target_set & set(file_list)
+
+        self._generate_files_parallel(directory_tree, user_request)
+        return targets, deleted
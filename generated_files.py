@@ -0,0 +1,148 @@
+# generated_files.py
+import os
+import threading
+from collections.abc import Mapping
+from typing import Iterable, Iterator, Optional
+
+
+class GeneratedFiles(Mapping):
+    """
+    The files generated for a project, keyed by their path in the project.
+
+    With a root directory each file is streamed to disk as it is generated
+    and only its path and size are kept; reading a file loads it from disk on
+    demand. Without a root the files are held in memory, for the build modes
+    that never write the project to disk.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root
+        self._sizes = {}  # path -> size in bytes, in completion order
+        self._contents = {}  # path -> content, only without a root
+        self._lock = threading.Lock()
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.root, path)
+
+    def __getitem__(self, path: str) -> str:
+        with self._lock:
+            if path not in self._sizes:
+                raise KeyError(path)
+            if self.root is None:
+                return self._contents[path]
+        # Files of an existing repository may not be text
+        with open(self._full_path(path), 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+    def __contains__(self, path) -> bool:
+        with self._lock:
+            return path in self._sizes
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._sizes))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sizes)
+
+    def __setitem__(self, path: str, content: str):
+        writer = self.open(path)
+        try:
+            writer.write(content)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.commit()
+
+    def track(self, path: str):
+        """Records a file that is already in the root directory."""
+        self._add(path, os.path.getsize(self._full_path(path)), None)
+
+    def size(self, path: str) -> int:
+        """Returns the size of a file in bytes."""
+        with self._lock:
+            return self._sizes[path]
+
+    def subset(self, paths: Iterable[str]) -> 'FileSubset':
+        """Returns a read-only view of the given files, read on demand."""
+        return FileSubset(self, [path for path in paths if path in self])
+
+    def open(self, path: str) -> 'FileWriter':
+        """Returns a writer the content of path is streamed to."""
+        return FileWriter(self, path)
+
+    def _add(self, path: str, size: int, content: Optional[str]):
+        with self._lock:
+            self._sizes.pop(path, None)
+            self._sizes[path] = size
+            if content is not None:
+                self._contents[path] = content
+
+
+class FileSubset(Mapping):
+    """Read-only view of some of the generated files, in the given order."""
+
+    def __init__(self, files: GeneratedFiles, paths: Iterable[str]):
+        self.files = files
+        self.paths = list(paths)
+
+    def __getitem__(self, path: str) -> str:
+        if path not in self.paths:
+            raise KeyError(path)
+        return self.files[path]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+
+class FileWriter:
+    """
+    Streams the content of one file. On disk it is written to a temporary
+    file next to the target and renamed on commit, so a partially generated
+    file never takes the place of a complete one.
+    """
+
+    def __init__(self, files: GeneratedFiles, path: str):
+        self.files = files
+        self.path = path
+        self.size = 0
+        self._chunks = [] if files.root is None else None
+        self._file = None
+        if files.root is not None:
+            full_path = files._full_path(path)
+            os.makedirs(os.path.dirname(full_path) or '.', exist_ok=True)
+            self._temp_path = f"{full_path}.part"
+            self._file = open(self._temp_path, 'w', encoding='utf-8')
+
+    def write(self, text: str):
+        if not text:
+            return
+        self.size += len(text.encode('utf-8'))
+        if self._file is not None:
+            self._file.write(text)
+        else:
+            self._chunks.append(text)
+
+    def commit(self):
+        """Completes the file and makes it visible in the generated files."""
+        if self._file is not None:
+            self._file.close()
+            os.replace(self._temp_path, self.files._full_path(self.path))
+            self.files._add(self.path, self.size, None)
+        else:
+            self.files._add(self.path, self.size, "".join(self._chunks))
+            self._chunks = None
+
+    def discard(self):
+        """Drops a file that failed to generate."""
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self._temp_path)
+            except FileNotFoundError:
+                pass
+        self._chunks = None
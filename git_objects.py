@@ -0,0 +1,95 @@
+# git_objects.py
+import posixpath
+import tempfile
+import time
+from io import BytesIO
+from typing import Dict, Iterable, Optional, Union
+
+import git
+from gitdb import IStream
+from gitdb.typ import str_blob_type, str_commit_type, str_tree_type
+
+FILE_MODE = b'100644'
+DIRECTORY_MODE = b'40000'
+
+
+def _normalize_path(path: str) -> str:
+    normalized = posixpath.normpath(path.replace('\\', '/')).lstrip('/')
+    if normalized in ('', '.') or normalized.startswith('../') or normalized == '..':
+        raise ValueError(f"Invalid file path: {path}")
+    return normalized
+
+
+def build_commit(repo: git.Repo, files: Dict[str, Union[str, bytes]], message: str,
+                 author_name: str, author_email: str, parents: Iterable[str] = ()) -> str:
+    """
+    Writes the blobs, trees and commit for a set of files straight into the
+    object database of repo, without a working tree or index.
+
+    Args:
+        repo: Repository whose object database receives the objects
+        files: File contents keyed by their path in the repository
+        message: Commit message
+        author_name: Name used as author and committer
+        author_email: Email used as author and committer
+        parents: Hex SHAs of the parent commits
+
+    Returns:
+        str: Hex SHA of the new commit
+    """
+    def store(object_type: bytes, data: bytes) -> bytes:
+        return repo.odb.store(IStream(object_type, len(data), BytesIO(data))).binsha
+
+    # Nest the flat path mapping into directories
+    root = {}
+    for path, content in files.items():
+        parts = _normalize_path(path).split('/')
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if not isinstance(node, dict):
+                raise ValueError(f"{path} is inside a path that is also a file")
+        if isinstance(node.get(parts[-1]), dict):
+            raise ValueError(f"{path} is both a file and a directory")
+        node[parts[-1]] = content.encode('utf-8') if isinstance(content, str) else content
+
+    def write_tree(node: dict) -> bytes:
+        entries = []
+        for name, value in node.items():
+            encoded_name = name.encode('utf-8')
+            if isinstance(value, dict):
+                # Git sorts directories as if their name ended with a slash
+                entries.append((encoded_name + b'/', DIRECTORY_MODE, encoded_name, write_tree(value)))
+            else:
+                entries.append((encoded_name, FILE_MODE, encoded_name, store(str_blob_type, value)))
+        entries.sort(key=lambda entry: entry[0])
+        data = b''.join(mode + b' ' + name + b'\0' + binsha for _, mode, name, binsha in entries)
+        return store(str_tree_type, data)
+
+    tree_sha = write_tree(root).hex()
+    signature = f"{author_name} <{author_email}> {int(time.time())} +0000"
+    lines = [f"tree {tree_sha}"]
+    lines.extend(f"parent {parent}" for parent in parents)
+    lines.append(f"author {signature}")
+    lines.append(f"committer {signature}")
+    commit_data = ("\n".join(lines) + "\n\n" + message + "\n").encode('utf-8')
+    return store(str_commit_type, commit_data).hex()
+
+
+def push_files(files: Dict[str, Union[str, bytes]], remote_url: str, branch: str, message: str,
+               author_name: str, author_email: str, scratch_dir: Optional[str] = None) -> str:
+    """
+    Builds a single commit holding files and pushes it as branch of remote_url.
+
+    The objects are written to a scratch bare repository, so the only git
+    subprocesses are the init and the push. remote_url can be any git URL,
+    including the path of a local bare repository.
+
+    Returns:
+        str: Hex SHA of the pushed commit
+    """
+    with tempfile.TemporaryDirectory(prefix='git-objects-', dir=scratch_dir) as tmp_dir:
+        repo = git.Repo.init(tmp_dir, bare=True)
+        commit_sha = build_commit(repo, files, message, author_name, author_email)
+        repo.git.push(remote_url, f"{commit_sha}:refs/heads/{branch}")
+        return commit_sha
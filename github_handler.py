@@ -1,11 +1,18 @@
 # github_handler.py
-from github import Github
+from github import Auth, Github, InputGitTreeElement
 import os
 import git
 import shutil
+import functools
+import threading
+import time
 from pathlib import Path
 import logging
 from datetime import datetime
+from typing import Dict, List, Mapping, Optional
+from git_objects import push_files
+from mirror_cache import DEFAULT_MAX_MIRRORS, DEFAULT_MIRROR_DIR, MirrorCache
+from metrics import GITHUB_RATE_LIMIT_LIMIT, GITHUB_RATE_LIMIT_REMAINING, GITHUB_RATE_LIMIT_RESET, stage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -39,15 +46,188 @@ This application was created using the AI Code Generator.
 For more information and updates, visit: https://codegen.esavibes.com
 """
 
+GITIGNORE_TEXT = """__pycache__/
+*.py[cod]
+*$py.class
+.env
+.venv
+env/
+venv/
+ENV/
+*.sqlite
+.DS_Store
+"""
+
+INITIAL_COMMIT_MESSAGE = "Initial commit: AI generated project"
+UPDATE_COMMIT_MESSAGE = "Update: AI generated changes"
+
+class RateLimitExceeded(Exception):
+    """Raised when a GitHub call would have to wait too long for the rate limit to reset."""
+
+
+class RateLimitScheduler:
+    """
+    Tracks the GitHub API rate limit from the X-RateLimit-* response headers
+    and holds back calls once fewer than `reserve` requests remain, until the
+    limit resets. Calls that would wait longer than max_wait seconds are
+    rejected instead.
+    """
+
+    def __init__(self, reserve: int = 50, max_wait: float = 900):
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.calls = 0
+        self.throttled_calls = 0
+        self.rejected_calls = 0
+        self.wait_seconds = 0.0
+        self._condition = threading.Condition()
+
+    def update(self, remaining: int, limit: int, reset_at: float):
+        """Records the rate limit reported by the last GitHub response."""
+        with self._condition:
+            self.remaining = remaining
+            self.limit = limit
+            self.reset_at = reset_at
+            self._condition.notify_all()
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Records the rate limit from the headers of a GitHub API response."""
+        try:
+            self.update(
+                int(headers['X-RateLimit-Remaining']),
+                int(headers['X-RateLimit-Limit']),
+                float(headers['X-RateLimit-Reset'])
+            )
+        except (KeyError, TypeError, ValueError):
+            pass
+
+    def acquire(self, cost: int = 1):
+        """
+        Waits until `cost` requests can be made without dipping into the reserve.
+
+        Raises:
+            RateLimitExceeded: If the limit resets later than max_wait seconds from now
+        """
+        with self._condition:
+            self.calls += 1
+            throttled = False
+            while self.remaining is not None and self.remaining - cost < self.reserve:
+                wait = self.reset_at - time.time() + 1 if self.reset_at else 0
+                if wait <= 0:
+                    # The window has reset; the next response reports the new limit
+                    self.remaining = None
+                    break
+                if wait > self.max_wait:
+                    self.rejected_calls += 1
+                    raise RateLimitExceeded(f"GitHub rate limit exhausted, resets in {int(wait)} seconds")
+                if not throttled:
+                    throttled = True
+                    self.throttled_calls += 1
+                    logger.warning(f"GitHub rate limit low ({self.remaining} left), waiting {int(wait)} seconds")
+                started = time.time()
+                self._condition.wait(wait)
+                self.wait_seconds += time.time() - started
+            if self.remaining is not None:
+                # Count the call now so concurrent callers don't overshoot before headers arrive
+                self.remaining -= cost
+
+    def collect_gauges(self):
+        """Copies the last reported rate limit to the github_rate_limit_* gauges."""
+        with self._condition:
+            values = ((GITHUB_RATE_LIMIT_REMAINING, self.remaining), (GITHUB_RATE_LIMIT_LIMIT, self.limit),
+                      (GITHUB_RATE_LIMIT_RESET, self.reset_at))
+        for gauge, value in values:
+            # Unknown until the first GitHub response
+            if value is not None:
+                gauge.set(value)
+
+    def metrics(self) -> dict:
+        """Returns the current rate limit state and throttling counters."""
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'remaining': self.remaining,
+                'reset_at': self.reset_at,
+                'reserve': self.reserve,
+                'calls': self.calls,
+                'throttled_calls': self.throttled_calls,
+                'rejected_calls': self.rejected_calls,
+                'wait_seconds': round(self.wait_seconds, 3)
+            }
+
+
+# Shared by every GitHub API client of the process
+rate_limiter = RateLimitScheduler(
+    reserve=int(os.getenv('GITHUB_RATE_LIMIT_RESERVE', '50')),
+    max_wait=float(os.getenv('GITHUB_RATE_LIMIT_MAX_WAIT', '900'))
+)
+for gauge in (GITHUB_RATE_LIMIT_REMAINING, GITHUB_RATE_LIMIT_LIMIT, GITHUB_RATE_LIMIT_RESET):
+    gauge.set_collector(rate_limiter.collect_gauges)
+
+
+def rate_limited(cost: int = 1):
+    """
+    Decorates a GitHubHandler method so it waits for the rate limiter before
+    running and records the rate limit reported by GitHub afterwards.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            self.rate_limiter.acquire(cost)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._record_rate_limit()
+        return wrapper
+    return decorator
+
+
 class GitHubHandler:
-    def __init__(self):
+    def __init__(self, pool_size: Optional[int] = None, scheduler: Optional[RateLimitScheduler] = None,
+                 api_url: Optional[str] = None, git_url: Optional[str] = None,
+                 mirror_cache: Optional[MirrorCache] = None):
         self.token = os.getenv('GITHUB_TOKEN')
         self.username = os.getenv('GITHUB_USERNAME')
         if not self.token or not self.username:
             raise ValueError("GitHub token and username must be set in environment variables")
-        self.github = Github(self.token)
+        # Overridable so the handler can run against a GitHub Enterprise server or a local stand-in
+        self.api_url = (api_url or os.getenv('GITHUB_API_URL', 'https://api.github.com')).rstrip('/')
+        self.git_url = (git_url or os.getenv('GITHUB_GIT_URL', 'https://github.com')).rstrip('/')
+        self.github = Github(
+            auth=Auth.Token(self.token),
+            base_url=self.api_url,
+            pool_size=pool_size or int(os.getenv('GITHUB_POOL_SIZE', '10'))
+        )
+        # Lazy: no request is made until the user object is used
         self.user = self.github.get_user()
-
+        self.rate_limiter = scheduler or rate_limiter
+        # Updates check repositories out from local mirrors, unless GIT_MIRROR_DIR is empty
+        mirror_dir = os.getenv('GIT_MIRROR_DIR', DEFAULT_MIRROR_DIR)
+        if mirror_cache is None and mirror_dir:
+            mirror_cache = MirrorCache(mirror_dir, int(os.getenv('GIT_MIRROR_MAX_REPOS', str(DEFAULT_MAX_MIRRORS))))
+        self.mirror_cache = mirror_cache
+
+    def _remote_url(self, repo_name: str) -> str:
+        """Returns the git URL of a repository, with the token for HTTP remotes."""
+        scheme, _, host = self.git_url.partition('://')
+        if scheme in ('http', 'https'):
+            return f'{scheme}://{self.token}@{host}/{self.username}/{repo_name}.git'
+        return f'{self.git_url}/{self.username}/{repo_name}.git'
+
+    def _record_rate_limit(self):
+        """Passes the rate limit from the last response to the scheduler, if one was made."""
+        try:
+            requester = self.github.requester
+            remaining, limit = requester.rate_limiting
+            if limit >= 0 and requester.rate_limiting_resettime:
+                self.rate_limiter.update(remaining, limit, requester.rate_limiting_resettime)
+        except Exception:
+            pass
+
+    @rate_limited(cost=2)
     def create_repository(self, repo_name: str, project_path: str) -> str:
         """
         Creates a new GitHub repository and pushes local files.
@@ -62,12 +242,13 @@ class GitHubHandler:
         try:
             # Create the repository on GitHub
             logger.info(f"Creating repository: {repo_name}")
-            repo = self.user.create_repo(
-                name=repo_name,
-                description="Generated by AI App Generator",
-                private=False,
-                auto_init=False
-            )
+            with stage('create_repo', repo=repo_name):
+                repo = self.user.create_repo(
+                    name=repo_name,
+                    description="Generated by AI App Generator",
+                    private=False,
+                    auto_init=False
+                )
 
             # Initialize local git repository
             logger.info("Initializing local git repository")
@@ -76,20 +257,8 @@ class GitHubHandler:
 
             # Create .gitignore
             logger.info("Creating .gitignore")
-            gitignore_content = """
-            __pycache__/
-            *.py[cod]
-            *$py.class
-            .env
-            .venv
-            env/
-            venv/
-            ENV/
-            *.sqlite
-            .DS_Store
-            """
             with open(repo_dir / '.gitignore', 'w') as f:
-                f.write(gitignore_content.strip())
+                f.write(GITIGNORE_TEXT)
 
             # Create MIT License file if it doesn't exist
             license_path = repo_dir / "LICENSE"
@@ -114,17 +283,20 @@ class GitHubHandler:
 
             # Add all files and create initial commit
             logger.info("Creating initial commit")
-            git_repo.git.add(A=True)
-            git_repo.index.commit("Initial commit: AI generated project")
+            with stage('git_add', repo=repo_name):
+                git_repo.git.add(A=True)
+            with stage('git_commit', repo=repo_name):
+                git_repo.index.commit(INITIAL_COMMIT_MESSAGE)
 
             # Add remote and push
             logger.info("Pushing to GitHub")
             origin = git_repo.create_remote(
                 'origin',
-                f'https://{self.token}@github.com/{self.username}/{repo_name}.git'
+                self._remote_url(repo_name)
             )
 
-            origin.push('master')
+            with stage('git_push', repo=repo_name):
+                origin.push('master')
 
             # Clean up: remove .git directory to prevent conflicts with future generations
             logger.info("Cleaning up git directory")
@@ -142,27 +314,124 @@ class GitHubHandler:
                 pass
             raise
 
-    def update_repository(self, repo_name: str, project_path: str) -> bool:
+    def _prepare_files(self, repo_name: str, files: Dict[str, str]) -> Dict[str, str]:
         """
-        Updates an existing repository with new files.
+        Returns a copy of files with the .gitignore, LICENSE and README.md
+        additions that create_repository writes to disk.
+        """
+        prepared = dict(files)
+        prepared['.gitignore'] = GITIGNORE_TEXT
+        if 'LICENSE' not in prepared:
+            prepared['LICENSE'] = MIT_LICENSE_TEXT.format(year=datetime.now().year, fullname=self.username)
+        if 'README.md' in prepared:
+            prepared['README.md'] = prepared['README.md'] + "\n" + CREATION_INFO_TEXT
+        else:
+            prepared['README.md'] = f"# {repo_name}\n\nThis project was generated by the AI Code Generator.\n{CREATION_INFO_TEXT}"
+        return prepared
+
+    @rate_limited(cost=5)
+    def create_repository_from_files(self, repo_name: str, files: Dict[str, str], use_api: bool = False) -> str:
+        """
+        Creates a new GitHub repository from files held in memory.
+
+        Nothing is written to a project directory. With use_api the commit is
+        created through the Git Data API with the file contents inlined in a
+        single tree request; otherwise the git objects are built directly and
+        pushed in one git push.
+
+        Args:
+            repo_name: Name for the new repository
+            files: File contents keyed by their path in the repository
+            use_api: Create the commit through the GitHub API instead of git push
+
+        Returns:
+            str: URL of the created repository
+        """
+        try:
+            logger.info(f"Creating repository: {repo_name}")
+            with stage('create_repo', repo=repo_name):
+                repo = self.user.create_repo(
+                    name=repo_name,
+                    description="Generated by AI App Generator",
+                    private=False,
+                    # The Git Data API cannot write to an empty repository
+                    auto_init=use_api
+                )
+            prepared = self._prepare_files(repo_name, files)
+
+            if use_api:
+                logger.info("Creating initial commit through the Git Data API")
+                with stage('api_commit', repo=repo_name, files=len(prepared)):
+                    tree = repo.create_git_tree([
+                        InputGitTreeElement(path, '100644', 'blob', content=content)
+                        for path, content in sorted(prepared.items())
+                    ])
+                    commit = repo.create_git_commit(INITIAL_COMMIT_MESSAGE, tree, [])
+                    repo.get_git_ref(f"heads/{repo.default_branch}").edit(commit.sha, force=True)
+            else:
+                logger.info("Pushing to GitHub")
+                with stage('git_push', repo=repo_name, files=len(prepared)):
+                    push_files(
+                        prepared,
+                        self._remote_url(repo_name),
+                        'master',
+                        INITIAL_COMMIT_MESSAGE,
+                        author_name=self.username,
+                        author_email=f"{self.username}@users.noreply.github.com"
+                    )
+
+            return repo.html_url
+
+        except Exception as e:
+            logger.error(f"Error creating repository: {str(e)}")
+            # If repository was created but later steps failed, attempt to delete it
+            try:
+                repo = self.github.get_repo(f"{self.username}/{repo_name}")
+                repo.delete()
+            except:
+                pass
+            raise
+
+    def clone_repository(self, repo_name: str, project_path: str) -> List[str]:
+        """
+        Checks out the latest commit of an existing repository, without its
+        history. With a mirror cache only the objects added since the last
+        checkout of the repository are fetched.
+
+        Args:
+            repo_name: Name of the existing repository
+            project_path: Empty or missing directory to check the repository out into
+
+        Returns:
+            list: Paths of the files in the repository
+        """
+        logger.info(f"Cloning repository: {repo_name}")
+        with stage('git_clone', repo=repo_name, mirror=self.mirror_cache is not None):
+            if self.mirror_cache is not None:
+                git_repo = self.mirror_cache.checkout(
+                    f"{self.username}/{repo_name}", self._remote_url(repo_name), project_path
+                )
+            else:
+                git_repo = git.Repo.clone_from(self._remote_url(repo_name), project_path, depth=1, single_branch=True)
+        return git_repo.git.ls_files('-z').split('\0')[:-1] if git_repo.head.is_valid() else []
+
+    def update_repository(self, repo_name: str, project_path: str,
+                          message: str = UPDATE_COMMIT_MESSAGE) -> bool:
+        """
+        Commits the changes made in a checkout from clone_repository and
+        pushes them. Nothing is pushed when no file changed.
 
         Args:
             repo_name: Name of the existing repository
-            project_path: Path to the directory containing the new files
+            project_path: Path of the checkout holding the changed files
+            message: Commit message
 
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            repo = self.github.get_repo(f"{self.username}/{repo_name}")
             repo_dir = Path(project_path)
 
-            # Clone existing repository
-            git.Repo.clone_from(
-                f'https://{self.token}@github.com/{self.username}/{repo_name}.git',
-                repo_dir
-            )
-
             # Update LICENSE file if missing
             license_path = repo_dir / "LICENSE"
             if not license_path.exists():
@@ -171,32 +440,22 @@ class GitHubHandler:
                 with open(license_path, 'w') as f:
                     f.write(license_content)
 
-            # Update README.md with appended creation info
-            readme_path = repo_dir / "README.md"
-            if readme_path.exists():
-                with open(readme_path, 'a') as f:
-                    f.write("\n" + CREATION_INFO_TEXT)
-            else:
-                readme_content = f"# {repo_name}\n\nThis project was generated by the AI Code Generator.\n{CREATION_INFO_TEXT}"
-                with open(readme_path, 'w') as f:
-                    f.write(readme_content)
-
-            # Add new files
             git_repo = git.Repo(repo_dir)
-            git_repo.git.add(A=True)
+            with stage('git_add', repo=repo_name):
+                git_repo.git.add(A=True)
 
             if git_repo.index.diff('HEAD'):
-                git_repo.index.commit("Update: AI generated changes")
-                origin = git_repo.remote('origin')
-                origin.push()
-
-            shutil.rmtree(repo_dir / '.git')
+                with stage('git_commit', repo=repo_name):
+                    git_repo.index.commit(message)
+                with stage('git_push', repo=repo_name):
+                    git_repo.remote('origin').push().raise_if_error()
             return True
 
         except Exception as e:
             logger.error(f"Error updating repository: {str(e)}")
             return False
 
+    @rate_limited(cost=2)
     def delete_repository(self, repo_name: str) -> bool:
         """
         Deletes a repository.
@@ -215,6 +474,7 @@ class GitHubHandler:
             logger.error(f"Error deleting repository: {str(e)}")
             return False
 
+    @rate_limited(cost=1)
     def get_repository_info(self, repo_name: str) -> dict:
         """
         Gets information about a repository.
@@ -226,11 +486,16 @@ class GitHubHandler:
             dict: Repository information including URL, stars, etc.
         """
         try:
-            repo = self.github.get_repo(f"{self.username}/{repo_name}")
+            with stage('repo_info', repo=repo_name):
+                repo = self.github.get_repo(f"{self.username}/{repo_name}")
             return {
+                'id': repo.id,
                 'name': repo.name,
+                'full_name': repo.full_name,
                 'url': repo.html_url,
                 'stars': repo.stargazers_count,
+                'forks': repo.forks_count,
+                'language': repo.language,
                 'description': repo.description,
                 'created_at': repo.created_at,
                 'updated_at': repo.updated_at
@@ -239,6 +504,7 @@ class GitHubHandler:
             logger.error(f"Error getting repository info: {str(e)}")
             return None
 
+    @rate_limited(cost=2)
     def get_all_repositories(self, page=1, per_page=6, sort='created', direction='desc'):
         """
         Fetches all repositories for the authenticated user with pagination.
@@ -295,3 +561,20 @@ class GitHubHandler:
         except Exception as e:
             logger.error(f"Error fetching repositories: {str(e)}")
             return None
+
+
+_shared_handler = None
+_shared_handler_lock = threading.Lock()
+
+def get_github_handler() -> GitHubHandler:
+    """
+    Returns the GitHubHandler shared by the whole process, creating it on
+    first use, so requests reuse one client, its connection pool and the
+    authenticated user object.
+    """
+    global _shared_handler
+    if _shared_handler is None:
+        with _shared_handler_lock:
+            if _shared_handler is None:
+                _shared_handler = GitHubHandler()
+    return _shared_handler
@@ -0,0 +1,41 @@
+# gunicorn.conf.py
+# Production server settings, used as: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Threaded workers: job progress streams (/jobs/<id>/events) hold a thread
+# each for as long as a generation runs, and generations themselves run on
+# the job queue threads of each worker, not on request threads.
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# Seconds a worker may stay silent before it is restarted. Threaded workers
+# keep reporting while requests run, so this does not cap long streams.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# Seconds a stopping worker gets to finish its requests and running jobs
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '300'))
+# Seconds of graceful_timeout kept back after the running jobs are given up,
+# so the worker can log and mark them failed before the master kills it
+SHUTDOWN_MARGIN = min(10, graceful_timeout / 10)
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# The app is imported once in the master and forked; every client, pool and
+# background thread is created per worker by app.init_services
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    from app import init_services
+    init_services()
+
+
+def worker_exit(server, worker):
+    from app import shutdown_services
+    shutdown_services(timeout=max(0, graceful_timeout - SHUTDOWN_MARGIN))
@@ -0,0 +1,778 @@
+# job_queue.py
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import JOB_ADMISSION_REJECTIONS, JOB_QUEUE_DEPTH, JOBS_TOTAL, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('data', 'jobs.sqlite3')
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+# Duration assumed for a job until some have completed, for wait estimates
+DEFAULT_JOB_SECONDS = 120
+# Completed jobs whose mean duration estimates the wait of a new job
+JOB_DURATION_SAMPLE = 20
+# Seconds a running job stays claimed without a heartbeat from its process
+DEFAULT_LEASE_SECONDS = 60
+# Finished jobs and their events are deleted after this many seconds
+DEFAULT_JOB_TTL = 7 * 24 * 60 * 60
+# Seconds between two purges of the finished jobs by a process
+PURGE_INTERVAL = 60 * 60
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its in-flight limit."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, reason: str = 'queue_full'):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds after which the submission may be accepted
+        self.reason = reason
+
+
+class ClientLimitError(QueueFullError):
+    """Raised when a client has too many jobs in progress or submits them faster than its rate."""
+
+
+class JobStateError(Exception):
+    """Raised when retrying a job that has not failed."""
+
+
+class AdmissionPolicy:
+    """
+    Limits on the jobs each client can submit, and their share of the workers.
+
+    Every client has a token bucket refilled at rate jobs per second up to
+    burst jobs, and may have at most max_in_flight jobs queued or running.
+    Queued jobs are claimed in weighted fair order: while several clients have
+    jobs waiting, each gets a share of the workers proportional to its weight,
+    however many jobs it submitted. A job whose estimated wait in the queue is
+    over max_queue_wait seconds is rejected rather than queued.
+    A rate, max_in_flight or max_queue_wait of 0 disables that limit.
+    """
+
+    def __init__(self, rate: float = 0, burst: float = 1, max_in_flight: int = 0, max_queue_wait: float = 0,
+                 weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self.weights = weights or {}
+        self.default_weight = default_weight
+
+    def weight(self, client_id: str) -> float:
+        return max(0.01, self.weights.get(client_id, self.default_weight))
+
+
+def parse_client_weights(text: str) -> Dict[str, float]:
+    """Parses client weights written as "client=weight,other=weight"."""
+    weights = {}
+    for item in text.split(','):
+        client_id, _, weight = item.partition('=')
+        if client_id.strip() and weight.strip():
+            weights[client_id.strip()] = float(weight)
+    return weights
+
+
+class JobQueue:
+    """
+    A job queue backed by a local SQLite database.
+
+    Jobs are stored in SQLite so that any process sharing the database file can
+    enqueue work and report status, and every process runs its own pool of
+    worker threads that claim queued jobs one at a time. No external broker is
+    needed.
+
+    A claimed job holds a lease that a heartbeat thread of its process renews.
+    When a process dies or is killed mid-job the lease expires, and the job is
+    marked failed by whichever process notices first, so it stops counting
+    against the in-flight limits and can be retried from its checkpoint.
+
+    Submissions go through admission control in the same transaction that
+    enqueues them, so the limits hold across processes: the in-flight cap of
+    the whole queue, then the per-client limits of the AdmissionPolicy. Jobs
+    are claimed by weighted fair queuing between clients: each job gets a
+    virtual finish time that advances by 1 / weight for every job its client
+    has waiting, and the job with the earliest one runs next.
+    """
+
+    def __init__(self, handler: Callable, db_path: str = DEFAULT_DB_PATH,
+                 num_workers: int = 2, max_in_flight: int = 10, poll_interval: float = 1.0,
+                 admission: Optional[AdmissionPolicy] = None, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 ttl: Optional[float] = DEFAULT_JOB_TTL):
+        """
+        Args:
+            handler: Callable run for each job as handler(payload, reporter).
+                The reporter is a JobReporter used to publish progress, and the
+                return value must be JSON serializable; it becomes the job result.
+            db_path: Path of the SQLite database file
+            num_workers: Number of worker threads in this process
+            max_in_flight: Maximum number of queued plus running jobs
+            poll_interval: Seconds between checks for jobs enqueued elsewhere
+            admission: Per-client limits and weights, none but fair queuing by default
+            lease_seconds: Seconds after which a running job whose process stopped
+                renewing its lease is considered interrupted
+            ttl: Seconds a completed or failed job and its events are kept, None or 0 keeps them forever
+        """
+        self.handler = handler
+        self.db_path = db_path
+        self.num_workers = num_workers
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self.admission = admission or AdmissionPolicy()
+        self.lease_seconds = lease_seconds
+        self.ttl = ttl
+        self._last_purge = None
+        self._wakeup = threading.Condition()
+        self._workers = []
+        self._heartbeat = None
+        self._leases = {}  # lease ID -> ID of the job a worker of this process is running
+        self._leases_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    client_id TEXT NOT NULL DEFAULT '',
+                    finish_tag REAL NOT NULL DEFAULT 0,
+                    lease_id TEXT,
+                    lease_expires_at REAL
+                )
+            """)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'client_id' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN client_id TEXT NOT NULL DEFAULT ''")
+            if 'finish_tag' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN finish_tag REAL NOT NULL DEFAULT 0")
+            if 'lease_id' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_id TEXT")
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_fair_order ON jobs (status, finish_tag, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client_id, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS client_buckets (
+                    client_id TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            # Virtual time of the fair queue: the finish time of the last claimed job
+            conn.execute("CREATE TABLE IF NOT EXISTS queue_state (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id)")
+        finally:
+            conn.close()
+        if ttl:
+            self.purge(ttl)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start(self):
+        """
+        Starts the worker threads of this process, after failing the jobs
+        left running by processes that stopped renewing their lease.
+        """
+        if self._workers:
+            return
+        JOB_QUEUE_DEPTH.set_collector(self._collect_depth)
+        self._stopped.clear()
+        self.expire_leases()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+        for index in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stops the worker threads once they finish their current job. Jobs still
+        running after timeout seconds, shared by all workers, are marked failed
+        so they can be retried.
+        """
+        self._stopped.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if self._heartbeat is not None:
+            self._heartbeat.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            self._heartbeat = None
+        self._workers = []
+
+        with self._leases_lock:
+            interrupted = dict(self._leases)
+            self._leases.clear()
+        for lease_id, job_id in interrupted.items():
+            self._fail_interrupted(job_id, lease_id, "Job interrupted: the server stopped before it finished")
+
+    def submit(self, payload: dict, client_id: str = '') -> str:
+        """
+        Enqueues a new job.
+
+        Args:
+            payload: JSON serializable arguments passed to the handler
+            client_id: Identifies the client for the per-client limits and fair queuing
+
+        Returns:
+            str: ID of the new job
+
+        Raises:
+            QueueFullError: If max_in_flight jobs are already queued or running,
+                or the job would wait longer than the policy allows
+            ClientLimitError: If the client is over its in-flight limit or rate
+        """
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                finish_tag = self._admit(conn, client_id)
+            except QueueFullError as e:
+                conn.execute("ROLLBACK")
+                JOB_ADMISSION_REJECTIONS.inc(reason=e.reason)
+                raise
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, client_id, finish_tag) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_QUEUED, json.dumps(payload), time.time(), client_id, finish_tag)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def admit(self, client_id: str = '', cost: int = 1):
+        """
+        Applies the per-client limits to work that runs outside the queue,
+        such as a batch of cost prompts. The client must be under its
+        in-flight limit and have a token left; the whole cost is then taken
+        from its bucket, which may leave it in debt, so the client's next
+        submissions wait until the bucket has refilled.
+
+        Raises:
+            ClientLimitError: If the client is over its in-flight limit or rate
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens = self._check_client(conn, client_id, self._mean_job_seconds(conn))
+            except ClientLimitError as e:
+                conn.execute("ROLLBACK")
+                JOB_ADMISSION_REJECTIONS.inc(reason=e.reason)
+                raise
+            self._take_tokens(conn, client_id, tokens, cost)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _admit(self, conn: sqlite3.Connection, client_id: str) -> float:
+        """
+        Checks that a job of client_id can be queued, within the transaction
+        that queues it, and takes a token from the client's bucket.
+
+        Returns:
+            float: Virtual finish time of the job in the fair queue
+
+        Raises:
+            QueueFullError: If the queue is full or the wait would be too long
+            ClientLimitError: If the client is over one of its limits
+        """
+        policy = self.admission
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", (JOB_QUEUED, JOB_RUNNING)
+        ).fetchall())
+        queued, running = counts.get(JOB_QUEUED, 0), counts.get(JOB_RUNNING, 0)
+        # Workers of other processes show up as running jobs
+        slots = max(1, self.num_workers, running)
+        job_seconds = self._mean_job_seconds(conn)
+
+        if queued + running >= self.max_in_flight:
+            retry_after = job_seconds / slots
+            raise QueueFullError(
+                f"Too many jobs in progress ({queued + running}), try again in {math.ceil(retry_after)} seconds",
+                retry_after=retry_after
+            )
+
+        tokens = self._check_client(conn, client_id, job_seconds)
+
+        finish_tag = self._finish_tag(conn, client_id)
+        if policy.max_queue_wait > 0:
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND finish_tag <= ?", (JOB_QUEUED, finish_tag)
+            ).fetchone()[0]
+            # The job starts once the jobs ahead of it and one round of running jobs are done
+            expected_wait = (ahead // slots + (1 if running >= slots else 0)) * job_seconds
+            if expected_wait > policy.max_queue_wait:
+                retry_after = expected_wait - policy.max_queue_wait
+                raise QueueFullError(
+                    f"The queue is too long (about {int(expected_wait)} seconds of wait), "
+                    f"try again in {math.ceil(retry_after)} seconds",
+                    retry_after=retry_after, reason='queue_wait'
+                )
+
+        self._take_tokens(conn, client_id, tokens, 1)
+        return finish_tag
+
+    def _check_client(self, conn: sqlite3.Connection, client_id: str, job_seconds: float) -> Optional[float]:
+        """
+        Checks the in-flight limit and the token bucket of client_id.
+
+        Returns:
+            Optional[float]: Tokens in the client's bucket, None when there is no rate limit
+
+        Raises:
+            ClientLimitError: If the client is over one of its limits
+        """
+        policy = self.admission
+        if policy.max_in_flight > 0:
+            client_in_flight = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE client_id = ? AND status IN (?, ?)",
+                (client_id, JOB_QUEUED, JOB_RUNNING)
+            ).fetchone()[0]
+            if client_in_flight >= policy.max_in_flight:
+                raise ClientLimitError(
+                    f"Too many of your jobs are in progress ({client_in_flight}), "
+                    "try again when one of them finishes",
+                    retry_after=job_seconds, reason='client_in_flight'
+                )
+
+        if policy.rate <= 0:
+            return None
+        row = conn.execute(
+            "SELECT tokens, updated_at FROM client_buckets WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        tokens = policy.burst if row is None else min(
+            policy.burst, row['tokens'] + max(0.0, time.time() - row['updated_at']) * policy.rate
+        )
+        if tokens < 1:
+            retry_after = (1 - tokens) / policy.rate
+            raise ClientLimitError(
+                f"Too many jobs submitted, try again in {math.ceil(retry_after)} seconds",
+                retry_after=retry_after, reason='rate_limited'
+            )
+        return tokens
+
+    def _take_tokens(self, conn: sqlite3.Connection, client_id: str, tokens: Optional[float], cost: float):
+        """Takes cost tokens from the client's bucket, which may go below zero for a large cost."""
+        policy = self.admission
+        if tokens is None:
+            return
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO client_buckets (client_id, tokens, updated_at) VALUES (?, ?, ?)",
+            (client_id, tokens - cost, now)
+        )
+        # A bucket refilled to the brim is the same as no bucket
+        conn.execute("DELETE FROM client_buckets WHERE updated_at < ?", (now - policy.burst / policy.rate,))
+
+    def _finish_tag(self, conn: sqlite3.Connection, client_id: str) -> float:
+        """Returns the virtual finish time of a new job of client_id in the fair queue."""
+        row = conn.execute("SELECT value FROM queue_state WHERE key = 'virtual_time'").fetchone()
+        virtual_time = row['value'] if row else 0.0
+        last_tag = conn.execute(
+            "SELECT MAX(finish_tag) FROM jobs WHERE client_id = ? AND status = ?", (client_id, JOB_QUEUED)
+        ).fetchone()[0]
+        return max(virtual_time, last_tag or 0.0) + 1 / self.admission.weight(client_id)
+
+    def _mean_job_seconds(self, conn: sqlite3.Connection) -> float:
+        """Returns the mean duration of the last completed jobs."""
+        mean = conn.execute(
+            "SELECT AVG(finished_at - started_at) FROM "
+            "(SELECT started_at, finished_at FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?)",
+            (JOB_COMPLETED, JOB_DURATION_SAMPLE)
+        ).fetchone()[0]
+        return mean if mean else DEFAULT_JOB_SECONDS
+
+    def retry(self, job_id: str) -> Optional[int]:
+        """
+        Queues a failed job again under the same ID. The handler can use the
+        job ID to resume from the work saved by the failed attempt. A running
+        job whose lease has expired counts as failed: its process is gone.
+
+        Returns:
+            int: ID of the "retrying" event, after which the new attempt's events
+                are published, or None if the job does not exist
+
+        Raises:
+            JobStateError: If the job has not failed
+            QueueFullError: If the queue or the client that submitted the job
+                is over one of its limits, as for submit
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT status, client_id, lease_expires_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            if row['status'] != JOB_FAILED and not self._is_interrupted(row):
+                conn.execute("ROLLBACK")
+                raise JobStateError(
+                    f"Job {job_id} is {row['status']}, only failed or interrupted jobs can be retried"
+                )
+            try:
+                finish_tag = self._admit(conn, row['client_id'])
+            except QueueFullError as e:
+                conn.execute("ROLLBACK")
+                JOB_ADMISSION_REJECTIONS.inc(reason=e.reason)
+                raise
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, started_at = NULL, finished_at = NULL, "
+                "created_at = ?, finish_tag = ?, lease_id = NULL, lease_expires_at = NULL WHERE id = ?",
+                (JOB_QUEUED, time.time(), finish_tag, job_id)
+            )
+            event_id = conn.execute(
+                "INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, 'retrying', '{}', time.time())
+            ).lastrowid
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return event_id
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """
+        Gets the status of a job.
+
+        Returns:
+            dict: Job status, per-file progress, result and error, or None if the job does not exist
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row['status'] == JOB_QUEUED:
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND "
+                    "(finish_tag < ? OR (finish_tag = ? AND created_at < ?))",
+                    (JOB_QUEUED, row['finish_tag'], row['finish_tag'], row['created_at'])
+                ).fetchone()[0]
+        finally:
+            conn.close()
+
+        return {
+            'job_id': row['id'],
+            'status': row['status'],
+            'queue_position': position,
+            'progress': json.loads(row['progress']),
+            'result': json.loads(row['result']) if row['result'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at']
+        }
+
+    def get_events(self, job_id: str, after_id: int = 0) -> list:
+        """
+        Gets the events published by a job, oldest first.
+
+        Args:
+            job_id: ID of the job
+            after_id: Only return events with a greater ID than this one
+
+        Returns:
+            list: Dictionaries with the event id, name and data
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after_id)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{'id': row['id'], 'event': row['event'], 'data': json.loads(row['data'])} for row in rows]
+
+    def _add_event(self, job_id: str, event: str, data: dict):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, event, json.dumps(data), time.time())
+            )
+        finally:
+            conn.close()
+
+    def _claim_job(self) -> Optional[Tuple[sqlite3.Row, str]]:
+        """Claims the next job in fair order and returns it with its lease ID."""
+        lease_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, payload, created_at, finish_tag FROM jobs WHERE status = ? "
+                "ORDER BY finish_tag, created_at LIMIT 1", (JOB_QUEUED,)
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, lease_id = ?, lease_expires_at = ? WHERE id = ?",
+                    (JOB_RUNNING, now, lease_id, now + self.lease_seconds, row['id'])
+                )
+                conn.execute(
+                    "INSERT INTO queue_state (key, value) VALUES ('virtual_time', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (row['finish_tag'],)
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        with self._leases_lock:
+            self._leases[lease_id] = row['id']
+        return row, lease_id
+
+    def _is_interrupted(self, row: sqlite3.Row) -> bool:
+        """Whether a job is running under a lease that is no longer renewed."""
+        return row['status'] == JOB_RUNNING and (
+            row['lease_expires_at'] is None or row['lease_expires_at'] < time.time()
+        )
+
+    def _renew_leases(self):
+        with self._leases_lock:
+            lease_ids = list(self._leases)
+        if not lease_ids:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"UPDATE jobs SET lease_expires_at = ? WHERE status = ? "
+                f"AND lease_id IN ({', '.join('?' * len(lease_ids))})",
+                (time.time() + self.lease_seconds, JOB_RUNNING, *lease_ids)
+            )
+        finally:
+            conn.close()
+
+    def expire_leases(self) -> int:
+        """
+        Marks failed the running jobs whose lease expired, left behind by a
+        process that crashed or was killed.
+
+        Returns:
+            int: Number of jobs marked failed
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, lease_id FROM jobs WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (JOB_RUNNING, time.time())
+            ).fetchall()
+        finally:
+            conn.close()
+        expired = 0
+        for row in rows:
+            if self._fail_interrupted(row['id'], row['lease_id'],
+                                      "Job interrupted: its worker stopped before it finished"):
+                expired += 1
+        if expired:
+            logger.warning(f"Marked {expired} interrupted jobs as failed")
+        return expired
+
+    def purge(self, older_than: float) -> int:
+        """
+        Deletes the completed and failed jobs that finished more than
+        older_than seconds ago, with their events.
+
+        Returns:
+            int: Number of jobs deleted
+        """
+        cutoff = time.time() - older_than
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "DELETE FROM job_events WHERE job_id IN "
+                    "(SELECT id FROM jobs WHERE finished_at < ? AND status IN (?, ?))",
+                    (cutoff, JOB_COMPLETED, JOB_FAILED)
+                )
+                deleted = conn.execute(
+                    "DELETE FROM jobs WHERE finished_at < ? AND status IN (?, ?)", (cutoff, JOB_COMPLETED, JOB_FAILED)
+                ).rowcount
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+        self._last_purge = time.monotonic()
+        if deleted:
+            logger.info(f"Deleted {deleted} finished jobs older than {older_than:.0f} seconds")
+        return deleted
+
+    def _fail_interrupted(self, job_id: str, lease_id: Optional[str], error: str) -> bool:
+        """Fails a running job, unless it finished or was claimed again under another lease meanwhile."""
+        if not self._finish_job(job_id, lease_id, status=JOB_FAILED, error=error, finished_at=time.time()):
+            return False
+        self._add_event(job_id, JOB_FAILED, {'error': error})
+        JOBS_TOTAL.inc(status=JOB_FAILED)
+        return True
+
+    def _finish_job(self, job_id: str, lease_id: Optional[str], **fields) -> bool:
+        """Updates a running job still held under lease_id, and returns whether it was."""
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        try:
+            return conn.execute(
+                f"UPDATE jobs SET {columns}, lease_expires_at = NULL "
+                f"WHERE id = ? AND status = ? AND lease_id IS ?",
+                (*fields.values(), job_id, JOB_RUNNING, lease_id)
+            ).rowcount > 0
+        finally:
+            conn.close()
+
+    def _heartbeat_loop(self):
+        # Renew well before expiry, so a slow beat does not cost a lease
+        while not self._stopped.wait(self.lease_seconds / 3):
+            try:
+                self._renew_leases()
+                self.expire_leases()
+            except sqlite3.Error as e:
+                logger.error(f"Error renewing job leases: {str(e)}")
+            if self.ttl and time.monotonic() - self._last_purge >= PURGE_INTERVAL:
+                try:
+                    self.purge(self.ttl)
+                except sqlite3.Error as e:
+                    logger.error(f"Error deleting finished jobs: {str(e)}")
+
+    def _collect_depth(self):
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall())
+        finally:
+            conn.close()
+        for status in (JOB_QUEUED, JOB_RUNNING):
+            JOB_QUEUE_DEPTH.set(counts.get(status, 0), status=status)
+
+    def _update_job(self, job_id: str, lease_id: str, **fields) -> bool:
+        """Updates a running job still held under lease_id, without ending its lease, and returns whether it was."""
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        try:
+            return conn.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ? AND status = ? AND lease_id IS ?",
+                (*fields.values(), job_id, JOB_RUNNING, lease_id)
+            ).rowcount > 0
+        finally:
+            conn.close()
+
+    def _worker_loop(self):
+        while not self._stopped.is_set():
+            try:
+                claimed = self._claim_job()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                claimed = None
+
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            row, lease_id = claimed
+            job_id = row['id']
+            STAGE_SECONDS.observe(max(0.0, time.time() - row['created_at']), stage='queue_wait')
+            reporter = JobReporter(self, job_id, lease_id)
+            try:
+                result = self.handler(json.loads(row['payload']), reporter)
+                # Nothing is reported if the job was given up meanwhile (see stop)
+                if self._finish_job(job_id, lease_id, status=JOB_COMPLETED, result=json.dumps(result),
+                                    progress=json.dumps(reporter.progress), finished_at=time.time()):
+                    reporter.emit(JOB_COMPLETED, result=result)
+                    JOBS_TOTAL.inc(status=JOB_COMPLETED)
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {str(e)}")
+                if self._finish_job(job_id, lease_id, status=JOB_FAILED, error=str(e),
+                                    progress=json.dumps(reporter.progress), finished_at=time.time()):
+                    reporter.emit(JOB_FAILED, error=str(e))
+                    JOBS_TOTAL.inc(status=JOB_FAILED)
+            finally:
+                with self._leases_lock:
+                    self._leases.pop(lease_id, None)
+
+
+class JobReporter:
+    """Collects progress and events for a running job and saves them to the queue database."""
+
+    def __init__(self, queue: JobQueue, job_id: str, lease_id: Optional[str] = None):
+        self.queue = queue
+        self.job_id = job_id
+        self.lease_id = lease_id  # Progress is only saved while the job is held under this lease
+        self.progress = {'stage': JOB_QUEUED, 'files': {}}
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str, **details):
+        with self._lock:
+            self.progress['stage'] = stage
+            self.progress.update(details)
+            self._save()
+
+    def set_file_status(self, file_path: str, status: str):
+        with self._lock:
+            self.progress['files'][file_path] = status
+            self._save()
+
+    def emit(self, event: str, **data):
+        """Publishes an event that clients can stream while the job runs."""
+        try:
+            self.queue._add_event(self.job_id, event, data)
+        except sqlite3.Error as e:
+            logger.error(f"Error saving event for job {self.job_id}: {str(e)}")
+
+    def _save(self):
+        try:
+            self.queue._update_job(self.job_id, self.lease_id, progress=json.dumps(self.progress))
+        except sqlite3.Error as e:
+            logger.error(f"Error saving progress for job {self.job_id}: {str(e)}")
@@ -0,0 +1,280 @@
+# llm_providers.py
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Type
+
+import httpx
+
+# Connection pool settings shared by the HTTP clients of every provider
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+
+def _close_async(close: Callable[[], Awaitable]):
+    """Runs the async close method of a client from synchronous code."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(close())
+    else:
+        loop.create_task(close())
+
+
+class LLMProvider:
+    """
+    Base class for the language model backends used to generate projects.
+
+    A provider is created once per process and reused for every request, so
+    it keeps its SDK client and HTTP connection pool alive between calls.
+    Subclasses implement stream() and astream(), which yield the response
+    text chunk by chunk as the model produces it.
+    """
+
+    name = None
+    default_model = None
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None):
+        self.api_key = api_key
+        self.model_name = model_name or self.default_model
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        """
+        Sends a prompt to the model and yields the response as it streams in.
+
+        Args:
+            prompt: The user prompt
+            system: Optional system instruction, ignored by providers that don't use one
+
+        Returns:
+            Iterator[str]: Chunks of the response text
+        """
+        raise NotImplementedError
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        """Async version of stream()."""
+        raise NotImplementedError
+        yield  # pragma: no cover
+
+    def complete(self, prompt: str, system: Optional[str] = None) -> str:
+        """Sends a prompt to the model and returns the full response text."""
+        return "".join(self.stream(prompt, system=system))
+
+    async def acomplete(self, prompt: str, system: Optional[str] = None) -> str:
+        """Async version of complete()."""
+        return "".join([chunk async for chunk in self.astream(prompt, system=system)])
+
+    def close(self):
+        """Closes the connections held by the provider."""
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+    default_model = "gemini-pro"
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None):
+        super().__init__(api_key, model_name)
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        # The model object keeps a single gRPC channel open for all calls
+        self.model = genai.GenerativeModel(self.model_name)
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        for chunk in self.model.generate_content(prompt, stream=True):
+            if chunk.parts:
+                yield chunk.text
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    default_model = "gpt-3.5-turbo"
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None):
+        super().__init__(api_key, model_name)
+        import openai
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            http_client=httpx.Client(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=httpx.AsyncClient(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+        )
+
+    def _messages(self, prompt: str, system: Optional[str]) -> List[dict]:
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt, system),
+            stream=True
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        response = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt, system),
+            stream=True
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def close(self):
+        self.client.close()
+        _close_async(self.async_client.close)
+
+
+class MistralProvider(LLMProvider):
+    name = "mistral"
+    default_model = "mistral-medium"
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None):
+        super().__init__(api_key, model_name)
+        from mistralai import Mistral
+        self.http_client = httpx.Client(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+        self.async_http_client = httpx.AsyncClient(limits=HTTP_POOL_LIMITS, timeout=HTTP_TIMEOUT)
+        self.client = Mistral(api_key=api_key, client=self.http_client, async_client=self.async_http_client)
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        response = self.client.chat.stream(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        for event in response:
+            if event.data.choices and event.data.choices[0].delta.content:
+                yield event.data.choices[0].delta.content
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        response = await self.client.chat.stream_async(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        async for event in response:
+            if event.data.choices and event.data.choices[0].delta.content:
+                yield event.data.choices[0].delta.content
+
+    def close(self):
+        # The SDK doesn't own clients passed to it, so they are closed here
+        self.http_client.close()
+        _close_async(self.async_http_client.aclose)
+
+
+class FakeProvider(LLMProvider):
+    """
+    Local provider that never touches the network, for tests and benchmarks.
+
+    Responses come from the responder callable (or echo the prompt length when
+    none is given) and are streamed in chunks of chunk_size characters after
+    waiting latency seconds.
+    """
+
+    name = "fake"
+    default_model = "fake-model"
+
+    def __init__(self, api_key: Optional[str] = None, model_name: Optional[str] = None,
+                 responder: Optional[Callable[[str], str]] = None, latency: float = 0.0, chunk_size: int = 16):
+        super().__init__(api_key, model_name)
+        self.responder = responder or (lambda prompt: f"Generated content for a prompt of {len(prompt)} characters")
+        self.latency = latency
+        self.chunk_size = max(1, chunk_size)
+        self.prompts = []  # Every prompt received, in call order
+        self._lock = threading.Lock()
+
+    def _respond(self, prompt: str) -> str:
+        with self._lock:
+            self.prompts.append(prompt)
+        return self.responder(prompt)
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        text = self._respond(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        text = self._respond(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+
+
+class ConcurrencyLimitedProvider(LLMProvider):
+    """
+    Wraps a provider so at most max_concurrency calls run at once across all
+    threads sharing it. Further calls wait for a free slot.
+    """
+
+    def __init__(self, provider: LLMProvider, max_concurrency: int):
+        super().__init__(provider.api_key, provider.model_name)
+        self.provider = provider
+        self.name = provider.name
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        with self._semaphore:
+            yield from self.provider.stream(prompt, system=system)
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        acquired = asyncio.get_running_loop().run_in_executor(None, self._semaphore.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            # The executor thread still takes the slot, give it back once it has
+            acquired.add_done_callback(lambda _: self._semaphore.release())
+            raise
+        try:
+            async for chunk in self.provider.astream(prompt, system=system):
+                yield chunk
+        finally:
+            self._semaphore.release()
+
+    def close(self):
+        self.provider.close()
+
+
+def find_provider_layer(provider: LLMProvider, provider_type: Type[LLMProvider]) -> Optional[LLMProvider]:
+    """Returns the first provider of provider_type in a chain of wrapping providers, or None."""
+    while provider is not None:
+        if isinstance(provider, provider_type):
+            return provider
+        provider = getattr(provider, 'provider', None)
+    return None
+
+
+# Registered providers by API name. Adding a backend only requires a new
+# LLMProvider subclass listed here.
+PROVIDERS: Dict[str, Type[LLMProvider]] = {
+    provider.name: provider
+    for provider in (GeminiProvider, OpenAIProvider, MistralProvider, FakeProvider)
+}
+
+
+def create_provider(api_name: str, api_key: Optional[str] = None, model_name: Optional[str] = None,
+                    **options) -> LLMProvider:
+    """
+    Creates the provider registered for api_name.
+
+    Raises:
+        ValueError: If no provider is registered under that name
+    """
+    if api_name not in PROVIDERS:
+        raise ValueError("Unsupported API")
+    return PROVIDERS[api_name](api_key=api_key, model_name=model_name, **options)
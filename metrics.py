@@ -0,0 +1,314 @@
+# metrics.py
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds, from a fast disk write to a slow model call
+DEFAULT_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}"
+            for key, value in values
+        ]
+
+
+class Gauge:
+    """
+    A value that goes up and down, optionally split by labels. A collector
+    set with set_collector is called on every render to refresh the values,
+    for state that lives outside the process.
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> value
+        self._collector = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def set_collector(self, collector: Optional[Callable[[], None]]):
+        self._collector = collector
+
+    def samples(self) -> List[str]:
+        if self._collector is not None:
+            try:
+                self._collector()
+            except Exception as e:
+                logger.error(f"Error collecting {self.name}: {str(e)}")
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}"
+            for key, value in values
+        ]
+
+
+class Histogram:
+    """Counts observations in cumulative buckets, optionally split by labels."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in values:
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, state):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': repr(float(bound))})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics of the process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'generation_stage_seconds', 'Duration of each stage of the generation pipeline.', ['stage']
+))
+LLM_PROMPT_TOKENS = REGISTRY.register(Histogram(
+    'llm_prompt_tokens', 'Estimated tokens sent to the model per call.', ['stage'], TOKEN_BUCKETS
+))
+LLM_RESPONSE_TOKENS = REGISTRY.register(Histogram(
+    'llm_response_tokens', 'Estimated tokens received from the model per call.', ['stage'], TOKEN_BUCKETS
+))
+CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    'generation_context_tokens', 'Estimated tokens of the context built for each file prompt.', [], TOKEN_BUCKETS
+))
+FILE_BYTES = REGISTRY.register(Histogram(
+    'generated_file_bytes', 'Size of each generated file.', [], BYTE_BUCKETS
+))
+PROMPT_PREFIX_TOKENS = REGISTRY.register(Counter(
+    'prompt_prefix_reused_tokens_total',
+    'Estimated tokens of file prompts taken from the project prefix built once per project.'
+))
+BATCHED_FILES = REGISTRY.register(Counter(
+    'generation_batched_files_total',
+    'Files planned in multi-file calls, by whether the batch response held them or they fell back to a call of their own.',
+    ['result']
+))
+LLM_CACHE_REQUESTS = REGISTRY.register(Counter(
+    'llm_cache_requests_total', 'Model calls looked up in the response cache, by result.', ['result']
+))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    'generation_jobs_total', 'Finished generation jobs, by status.', ['status']
+))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'job_queue_jobs', 'Jobs in the queue shared by the app processes, by status.', ['status']
+))
+JOB_ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    'job_admission_rejections_total', 'Jobs rejected when submitted, by reason.', ['reason']
+))
+GITHUB_RATE_LIMIT_REMAINING = REGISTRY.register(Gauge(
+    'github_rate_limit_remaining', 'GitHub API requests left in the current rate limit window.'
+))
+GITHUB_RATE_LIMIT_LIMIT = REGISTRY.register(Gauge(
+    'github_rate_limit_limit', 'GitHub API requests allowed per rate limit window.'
+))
+GITHUB_RATE_LIMIT_RESET = REGISTRY.register(Gauge(
+    'github_rate_limit_reset_timestamp_seconds', 'Unix time at which the GitHub API rate limit window resets.'
+))
+
+
+class Trace:
+    """Timeline of the stages of one job, saved as JSON when the job ends."""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, attributes: dict):
+        with self._lock:
+            self.spans.append({
+                'stage': name,
+                'start': round(start - self.started_at, 6),
+                'duration': round(duration, 6),
+                **attributes
+            })
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['start'])
+        totals = {}
+        for span in spans:
+            totals[span['stage']] = round(totals.get(span['stage'], 0) + span['duration'], 6)
+        return {
+            'trace_id': self.trace_id,
+            'started_at': self.started_at,
+            'duration': round(time.time() - self.started_at, 6),
+            'stage_totals': totals,
+            'spans': spans
+        }
+
+    def save(self, trace_dir: str):
+        os.makedirs(trace_dir, exist_ok=True)
+        with open(os.path.join(trace_dir, f"{self.trace_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+
+# Trace of the job running in the current context. Worker threads see it when
+# their task is submitted through contextvars.copy_context().run.
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Times a pipeline stage into generation_stage_seconds and the current trace.
+
+    The yielded dictionary holds the span attributes, so the stage can add
+    details such as sizes once they are known. A failing stage gets an 'error'
+    attribute.
+    """
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes['error'] = str(e) or type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(name, started_at, duration, attributes)
+
+
+def load_trace(trace_dir: str, trace_id: str) -> Optional[dict]:
+    """Reads a saved trace, or returns None if there is none."""
+    try:
+        with open(os.path.join(trace_dir, f"{trace_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def prune_traces(trace_dir: str, max_age: float, max_files: int) -> int:
+    """
+    Deletes the saved traces older than max_age seconds, then the oldest ones
+    beyond max_files. A max_age or max_files of 0 disables that limit.
+
+    Returns:
+        int: Number of traces deleted
+    """
+    try:
+        names = [name for name in os.listdir(trace_dir) if name.endswith('.json')]
+    except FileNotFoundError:
+        return 0
+    traces = []
+    for name in names:
+        path = os.path.join(trace_dir, name)
+        try:
+            traces.append((os.path.getmtime(path), path))
+        except FileNotFoundError:
+            continue
+    traces.sort(reverse=True)
+
+    expired = []
+    if max_age > 0:
+        cutoff = time.time() - max_age
+        expired = [path for mtime, path in traces if mtime < cutoff]
+        traces = [(mtime, path) for mtime, path in traces if mtime >= cutoff]
+    if max_files > 0:
+        expired.extend(path for _, path in traces[max_files:])
+
+    deleted = 0
+    for path in expired:
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            continue
+    return deleted
@@ -0,0 +1,122 @@
+# mirror_cache.py
+import fcntl
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import git
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIRROR_DIR = os.path.join('data', 'mirrors')
+DEFAULT_MAX_MIRRORS = 50
+
+
+class MirrorCache:
+    """
+    Local bare mirrors of repositories, kept between updates.
+
+    A mirror holds only the latest commit of each branch (a depth-1 fetch), and
+    syncing it again fetches just the objects added since. Checkouts are local
+    clones of the mirror, which hard-link its objects instead of copying them,
+    so they stay valid if the mirror is evicted later. The remote URL is passed
+    to every fetch and never stored, since it may hold a token.
+
+    Mirrors beyond max_mirrors are evicted, least recently used first. File
+    locks keep processes sharing the directory from syncing or evicting the
+    same mirror at once.
+    """
+
+    def __init__(self, mirror_dir: str = DEFAULT_MIRROR_DIR, max_mirrors: int = DEFAULT_MAX_MIRRORS):
+        self.mirror_dir = mirror_dir
+        self.max_mirrors = max_mirrors
+        os.makedirs(mirror_dir, exist_ok=True)
+
+    def _mirror_path(self, key: str) -> str:
+        return os.path.join(self.mirror_dir, f"{key}.git")
+
+    @contextmanager
+    def _locked(self, lock_path: str, blocking: bool = True) -> Iterator[bool]:
+        """Holds an exclusive lock on lock_path and yields whether it was acquired."""
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def checkout(self, key: str, remote_url: str, project_path: str) -> git.Repo:
+        """
+        Syncs the mirror of a repository and checks its default branch out into
+        project_path, with origin pointing at remote_url for the push.
+
+        Args:
+            key: Identifier of the repository in the cache, such as "user/repo"
+            remote_url: URL to fetch from and push to
+            project_path: Empty or missing directory for the checkout
+
+        Returns:
+            git.Repo: The checkout
+        """
+        mirror_path = self._mirror_path(key)
+        os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+        with self._locked(f"{mirror_path}.lock"):
+            if not os.path.isdir(mirror_path):
+                git.Repo.init(mirror_path, bare=True)
+            mirror = git.Repo(mirror_path)
+            mirror.git.fetch(remote_url, '+refs/heads/*:refs/heads/*', '--prune', '--depth=1')
+            self._update_head(mirror)
+            os.utime(mirror_path)  # Recency used for eviction
+
+            checkout = git.Repo.clone_from(mirror_path, project_path)
+        checkout.remote('origin').set_url(remote_url)
+        self.evict()
+        return checkout
+
+    @staticmethod
+    def _update_head(mirror: git.Repo):
+        """Points HEAD at an existing branch, preferring the current one, then master."""
+        branches = [head.name for head in mirror.heads]
+        if not branches:
+            return
+        current = mirror.git.symbolic_ref('HEAD', short=True)
+        if current not in branches:
+            mirror.git.symbolic_ref('HEAD', f"refs/heads/{'master' if 'master' in branches else branches[0]}")
+
+    def _mirrors(self) -> List[str]:
+        mirrors = []
+        for root, directories, _ in os.walk(self.mirror_dir):
+            for directory in list(directories):
+                if directory.endswith('.git'):
+                    mirrors.append(os.path.join(root, directory))
+                    directories.remove(directory)  # Don't walk into the mirror
+        return mirrors
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used mirrors beyond max_mirrors, skipping
+        those being synced.
+
+        Returns:
+            int: Number of mirrors removed
+        """
+        with self._locked(os.path.join(self.mirror_dir, '.evict.lock'), blocking=False) as acquired:
+            if not acquired:
+                return 0  # Another process is evicting
+            mirrors = sorted(self._mirrors(), key=lambda path: os.path.getmtime(path))
+            removed = 0
+            for mirror_path in mirrors[:max(0, len(mirrors) - self.max_mirrors)]:
+                # The lock file stays: another process may be waiting on it
+                with self._locked(f"{mirror_path}.lock", blocking=False) as unused:
+                    if unused:
+                        shutil.rmtree(mirror_path, ignore_errors=True)
+                        removed += 1
+            if removed:
+                logger.info(f"Evicted {removed} repository mirrors")
+            return removed
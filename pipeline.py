@@ -0,0 +1,297 @@
+# pipeline.py
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from checkpoints import GenerationCheckpoint, PUSH_DONE
+from generate_files import FileGenerator
+from github_handler import GitHubHandler
+from llm_providers import LLMProvider, ConcurrencyLimitedProvider, create_provider
+from resilience import CircuitBreaker, ResilientProvider
+from router import ProviderRouter, RouteTarget
+from response_cache import ResponseCache, CachedProvider
+
+# Build modes of generate_repository, see PROJECT_BUILD_MODE in the README
+BUILD_MODES = ('disk', 'memory', 'api')
+
+
+# Environment variables holding an API key, in order of preference
+API_KEY_VARIABLES = {
+    "GOOGLE_API_KEY": "gemini",
+    "OPENAI_API_KEY": "openai",
+    "MISTRAL_API_KEY": "mistral"
+}
+
+
+def get_api_keys() -> List[Tuple[str, str]]:
+    """
+    Returns the (api_key, api_name) pairs of every API key in the environment,
+    in order of preference. A variable may hold several comma-separated keys.
+    """
+    return [
+        (api_key.strip(), api_name)
+        for env_var, api_name in API_KEY_VARIABLES.items()
+        for api_key in os.getenv(env_var, '').split(',')
+        if api_key.strip()
+    ]
+
+
+def _parse_mapping(value: str, cast: Callable) -> Dict[str, object]:
+    """Parses a setting such as "gemini=8,openai=4" into a dictionary."""
+    mapping = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, setting = item.split('=', 1)
+            mapping[name.strip()] = cast(setting.strip())
+    return mapping
+
+
+def build_router_from_env(api_keys: List[Tuple[str, str]]) -> ProviderRouter:
+    """
+    Creates a router spreading calls over every API key, with the limits of
+    LLM_KEY_CONCURRENCY, LLM_PROVIDER_CONCURRENCY, LLM_KEY_RPM and LLM_ROUTE_WEIGHTS.
+    """
+    key_concurrency = int(os.getenv('LLM_KEY_CONCURRENCY', '0')) or None
+    requests_per_minute = _parse_mapping(os.getenv('LLM_KEY_RPM', ''), int)
+    weights = _parse_mapping(os.getenv('LLM_ROUTE_WEIGHTS', ''), float)
+    targets = [
+        RouteTarget(
+            create_provider(api_name, api_key),
+            key_id=f"{api_name}:...{api_key[-4:]}",
+            max_concurrency=key_concurrency,
+            requests_per_minute=requests_per_minute.get(api_name),
+            weight=weights.get(api_name, 1.0),
+            breaker=CircuitBreaker(
+                int(os.getenv('LLM_BREAKER_THRESHOLD', '5')), float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+            )
+        )
+        for api_key, api_name in api_keys
+    ]
+    return ProviderRouter(
+        targets,
+        provider_limits=_parse_mapping(os.getenv('LLM_PROVIDER_CONCURRENCY', ''), int),
+        acquire_timeout=float(os.getenv('LLM_ROUTE_WAIT_TIMEOUT', '60'))
+    )
+
+
+# Function to get the valid API key
+def get_api_key():
+    api_keys = get_api_keys()
+    if not api_keys:
+        raise ValueError("No valid API key found in environment variables")
+    api_key, api_name = api_keys[0]
+    print(f"Using {api_name} API")
+    return api_key, api_name
+
+
+def build_provider_from_env() -> Tuple[LLMProvider, Optional[ResponseCache]]:
+    """
+    Creates the provider configured by the environment, behind the retry,
+    timeout and circuit breaker layer. With LLM_ROUTING=balanced every API
+    key gets a share of the calls through a ProviderRouter; otherwise the
+    first key is used and, unless LLM_FAILOVER is false, the other keys are
+    fallbacks. The provider is wrapped in the response cache unless
+    LLM_CACHE_ENABLED is false and limited to LLM_MAX_CONCURRENCY concurrent
+    calls when that is set.
+
+    Returns:
+        tuple: The provider and its response cache, or None when caching is disabled
+    """
+    api_key, api_name = get_api_key()
+    if os.getenv('LLM_ROUTING', 'failover') == 'balanced':
+        providers = [build_router_from_env(get_api_keys())]
+    else:
+        providers = [create_provider(api_name, api_key)]
+        if os.getenv('LLM_FAILOVER', 'true').lower() not in ('0', 'false', 'no'):
+            providers.extend(create_provider(name, key) for key, name in get_api_keys()[1:])
+    provider = ResilientProvider(
+        providers,
+        timeout=float(os.getenv('LLM_CALL_TIMEOUT', '300')),
+        first_chunk_timeout=float(os.getenv('LLM_FIRST_CHUNK_TIMEOUT', '60')),
+        idle_timeout=float(os.getenv('LLM_IDLE_TIMEOUT', '60')),
+        max_retries=int(os.getenv('LLM_MAX_RETRIES', '3')),
+        backoff_base=float(os.getenv('LLM_BACKOFF_BASE', '1')),
+        backoff_max=float(os.getenv('LLM_BACKOFF_MAX', '30')),
+        hedging=os.getenv('LLM_HEDGING', 'false').lower() in ('1', 'true', 'yes'),
+        hedge_quantile=float(os.getenv('LLM_HEDGE_QUANTILE', '0.95')),
+        breaker_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', '5')),
+        breaker_cooldown=float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+    )
+
+    # Cache model responses so retries and repeated prompts don't hit the paid API
+    response_cache = None
+    if os.getenv('LLM_CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no'):
+        response_cache = ResponseCache(
+            cache_dir=os.getenv('LLM_CACHE_DIR', os.path.join('data', 'llm_cache')),
+            max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', '256')),
+            max_disk_bytes=int(os.getenv('LLM_CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+            ttl=float(os.getenv('LLM_CACHE_TTL', str(24 * 60 * 60)))
+        )
+        provider = CachedProvider(provider, response_cache)
+
+    max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '0'))
+    if max_concurrency > 0:
+        provider = ConcurrencyLimitedProvider(provider, max_concurrency)
+    return provider, response_cache
+
+
+def generate_repository(user_prompt: str, provider: LLMProvider, github_handler: GitHubHandler,
+                        build_mode: str = 'disk', on_event: Optional[Callable[..., None]] = None,
+                        executor: Optional[Executor] = None, max_workers: Optional[int] = None,
+                        push_semaphore: Optional[threading.Semaphore] = None,
+                        checkpoint: Optional[GenerationCheckpoint] = None) -> Tuple[dict, dict]:
+    """
+    Runs the whole pipeline for one prompt: generates the project files,
+    creates the GitHub repository and fetches its details.
+
+    Args:
+        user_prompt: The user request describing the project
+        provider: Provider used for every model call
+        github_handler: Handler used to create the repository
+        build_mode: "disk", "memory" or "api", see BUILD_MODES
+        on_event: Hook receiving the FileGenerator events plus "push_started" and "repo_created"
+        executor: Shared pool for file generations, instead of one per project
+        max_workers: Maximum number of files of this project generated at once
+        push_semaphore: Limits how many repositories are created at the same time
+        checkpoint: Saves the progress so that running the same checkpoint again after
+            a failure skips the completed files and, once pushed, the push. It is
+            cleared when the repository has been created.
+
+    Returns:
+        tuple: The response returned to clients and the repository information from GitHub
+    """
+    if build_mode not in BUILD_MODES:
+        raise ValueError(f"Unsupported build mode: {build_mode}")
+
+    def emit(event, **data):
+        if on_event is not None:
+            on_event(event, **data)
+
+    # Initialize the file generator with all necessary parameters
+    file_generator = FileGenerator(
+        provider=provider,
+        max_workers=max_workers,
+        on_event=on_event,
+        keep_in_memory=build_mode != 'disk',
+        executor=executor,
+        checkpoint=checkpoint
+    )
+    output_dir = None  # Initialize output_dir here
+
+    try:
+        if checkpoint is not None and checkpoint.push_state == PUSH_DONE:
+            # The repository was created by a previous attempt
+            repo_name = checkpoint.repo_name
+        else:
+            # Generate the project and separate output_dir and repo_title
+            output_dir, repo_name = file_generator.generate_project(user_prompt)
+
+            # Create the GitHub repository
+            push_semaphore = push_semaphore or threading.BoundedSemaphore(1)
+            with push_semaphore:
+                emit('push_started', repo_name=repo_name)
+                if output_dir is None:
+                    repo_url = github_handler.create_repository_from_files(
+                        repo_name, file_generator.current_files, use_api=build_mode == 'api'
+                    )
+                else:
+                    repo_url = github_handler.create_repository(repo_name, output_dir)
+
+                    # Clean up the local directory
+                    shutil.rmtree(output_dir)
+            if checkpoint is not None:
+                checkpoint.save_push(PUSH_DONE, repo_url=repo_url)
+
+        # Get the repository details from GitHub
+        repo_info = github_handler.get_repository_info(repo_name)
+        emit('repo_created', repo_url=repo_info['url'])
+
+        # Return the newly created repository details
+        result = {
+            'repo_name': repo_info['name'],
+            'repo_url': repo_info['url'],
+            'repo_timestamp': repo_info['created_at'].strftime('%B %d, %Y'),
+            'repo_id': repo_name,
+            'link_preview': {
+                'title': repo_info['name'],
+                'description': repo_info['description'],
+                'stars': repo_info['stars']
+            }
+        }
+        if checkpoint is not None:
+            checkpoint.clear()
+        return result, repo_info
+
+    except Exception:
+        # The generated files stay in the checkpoint, if any
+        output_dir = output_dir or file_generator.output_dir
+        if output_dir and os.path.exists(output_dir):
+            shutil.rmtree(output_dir)  # Clean up only if output_dir exists
+        raise
+
+
+def update_repository(repo_name: str, user_prompt: str, provider: LLMProvider, github_handler: GitHubHandler,
+                      on_event: Optional[Callable[..., None]] = None, executor: Optional[Executor] = None,
+                      max_workers: Optional[int] = None,
+                      push_semaphore: Optional[threading.Semaphore] = None) -> Tuple[dict, dict]:
+    """
+    Applies a follow-up prompt to an existing repository: checks out its
+    latest commit, regenerates only the files the change affects and pushes
+    them as one commit.
+
+    Args:
+        repo_name: Name of the existing repository
+        user_prompt: The change requested by the user
+        provider: Provider used for every model call
+        github_handler: Handler used to check out and push the repository
+        on_event: Hook receiving the FileGenerator events plus "push_started" and "repo_updated"
+        executor: Shared pool for file generations, instead of one per project
+        max_workers: Maximum number of files generated at once
+        push_semaphore: Limits how many repositories are pushed at the same time
+
+    Returns:
+        tuple: The response returned to clients and the repository information from GitHub
+    """
+    def emit(event, **data):
+        if on_event is not None:
+            on_event(event, **data)
+
+    os.makedirs(os.path.join('data', 'projects'), exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f"{repo_name}-update-", dir=os.path.join('data', 'projects'))
+    try:
+        file_list = github_handler.clone_repository(repo_name, work_dir)
+        file_generator = FileGenerator(
+            provider=provider,
+            max_workers=max_workers,
+            on_event=on_event,
+            executor=executor
+        )
+        changed, deleted = file_generator.update_project(user_prompt, work_dir, file_list, repo_name)
+
+        push_semaphore = push_semaphore or threading.BoundedSemaphore(1)
+        with push_semaphore:
+            emit('push_started', repo_name=repo_name)
+            if not github_handler.update_repository(repo_name, work_dir):
+                raise RuntimeError(f"Failed to push the update of {repo_name}")
+
+        repo_info = github_handler.get_repository_info(repo_name)
+        emit('repo_updated', repo_url=repo_info['url'], changed=changed, deleted=deleted)
+        result = {
+            'repo_name': repo_info['name'],
+            'repo_url': repo_info['url'],
+            'repo_timestamp': repo_info['created_at'].strftime('%B %d, %Y'),
+            'repo_id': repo_name,
+            'changed_files': changed,
+            'deleted_files': deleted,
+            'link_preview': {
+                'title': repo_info['name'],
+                'description': repo_info['description'],
+                'stars': repo_info['stars']
+            }
+        }
+        return result, repo_info
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
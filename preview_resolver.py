@@ -0,0 +1,171 @@
+# preview_resolver.py
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREVIEW_IMAGE = "https://github.githubassets.com/images/modules/logos_page/GitHub-Mark.png"
+
+# GitHub owner and repository names, which never need escaping in a URL path
+FULL_NAME_PATTERN = re.compile(r'^[A-Za-z0-9-]{1,39}/[A-Za-z0-9._-]{1,100}$')
+
+
+class PreviewResolver:
+    """
+    Finds a working preview image for GitHub repositories.
+
+    All candidate URLs of a repository are probed concurrently with HEAD
+    requests, and the highest-priority candidate that answers 200 wins, so a
+    card costs one probe timeout at most instead of one per candidate.
+    Results are cached per repository for `ttl` seconds; repositories with no
+    working candidate are cached as None for `negative_ttl` seconds.
+
+    Only URLs built from the configured base URLs are probed, and a repository
+    is only accepted as an "owner/name" pair, so callers cannot make the
+    server request other hosts or paths.
+    """
+
+    def __init__(self, max_workers: int = 16, timeout: float = 2, ttl: float = 3600,
+                 negative_ttl: float = 300, max_entries: int = 10000,
+                 opengraph_url: str = "https://opengraph.githubassets.com",
+                 social_url: str = "https://repository-images.githubusercontent.com",
+                 raw_url: str = "https://raw.githubusercontent.com",
+                 avatar_url: str = "https://github.com",
+                 default_image: str = DEFAULT_PREVIEW_IMAGE):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.opengraph_url = opengraph_url.rstrip('/')
+        self.social_url = social_url.rstrip('/')
+        self.raw_url = raw_url.rstrip('/')
+        self.avatar_url = avatar_url.rstrip('/')
+        self.default_image = default_image
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='preview-probe')
+        self._cache = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.probes = 0
+
+    def candidates(self, full_name: str, repo_id: Optional[int] = None) -> List[str]:
+        """Returns the preview image URLs to try for a repository, best first."""
+        if not FULL_NAME_PATTERN.match(full_name):
+            raise ValueError(f"Invalid repository name: {full_name!r}")
+        username = full_name.split('/')[0]
+        urls = [f"{self.opengraph_url}/1/{full_name}"]  # OG Image
+        if isinstance(repo_id, int) and not isinstance(repo_id, bool):
+            urls.append(f"{self.social_url}/{repo_id}/social")  # Social Card
+        urls.append(f"{self.raw_url}/{full_name}/master/preview.png")  # Custom preview
+        urls.append(f"{self.avatar_url}/{username}.png")  # Owner avatar
+        urls.append(self.default_image)  # Default
+        return urls
+
+    def _cache_get(self, key: str):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._cache[key]
+            self.misses += 1
+            return False, None
+
+    def _cache_set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._cache[key] = (time.time() + ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _probe(self, url: str) -> bool:
+        with self._lock:
+            self.probes += 1
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            return response.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def is_url_valid(self, url: str) -> Optional[bool]:
+        """
+        Checks whether a URL answers a HEAD request with a 2xx or 3xx status.
+        Returns None when the request itself fails. Answers are cached like previews.
+        """
+        key = f"url:{url}"
+        found, value = self._cache_get(key)
+        if found:
+            return value
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            valid = 200 <= response.status_code < 400
+        except requests.exceptions.RequestException:
+            return None
+        self._cache_set(key, valid, self.ttl if valid else self.negative_ttl)
+        return valid
+
+    def resolve(self, full_name: str, repo_id: Optional[int] = None) -> Optional[str]:
+        """Returns the preview image of one repository, or None if no candidate works."""
+        return self.resolve_many([{'full_name': full_name, 'repo_id': repo_id}])[full_name]
+
+    def resolve_many(self, repos: List[dict]) -> Dict[str, Optional[str]]:
+        """
+        Resolves the preview images of a whole page of repositories in one call.
+
+        Args:
+            repos: Dictionaries with a 'full_name' like "owner/name" and optionally
+                an integer 'repo_id'; other keys are ignored
+
+        Returns:
+            dict: Preview image URL, or None, keyed by full_name
+        """
+        results = {}
+        pending = {}
+        for repo in repos:
+            full_name = repo['full_name']
+            if full_name in results or full_name in pending:
+                continue
+            found, image = self._cache_get(f"repo:{full_name.lower()}")
+            if found:
+                results[full_name] = image
+                continue
+            urls = self.candidates(full_name, repo.get('repo_id'))
+            # Every probe of every repository runs at the same time
+            pending[full_name] = [(url, self._executor.submit(self._probe, url)) for url in urls]
+
+        for full_name, probes in pending.items():
+            image = None
+            # Wait in priority order: a lower-priority success only counts once
+            # every better candidate has failed
+            for url, future in probes:
+                if future.result():
+                    image = url
+                    break
+            results[full_name] = image
+            self._cache_set(f"repo:{full_name.lower()}", image, self.ttl if image else self.negative_ttl)
+        return results
+
+    def stats(self) -> dict:
+        """Returns cache and probe counters."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'probes': self.probes,
+                'entries': len(self._cache)
+            }
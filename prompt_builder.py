@@ -0,0 +1,78 @@
+# prompt_builder.py
+import json
+import threading
+from typing import List
+
+from context_builder import ContextBuilder, estimate_tokens
+from metrics import PROMPT_PREFIX_TOKENS
+from stream_parsing import FILE_BLOCK_END, FILE_BLOCK_START
+
+FILE_SYSTEM_PROMPT = "You are a helpful code generator."
+
+FILE_PROMPT_SUFFIX = (
+    "Generate the clean content for the file \"{file_path}\". "
+    "Do not include any markdown formatting, code block tags, or additional explanations. "
+    "Output only the raw file content."
+)
+
+BATCH_PROMPT_SUFFIX = (
+    "Generate the clean content for each of these files: {file_paths}. "
+    "Output every file as a line \"" + FILE_BLOCK_START.format(path="<path>") + "\", then its raw content, "
+    "then a line \"" + FILE_BLOCK_END + "\". "
+    "Do not include any markdown formatting, code block tags, or additional explanations. "
+    "Output only the file blocks."
+)
+
+
+class ProjectPrompt:
+    """
+    The file prompts of one project, assembled around a prefix built once.
+
+    Every file prompt starts with the same text: the preamble, the user
+    request and the directory tree. It is serialized once per project rather
+    than once per file, and sections are ordered from the most to the least
+    shared (project prefix, related files in tree order, target path) so the
+    prompts share the longest possible prefix. Providers with automatic
+    prompt caching only reprocess what follows the cached prefix.
+    """
+
+    def __init__(self, user_request: str, directory_tree: List[str]):
+        header = ContextBuilder.header(user_request, directory_tree)
+        self.header_tokens = sum(estimate_tokens(part) for part in header)
+        self.header = "\n\n".join(header)
+        self.prefix = "Based on the following context:\n" + self.header
+        self.prefix_tokens = estimate_tokens(self.prefix)
+        self.prompts = 0
+        self._lock = threading.Lock()
+
+    def context(self, sections: List[str]) -> str:
+        """Returns the context of a file: the header then the given sections."""
+        return "\n\n".join([self.header, *sections])
+
+    def file_prompt(self, file_path: str, sections: List[str]) -> str:
+        """
+        Returns the prompt generating file_path with the given context sections
+        after the shared prefix.
+        """
+        return self._prompt(sections, FILE_PROMPT_SUFFIX.format(file_path=file_path))
+
+    def batch_prompt(self, file_paths: List[str], sections: List[str]) -> str:
+        """
+        Returns the prompt generating all of file_paths in one response, as
+        blocks delimited by FILE_BLOCK_START and FILE_BLOCK_END lines.
+        """
+        return self._prompt(sections, BATCH_PROMPT_SUFFIX.format(file_paths=json.dumps(file_paths)))
+
+    def _prompt(self, sections: List[str], suffix: str) -> str:
+        with self._lock:
+            self.prompts += 1
+            reused = self.prompts > 1
+        if reused:
+            PROMPT_PREFIX_TOKENS.inc(self.prefix_tokens)
+        parts = [self.prefix]
+        for section in sections:
+            parts.append("\n\n")
+            parts.append(section)
+        parts.append("\n\n")
+        parts.append(suffix)
+        return "".join(parts)
@@ -0,0 +1,366 @@
+# repo_index.py
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import requests
+
+from github_handler import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join('data', 'repositories.sqlite3')
+GITHUB_API_URL = "https://api.github.com"
+
+# Frontend sort options mapped to index columns and directions
+SORT_COLUMNS = {
+    'recent': ('repositories.created_at', 'DESC'),
+    'name': ('repositories.full_name COLLATE NOCASE', 'ASC'),
+    'rating': ('repositories.stars', 'DESC'),  # Using stars as a proxy for rating
+    'stars': ('repositories.stars', 'DESC'),
+}
+
+# Sort option that orders search results by full-text relevance
+SORT_RELEVANCE = 'relevance'
+
+# bm25 weights of the full-text columns: name, description, language, prompt
+SEARCH_COLUMN_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+
+def _github_timestamp(value) -> Optional[str]:
+    """Normalizes a datetime or GitHub timestamp string to the GitHub ISO format."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return value
+
+
+class RepositoryIndex:
+    """
+    Local SQLite index of the user's GitHub repositories.
+
+    The listing endpoint reads sorting, searching and pagination from this
+    index instead of walking the GitHub API on every request. refresh() keeps
+    it up to date with conditional requests that only fetch repositories
+    updated since the last sync.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, token: Optional[str] = None,
+                 username: Optional[str] = None, api_url: Optional[str] = None):
+        self.db_path = db_path
+        self.token = token or os.getenv('GITHUB_TOKEN')
+        self.username = username or os.getenv('GITHUB_USERNAME')
+        self.api_url = (api_url or os.getenv('GITHUB_API_URL', GITHUB_API_URL)).rstrip('/')
+        self._local = threading.local()
+        self._session = requests.Session()  # Keeps the connection to the API open between refreshes
+        self._refresh_lock = threading.Lock()
+        self._refresher = None
+        self._stopped = threading.Event()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS repositories (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                full_name TEXT NOT NULL,
+                html_url TEXT NOT NULL,
+                description TEXT,
+                language TEXT,
+                stars INTEGER NOT NULL DEFAULT 0,
+                forks INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT,
+                updated_at TEXT,
+                prompt TEXT
+            )
+        """)
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(repositories)")}
+        if 'prompt' not in columns:
+            conn.execute("ALTER TABLE repositories ADD COLUMN prompt TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS repositories_created ON repositories (created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS repositories_name ON repositories (full_name COLLATE NOCASE)")
+        conn.execute("CREATE INDEX IF NOT EXISTS repositories_stars ON repositories (stars)")
+        conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+        self._create_search_index(conn)
+
+    def _create_search_index(self, conn: sqlite3.Connection):
+        """
+        Creates the FTS5 index over name, description, language and prompt,
+        kept in sync with the repositories table by triggers.
+        """
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'repositories_fts'"
+        ).fetchone()
+        if exists:
+            return
+        conn.execute("""
+            CREATE VIRTUAL TABLE repositories_fts USING fts5(
+                name, description, language, prompt,
+                content='repositories', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        conn.execute("""
+            CREATE TRIGGER repositories_fts_insert AFTER INSERT ON repositories BEGIN
+                INSERT INTO repositories_fts (rowid, name, description, language, prompt)
+                VALUES (new.id, new.name, new.description, new.language, new.prompt);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER repositories_fts_delete AFTER DELETE ON repositories BEGIN
+                INSERT INTO repositories_fts (repositories_fts, rowid, name, description, language, prompt)
+                VALUES ('delete', old.id, old.name, old.description, old.language, old.prompt);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER repositories_fts_update AFTER UPDATE ON repositories BEGIN
+                INSERT INTO repositories_fts (repositories_fts, rowid, name, description, language, prompt)
+                VALUES ('delete', old.id, old.name, old.description, old.language, old.prompt);
+                INSERT INTO repositories_fts (rowid, name, description, language, prompt)
+                VALUES (new.id, new.name, new.description, new.language, new.prompt);
+            END
+        """)
+        # Index the repositories stored before the search index existed
+        conn.execute("INSERT INTO repositories_fts (repositories_fts) VALUES ('rebuild')")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def _set_state(self, key: str, value: Optional[str]):
+        self._connect().execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    def has_synced(self) -> bool:
+        """Returns True once the index has been filled from GitHub at least once."""
+        return self._get_state('last_full_sync') is not None
+
+    def upsert(self, repos: List[dict]):
+        """
+        Inserts or updates repositories given in the GitHub REST API format.
+        An optional 'prompt' key stores the prompt the repository was generated
+        from; repositories without one keep their stored prompt.
+        """
+        rows = [(
+            repo['id'], repo['name'], repo['full_name'], repo['html_url'], repo.get('description'),
+            repo.get('language'), repo.get('stargazers_count', 0), repo.get('forks_count', 0),
+            _github_timestamp(repo.get('created_at')), _github_timestamp(repo.get('updated_at')),
+            repo.get('prompt')
+        ) for repo in repos]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("""
+                INSERT INTO repositories
+                    (id, name, full_name, html_url, description, language, stars, forks,
+                     created_at, updated_at, prompt)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    name = excluded.name, full_name = excluded.full_name, html_url = excluded.html_url,
+                    description = excluded.description, language = excluded.language,
+                    stars = excluded.stars, forks = excluded.forks,
+                    created_at = excluded.created_at, updated_at = excluded.updated_at,
+                    prompt = COALESCE(excluded.prompt, repositories.prompt)
+            """, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add_repository_info(self, repo_info: dict, prompt: Optional[str] = None):
+        """
+        Adds a repository described by GitHubHandler.get_repository_info,
+        along with the prompt it was generated from.
+        """
+        self.upsert([{
+            'id': repo_info['id'],
+            'name': repo_info['name'],
+            'full_name': repo_info['full_name'],
+            'html_url': repo_info['url'],
+            'description': repo_info['description'],
+            'language': repo_info.get('language'),
+            'stargazers_count': repo_info['stars'],
+            'forks_count': repo_info.get('forks', 0),
+            'created_at': repo_info['created_at'],
+            'updated_at': repo_info['updated_at'],
+            'prompt': prompt
+        }])
+
+    @staticmethod
+    def _match_expression(search: str) -> Optional[str]:
+        """
+        Turns a search string into an FTS5 query where every word must match
+        the start of a word in the indexed columns.
+        """
+        words = re.findall(r'\w+', search.lower())
+        if not words:
+            return None
+        return " ".join(f'"{word}"*' for word in words)
+
+    def query(self, page: int = 1, per_page: int = 50, sort: str = 'recent', search: str = '') -> dict:
+        """
+        Lists indexed repositories in the format returned by GitHubHandler.get_all_repositories.
+
+        Args:
+            page: Page number, starting at 1
+            per_page: Number of repositories per page
+            sort: One of the SORT_COLUMNS keys, or 'relevance' to rank search results
+            search: Only include repositories whose name, description, language
+                or prompt contain words starting with each word of this text
+
+        Returns:
+            dict: The repositories of the page, the total number of matches and pages, and the current page
+        """
+        match = self._match_expression(search) if search else None
+        offset = max(page - 1, 0) * per_page
+        conn = self._connect()
+
+        if match:
+            if sort == SORT_RELEVANCE or sort not in SORT_COLUMNS:
+                weights = ", ".join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+                order = f"bm25(repositories_fts, {weights})"
+            else:
+                order = " ".join(SORT_COLUMNS[sort])
+            total = conn.execute(
+                "SELECT COUNT(*) FROM repositories_fts WHERE repositories_fts MATCH ?", (match,)
+            ).fetchone()[0]
+            rows = conn.execute(f"""
+                SELECT repositories.* FROM repositories_fts
+                JOIN repositories ON repositories.id = repositories_fts.rowid
+                WHERE repositories_fts MATCH ?
+                ORDER BY {order}, repositories.id DESC LIMIT ? OFFSET ?
+            """, (match, per_page, offset)).fetchall()
+        else:
+            column, direction = SORT_COLUMNS.get(sort, SORT_COLUMNS['recent'])
+            total = conn.execute("SELECT COUNT(*) FROM repositories").fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM repositories ORDER BY {column} {direction}, id DESC LIMIT ? OFFSET ?",
+                (per_page, offset)
+            ).fetchall()
+
+        return {
+            'repositories': [self._to_listing(row) for row in rows],
+            'total_pages': (total + per_page - 1) // per_page,
+            'current_page': page,
+            'total': total
+        }
+
+    @staticmethod
+    def _to_listing(row: sqlite3.Row) -> dict:
+        created_at = datetime.fromisoformat(row['created_at'].rstrip('Z')) if row['created_at'] else None
+        return {
+            'repo_name': row['name'],
+            'repo_url': row['html_url'],
+            'repo_timestamp': created_at.strftime('%B %d, %Y') if created_at else None,
+            'repo_id': row['id'],
+            'link_preview': {
+                'title': row['full_name'],
+                'description': row['description'] or "No description available.",
+                'image': f"https://opengraph.githubassets.com/1/{row['full_name']}",
+                'stars': row['stars'],
+                'language': row['language'],
+                'forks': row['forks']
+            }
+        }
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Fetches repositories changed on GitHub since the last sync.
+
+        Incremental refreshes pass the newest known updated_at as `since` and
+        the ETag of the previous identical request, so an unchanged account
+        costs a single 304 response. A full refresh lists every repository
+        and removes the ones that no longer exist.
+
+        Returns:
+            int: Number of repositories inserted or updated
+        """
+        with self._refresh_lock:
+            params = {'type': 'owner', 'sort': 'updated', 'direction': 'desc', 'per_page': 100}
+            since = None if full else self._get_state('high_water')
+            if since:
+                params['since'] = since
+
+            headers = {'Accept': 'application/vnd.github.v3+json'}
+            if self.token:
+                headers['Authorization'] = f"token {self.token}"
+            request_key = repr(sorted(params.items()))
+            etag = self._get_state('etag')
+            if etag and self._get_state('etag_request') == request_key:
+                headers['If-None-Match'] = etag
+
+            url, first_page, repos = f"{self.api_url}/user/repos", True, []
+            while url:
+                rate_limiter.acquire()
+                response = self._session.get(url, params=params if first_page else None, headers=headers, timeout=10)
+                rate_limiter.update_from_headers(response.headers)
+                if first_page and response.status_code == 304:
+                    if full:
+                        self._set_state('last_full_sync', str(time.time()))
+                    return 0
+                response.raise_for_status()
+                if first_page:
+                    self._set_state('etag', response.headers.get('ETag'))
+                    self._set_state('etag_request', request_key)
+                    headers.pop('If-None-Match', None)
+                    first_page = False
+                repos.extend(response.json())
+                url = response.links.get('next', {}).get('url')
+
+            if repos:
+                self.upsert(repos)
+                newest = max(repo['updated_at'] for repo in repos)
+                if not since or newest > since:
+                    self._set_state('high_water', newest)
+            if full:
+                conn = self._connect()
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_ids (id INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM seen_ids")
+                conn.executemany("INSERT OR IGNORE INTO seen_ids (id) VALUES (?)", [(repo['id'],) for repo in repos])
+                conn.execute("DELETE FROM repositories WHERE id NOT IN (SELECT id FROM seen_ids)")
+                self._set_state('last_full_sync', str(time.time()))
+            return len(repos)
+
+    def start_background_refresh(self, interval: float = 60, full_sync_interval: float = 3600):
+        """Starts a daemon thread that refreshes the index every interval seconds."""
+        if self._refresher is not None:
+            return
+        self._stopped.clear()
+
+        def run():
+            while not self._stopped.is_set():
+                try:
+                    last_full_sync = float(self._get_state('last_full_sync') or 0)
+                    self.refresh(full=time.time() - last_full_sync >= full_sync_interval)
+                except Exception as e:
+                    logger.error(f"Error refreshing repository index: {str(e)}")
+                self._stopped.wait(interval)
+
+        self._refresher = threading.Thread(target=run, name="repo-index-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop_background_refresh(self):
+        self._stopped.set()
+        if self._refresher is not None:
+            self._refresher.join()
+            self._refresher = None
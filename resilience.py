@@ -0,0 +1,452 @@
+# resilience.py
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Iterator, List, Optional
+
+import httpx
+
+from llm_providers import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+# Exception class names of the SDKs that mean the call may succeed if retried
+RETRYABLE_ERROR_NAMES = {
+    'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError',
+    'ServiceUnavailable', 'DeadlineExceeded', 'ResourceExhausted', 'TooManyRequests',
+}
+
+_CHUNK = 'chunk'
+_END = 'end'
+_ERROR = 'error'
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when a model call misses its deadline."""
+
+
+class ProviderUnavailableError(Exception):
+    """Raised when the circuit breaker of every provider is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Tells whether a failed model call is worth retrying: rate limits (429),
+    server errors (5xx), timeouts and connection errors.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    if not isinstance(status, int):
+        status = getattr(error, 'code', None)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Returns the Retry-After delay sent with a rate limit error, if any."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Stops sending calls to a provider after failure_threshold consecutive
+    retryable failures. After reset_timeout seconds one trial call is let
+    through: it closes the breaker if it succeeds and reopens it otherwise.
+    A trial that never reports back is replaced after another reset_timeout.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Returns True if allow() would let a call through, without taking the trial slot."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return now - self.opened_at >= self.reset_timeout
+            return self._trial_started is None or now - self._trial_started >= self.reset_timeout
+
+    def allow(self) -> bool:
+        """Returns True if a call may be sent, taking the trial slot when half open."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_started = None
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and (
+                self._trial_started is None or now - self._trial_started >= self.reset_timeout
+            ):
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Opening circuit breaker after %d failures", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_started = None
+
+
+class _ProviderHealth:
+    """Circuit breaker, latency samples and counters of one provider."""
+
+    def __init__(self, provider: LLMProvider, breaker: CircuitBreaker, max_samples: int = 200):
+        self.provider = provider
+        self.breaker = breaker
+        self.first_chunk_latencies = deque(maxlen=max_samples)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self.first_chunk_latencies.append(seconds)
+
+    def latency_quantile(self, quantile: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self.first_chunk_latencies) < min_samples:
+                return None
+            samples = sorted(self.first_chunk_latencies)
+        return samples[min(len(samples) - 1, int(quantile * len(samples)))]
+
+
+class _StreamAttempt:
+    """Runs one provider stream on a background thread, posting its chunks to a queue."""
+
+    def __init__(self, health: _ProviderHealth, prompt: str, system: Optional[str], events: queue.Queue):
+        self.health = health
+        self.started = time.monotonic()
+        self._events = events
+        self._cancelled = threading.Event()
+        health.count('calls')
+        thread = threading.Thread(target=self._pump, args=(prompt, system), daemon=True,
+                                  name=f'llm-{health.provider.name}')
+        thread.start()
+
+    def _pump(self, prompt: str, system: Optional[str]):
+        try:
+            stream = self.health.provider.stream(prompt, system=system)
+            try:
+                for chunk in stream:
+                    if self._cancelled.is_set():
+                        return
+                    self._events.put((self, _CHUNK, chunk))
+            finally:
+                stream.close()
+            self._events.put((self, _END, None))
+        except Exception as e:
+            self._events.put((self, _ERROR, e))
+
+    def cancel(self):
+        """Stops forwarding chunks. A blocked SDK call still finishes in the background."""
+        self._cancelled.set()
+
+
+class ResilientProvider(LLMProvider):
+    """
+    Wraps one or more providers with deadlines, retries, hedging, circuit
+    breakers and failover.
+
+    Every call has an overall deadline, a deadline for its first chunk and a
+    maximum gap between chunks. Calls failing with a rate limit, a server
+    error or a timeout before any output was produced are retried with
+    exponential backoff and full jitter, on the next provider whose circuit
+    breaker is closed. With hedging enabled, a second request is sent to
+    another provider (or the same one) when the first chunk takes longer
+    than the hedge_quantile of recent first-chunk latencies, and the first to
+    answer wins. Hedging only applies to stream(); astream() retries and
+    fails over the same way.
+
+    The name and model of the first provider are reported, so response cache
+    keys don't change when fallbacks are configured.
+    """
+
+    def __init__(self, providers: List[LLMProvider], timeout: float = 300, first_chunk_timeout: float = 60,
+                 idle_timeout: float = 60, max_retries: int = 3, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0, hedging: bool = False, hedge_quantile: float = 0.95,
+                 hedge_min_samples: int = 20, breaker_threshold: int = 5, breaker_cooldown: float = 30):
+        """
+        Args:
+            providers: Providers in order of preference, later ones are fallbacks
+            timeout: Seconds a call may take in total, retries included
+            first_chunk_timeout: Seconds to wait for the first chunk of an attempt
+            idle_timeout: Maximum seconds between two chunks
+            max_retries: Retries after the first attempt
+            backoff_base: Delay before the first retry, doubled on each retry
+            backoff_max: Maximum delay between retries
+            hedging: Send a second request when the first chunk is late
+            hedge_quantile: Quantile of recent first-chunk latencies after which a request is hedged
+            hedge_min_samples: Latency samples needed before hedging starts
+            breaker_threshold: Consecutive failures that open the breaker of a provider
+            breaker_cooldown: Seconds before an open breaker lets a trial call through
+        """
+        if not providers:
+            raise ValueError("At least one provider is required")
+        super().__init__(providers[0].api_key, providers[0].model_name)
+        self.name = providers[0].name
+        self.providers = [
+            _ProviderHealth(provider, CircuitBreaker(breaker_threshold, breaker_cooldown))
+            for provider in providers
+        ]
+        self.timeout = timeout
+        self.first_chunk_timeout = first_chunk_timeout
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def _candidates(self, avoid: Optional[_ProviderHealth]) -> List[_ProviderHealth]:
+        """
+        Providers whose breaker would let a call through, the one that just
+        failed last, starting with the first that actually lets it through.
+        Only that provider takes its half-open trial slot; the others keep
+        theirs for a call that is sent to them.
+        """
+        ordered = [health for health in self.providers if health is not avoid]
+        if avoid is not None:
+            ordered.append(avoid)
+        available = [health for health in ordered if health.breaker.available()]
+        for index, health in enumerate(available):
+            # Another call may have taken the trial slot since available()
+            if health.breaker.allow():
+                return available[index:]
+        return []
+
+    def _backoff(self, retry: int, error: BaseException, deadline: float) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** retry)))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return min(delay, max(0.0, deadline - time.monotonic()))
+
+    def _record_failure(self, health: _ProviderHealth, error: BaseException):
+        health.count('failures')
+        if isinstance(error, TimeoutError):
+            health.count('timeouts')
+        if is_retryable(error):
+            health.breaker.record_failure()
+        else:
+            # The provider answered, the request itself was rejected
+            health.breaker.record_success()
+
+    def _first_chunk(self, candidates: List[_ProviderHealth], prompt: str, system: Optional[str],
+                     deadline: float, events: queue.Queue):
+        """
+        Starts an attempt on the first candidate, hedging it if it is late,
+        and returns the attempt that produced output first with that output.
+        """
+        primary = candidates[0]
+        attempts = [_StreamAttempt(primary, prompt, system, events)]
+        first_deadline = min(deadline, attempts[0].started + self.first_chunk_timeout)
+        hedge_at = None
+        if self.hedging:
+            delay = primary.latency_quantile(self.hedge_quantile, self.hedge_min_samples)
+            if delay is not None:
+                hedge_at = attempts[0].started + delay
+        last_error = None
+
+        while attempts:
+            wake = first_deadline if hedge_at is None else min(first_deadline, hedge_at)
+            try:
+                attempt, kind, value = events.get(timeout=max(0.0, wake - time.monotonic()))
+            except queue.Empty:
+                if hedge_at is not None and time.monotonic() < first_deadline:
+                    hedge_at = None
+                    # Prefer another provider, whose latency is independent of the slow one
+                    target = candidates[1] if len(candidates) > 1 and candidates[1].breaker.allow() else primary
+                    attempts.append(_StreamAttempt(target, prompt, system, events))
+                    with self._lock:
+                        self.hedges += 1
+                    continue
+                error = LLMTimeoutError(f"No response within {self.first_chunk_timeout} seconds")
+                for attempt in attempts:
+                    attempt.cancel()
+                    self._record_failure(attempt.health, error)
+                raise error
+
+            if attempt not in attempts:
+                continue
+            if kind == _ERROR:
+                attempts.remove(attempt)
+                self._record_failure(attempt.health, value)
+                last_error = value
+                continue
+
+            for other in attempts:
+                if other is not attempt:
+                    other.cancel()
+            attempt.health.record_latency(time.monotonic() - attempt.started)
+            if attempt is not attempts[0]:
+                with self._lock:
+                    self.hedge_wins += 1
+            return attempt, kind, value
+        raise last_error
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        deadline = time.monotonic() + self.timeout
+        retry = 0
+        avoid = None
+        while True:
+            candidates = self._candidates(avoid)
+            if not candidates:
+                raise ProviderUnavailableError("Every model provider is unavailable, try again later")
+            events = queue.Queue()
+            try:
+                attempt, kind, value = self._first_chunk(candidates, prompt, system, deadline, events)
+                break
+            except Exception as e:
+                if not is_retryable(e) or retry >= self.max_retries or time.monotonic() >= deadline:
+                    raise
+                avoid = candidates[0]
+                delay = self._backoff(retry, e, deadline)
+                logger.warning(f"Model call to {avoid.provider.name} failed ({str(e)}), retrying in {delay:.1f}s")
+                retry += 1
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+
+        # Output has been produced: from here on failures are not retried
+        try:
+            while kind == _CHUNK:
+                yield value
+                try:
+                    timeout = min(self.idle_timeout, deadline - time.monotonic())
+                    while True:
+                        event_attempt, kind, value = events.get(timeout=max(0.0, timeout))
+                        if event_attempt is attempt:
+                            break
+                except queue.Empty:
+                    error = LLMTimeoutError("The model stopped responding")
+                    self._record_failure(attempt.health, error)
+                    raise error
+        finally:
+            attempt.cancel()
+        if kind == _ERROR:
+            self._record_failure(attempt.health, value)
+            raise value
+        attempt.health.breaker.record_success()
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        deadline = time.monotonic() + self.timeout
+        retry = 0
+        avoid = None
+        while True:
+            candidates = self._candidates(avoid)
+            if not candidates:
+                raise ProviderUnavailableError("Every model provider is unavailable, try again later")
+            health = candidates[0]
+            health.count('calls')
+            chunks = health.provider.astream(prompt, system=system)
+            started = time.monotonic()
+            try:
+                timeout = min(self.first_chunk_timeout, deadline - started)
+                try:
+                    first = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, timeout))
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError(f"No response within {self.first_chunk_timeout} seconds")
+                health.record_latency(time.monotonic() - started)
+                break
+            except StopAsyncIteration:
+                health.breaker.record_success()
+                return
+            except Exception as e:
+                await chunks.aclose()
+                self._record_failure(health, e)
+                if not is_retryable(e) or retry >= self.max_retries or time.monotonic() >= deadline:
+                    raise
+                avoid = health
+                retry += 1
+                with self._lock:
+                    self.retries += 1
+                await asyncio.sleep(self._backoff(retry - 1, e, deadline))
+
+        yield first
+        try:
+            while True:
+                timeout = min(self.idle_timeout, deadline - time.monotonic())
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, timeout))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise LLMTimeoutError("The model stopped responding")
+                yield chunk
+        except Exception as e:
+            self._record_failure(health, e)
+            raise
+        finally:
+            await chunks.aclose()
+        health.breaker.record_success()
+
+    def stats(self) -> dict:
+        """Returns retry and hedging counters and the health of each provider."""
+        return {
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'providers': [
+                {
+                    'name': health.provider.name,
+                    'model': health.provider.model_name,
+                    'breaker': health.breaker.state,
+                    'calls': health.calls,
+                    'failures': health.failures,
+                    'timeouts': health.timeouts,
+                    'first_chunk_p95': health.latency_quantile(0.95, 1),
+                }
+                for health in self.providers
+            ]
+        }
+
+    def close(self):
+        for health in self.providers:
+            health.provider.close()
@@ -0,0 +1,236 @@
+# response_cache.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+from llm_providers import LLMProvider
+from metrics import stage, LLM_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join('data', 'llm_cache')
+
+
+class ResponseCache:
+    """
+    Two-tier cache for model responses, keyed by a hash of the provider,
+    model and full prompt.
+
+    The first tier is an in-memory LRU of max_entries responses. The second
+    tier stores one JSON file per response in cache_dir, evicting the least
+    recently used files once the directory grows past max_disk_bytes. Entries
+    older than ttl seconds are ignored and removed by both tiers.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, max_entries: int = 256,
+                 max_disk_bytes: int = 256 * 1024 * 1024, ttl: float = 24 * 60 * 60):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (created_at, response)
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @staticmethod
+    def make_key(provider_name: str, model_name: str, prompt: str, system: Optional[str] = None) -> str:
+        """Returns the content address of a model call."""
+        payload = json.dumps([provider_name, model_name, system or "", prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response for key, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._memory[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry[1]
+
+    def set(self, key: str, response: str):
+        """Stores a response in both tiers."""
+        entry = (time.time(), response)
+        with self._lock:
+            self._remember(key, entry)
+        if self.cache_dir:
+            self._write_disk(key, entry)
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or 'created_at' not in data or 'response' not in data:
+            return None
+
+        if self._expired(data['created_at']):
+            self._remove_disk(path)
+            return None
+        try:
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return data['created_at'], data['response']
+
+    def _write_disk(self, key: str, entry: tuple):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'created_at': entry[0], 'response': entry[1]}, f)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += os.path.getsize(path) - previous_size
+                over_limit = self._disk_bytes > self.max_disk_bytes
+            if over_limit:
+                self._evict_disk()
+        except OSError as e:
+            logger.error(f"Error writing cache entry: {str(e)}")
+
+    def _disk_entries(self):
+        """Yields (path, size, mtime) for every cached response on disk."""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _remove_disk(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """Removes expired files, then the least recently used ones, until under max_disk_bytes."""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for path, size, mtime in entries:
+            expired = self.ttl is not None and now - mtime > self.ttl
+            if not expired and total <= self.max_disk_bytes:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters and the size of both tiers."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_bytes': self._disk_bytes
+            }
+
+
+class CachedProvider(LLMProvider):
+    """
+    Wraps a provider so identical calls are answered from a ResponseCache.
+    Only complete, non-empty responses are stored.
+    """
+
+    def __init__(self, provider: LLMProvider, cache: ResponseCache):
+        super().__init__(provider.api_key, provider.model_name)
+        self.provider = provider
+        self.cache = cache
+        self.name = provider.name
+
+    def _lookup(self, prompt: str, system: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Returns the cache key of a call and the cached response, if any."""
+        key = self.cache.make_key(self.name, self.model_name, prompt, system)
+        with stage('cache_lookup') as span:
+            cached = self.cache.get(key)
+            span['hit'] = cached is not None
+        LLM_CACHE_REQUESTS.inc(result='hit' if cached is not None else 'miss')
+        return key, cached
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        key, cached = self._lookup(prompt, system)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        for chunk in self.provider.stream(prompt, system=system):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self.cache.set(key, "".join(chunks))
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        key, cached = self._lookup(prompt, system)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        async for chunk in self.provider.astream(prompt, system=system):
+            chunks.append(chunk)
+            yield chunk
+        if chunks:
+            self.cache.set(key, "".join(chunks))
+
+    def close(self):
+        self.provider.close()
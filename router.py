@@ -0,0 +1,241 @@
+# router.py
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from llm_providers import LLMProvider
+from resilience import CircuitBreaker, LLMTimeoutError, ProviderUnavailableError, is_retryable
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the moving averages of latency and error rate
+EWMA_ALPHA = 0.2
+
+# Cost multiplier applied per unit of recent error rate
+ERROR_PENALTY = 4.0
+
+
+class RouteTarget:
+    """
+    One provider and API key the router can send calls to, with its limits
+    and the live statistics used to rank it.
+    """
+
+    def __init__(self, provider: LLMProvider, key_id: str, max_concurrency: Optional[int] = None,
+                 requests_per_minute: Optional[int] = None, weight: float = 1.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Args:
+            provider: Provider holding the API key
+            key_id: Short identifier of the key shown in metrics, never the key itself
+            max_concurrency: Maximum calls in flight on this key
+            requests_per_minute: Quota of the key, None for no quota
+            weight: Relative capacity, a target with twice the weight gets about twice the calls
+            breaker: Circuit breaker of the key
+        """
+        self.provider = provider
+        self.key_id = key_id
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.weight = weight
+        self.breaker = breaker or CircuitBreaker()
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.latency = None  # Moving average of the time to first chunk, in seconds
+        self.error_rate = 0.0  # Moving average of failed calls
+        self.recent_requests = deque()  # Start times of the calls of the last minute
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    def quota_remaining(self, now: float) -> Optional[int]:
+        if self.requests_per_minute is None:
+            return None
+        while self.recent_requests and now - self.recent_requests[0] >= 60:
+            self.recent_requests.popleft()
+        return self.requests_per_minute - len(self.recent_requests)
+
+
+class ProviderRouter(LLMProvider):
+    """
+    Spreads model calls over several providers and API keys.
+
+    Each call goes to the target with the lowest expected cost, a weighted
+    least-outstanding-requests score: (calls in flight + 1) times the moving
+    average time to first chunk, divided by the target weight and raised by
+    its recent error rate and by how much of its quota is used. Targets at
+    their concurrency limit, out of quota or with an open circuit breaker are
+    skipped; when none is usable the call waits for a slot. Ties go to the
+    target listed first, so routing is deterministic for a given history.
+
+    The name and model of the first target are reported, so response cache
+    keys don't depend on which target served a call.
+    """
+
+    def __init__(self, targets: List[RouteTarget], provider_limits: Optional[Dict[str, int]] = None,
+                 acquire_timeout: float = 60):
+        """
+        Args:
+            targets: Providers and keys to route between
+            provider_limits: Maximum calls in flight per provider name, across its keys
+            acquire_timeout: Seconds a call waits for a usable target before failing
+        """
+        if not targets:
+            raise ValueError("At least one route target is required")
+        super().__init__(targets[0].provider.api_key, targets[0].provider.model_name)
+        self.name = targets[0].name
+        self.targets = targets
+        self.provider_limits = provider_limits or {}
+        self.acquire_timeout = acquire_timeout
+        self.waits = 0
+        self._condition = threading.Condition()
+
+    def _cost(self, target: RouteTarget, now: float, default_latency: float) -> float:
+        latency = target.latency if target.latency is not None else default_latency
+        cost = (target.outstanding + 1) * latency / target.weight
+        cost *= 1 + ERROR_PENALTY * target.error_rate
+        remaining = target.quota_remaining(now)
+        if remaining is not None:
+            cost *= 2 - remaining / target.requests_per_minute
+        return cost
+
+    def _usable(self, target: RouteTarget, now: float, in_flight: Dict[str, int]) -> bool:
+        if target.max_concurrency is not None and target.outstanding >= target.max_concurrency:
+            return False
+        limit = self.provider_limits.get(target.name)
+        if limit is not None and in_flight.get(target.name, 0) >= limit:
+            return False
+        remaining = target.quota_remaining(now)
+        if remaining is not None and remaining <= 0:
+            return False
+        return target.breaker.available()
+
+    def _acquire(self) -> RouteTarget:
+        """Picks the target of a call and reserves a slot on it, waiting if every target is busy."""
+        give_up_at = time.monotonic() + self.acquire_timeout
+        waited = False
+        with self._condition:
+            while True:
+                if not any(target.breaker.available() for target in self.targets):
+                    raise ProviderUnavailableError("Every model provider is unavailable, try again later")
+
+                now = time.monotonic()
+                in_flight = {}
+                for target in self.targets:
+                    in_flight[target.name] = in_flight.get(target.name, 0) + target.outstanding
+                measured = [target.latency for target in self.targets if target.latency is not None]
+                default_latency = sum(measured) / len(measured) if measured else 1.0
+
+                usable = [target for target in self.targets if self._usable(target, now, in_flight)]
+                for target in sorted(usable, key=lambda target: self._cost(target, now, default_latency)):
+                    if target.breaker.allow():
+                        target.outstanding += 1
+                        target.calls += 1
+                        if target.requests_per_minute is not None:
+                            target.recent_requests.append(now)
+                        return target
+
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                timeout = give_up_at - time.monotonic()
+                if timeout <= 0:
+                    raise LLMTimeoutError("No model provider had a free slot in time")
+                # Woken when a call finishes; quota windows free up on their own
+                self._condition.wait(min(timeout, 1.0))
+
+    def _release(self, target: RouteTarget, first_chunk: Optional[float], error: Optional[BaseException],
+                 abandoned: bool = False):
+        """
+        Frees the slot of a finished call and records its outcome. A call the
+        caller abandoned, by closing or cancelling the stream, proves nothing
+        about the target and counts as neither a success nor a failure.
+        """
+        with self._condition:
+            target.outstanding -= 1
+            if abandoned:
+                self._condition.notify_all()
+                return
+            if first_chunk is not None:
+                target.latency = first_chunk if target.latency is None else (
+                    EWMA_ALPHA * first_chunk + (1 - EWMA_ALPHA) * target.latency
+                )
+            failed = 1.0 if error is not None and is_retryable(error) else 0.0
+            target.error_rate = EWMA_ALPHA * failed + (1 - EWMA_ALPHA) * target.error_rate
+            if error is not None:
+                target.errors += 1
+            self._condition.notify_all()
+        if error is None or not is_retryable(error):
+            target.breaker.record_success()
+        else:
+            target.breaker.record_failure()
+
+    def stream(self, prompt: str, system: Optional[str] = None) -> Iterator[str]:
+        target = self._acquire()
+        started = time.monotonic()
+        first_chunk = None
+        error = None
+        finished = False
+        try:
+            for chunk in target.provider.stream(prompt, system=system):
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                yield chunk
+            finished = True
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(target, first_chunk, error, abandoned=error is None and not finished)
+
+    async def astream(self, prompt: str, system: Optional[str] = None) -> AsyncIterator[str]:
+        # Reserving a slot may wait for another call to finish
+        target = await asyncio.get_running_loop().run_in_executor(None, self._acquire)
+        started = time.monotonic()
+        first_chunk = None
+        error = None
+        finished = False
+        try:
+            async for chunk in target.provider.astream(prompt, system=system):
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                yield chunk
+            finished = True
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(target, first_chunk, error, abandoned=error is None and not finished)
+
+    def stats(self) -> dict:
+        """Returns the routing state and counters of every target."""
+        with self._condition:
+            now = time.monotonic()
+            return {
+                'waits': self.waits,
+                'targets': [
+                    {
+                        'name': target.name,
+                        'model': target.provider.model_name,
+                        'key': target.key_id,
+                        'outstanding': target.outstanding,
+                        'max_concurrency': target.max_concurrency,
+                        'calls': target.calls,
+                        'errors': target.errors,
+                        'error_rate': round(target.error_rate, 4),
+                        'latency': target.latency,
+                        'quota_remaining': target.quota_remaining(now),
+                        'breaker': target.breaker.state,
+                    }
+                    for target in self.targets
+                ]
+            }
+
+    def close(self):
+        for target in self.targets:
+            target.provider.close()
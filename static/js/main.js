@@ -8,6 +8,9 @@ const successModal = document.getElementById('success-modal');
 const closeModalButton = document.getElementById('close-modal');
 const repoLink = document.getElementById('repo-link');
 const generateButton = document.getElementById('generateAppButton');
+const generationProgress = document.getElementById('generation-progress');
+const generationFiles = document.getElementById('generation-files');
+const JOB_POLL_INTERVAL = 2000;
 
 // Debounce function for search
 function debounce(func, wait) {
@@ -31,6 +34,11 @@ class RepositoryManager {
         this.currentPage = 1;
         this.totalPages = 1;
         this.isLoadingMore = false;
+        this.pendingPreviews = new Map();
+        this.previewTimer = null;
+        this.previewObserver = window.IntersectionObserver ?
+            new IntersectionObserver(entries => this.queueVisiblePreviews(entries), { rootMargin: '200px' }) :
+            null;
     }
 
     async loadRepositories(page = 1, searchTerm = '', sortMethod = 'recent', shouldReplace = true) {
@@ -49,6 +57,8 @@ class RepositoryManager {
 
             // Reset grid when loading new data set
             if (shouldReplace || page === 1) {
+                if (this.previewObserver) this.previewObserver.disconnect();
+                this.pendingPreviews.clear();
                 repoGrid.innerHTML = '';
                 this.repositories = [];
             }
@@ -134,10 +144,92 @@ class RepositoryManager {
         return article;
     }
 
+    // Resolve a card's preview image once it scrolls near the viewport.
+    // Without IntersectionObserver the card keeps its default image.
+    observePreview(repoElement, repo) {
+        if (!this.previewObserver) return;
+        repoElement.previewRequest = {
+            full_name: repo.link_preview.title,
+            repo_id: repo.repo_id
+        };
+        this.previewObserver.observe(repoElement);
+    }
+
+    // Collect the cards that became visible and resolve them together
+    // shortly after, so a scroll costs one request rather than one per card
+    queueVisiblePreviews(entries) {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            this.previewObserver.unobserve(entry.target);
+            this.pendingPreviews.set(entry.target.previewRequest.full_name, entry.target);
+        });
+        if (this.pendingPreviews.size && !this.previewTimer) {
+            this.previewTimer = setTimeout(() => {
+                this.previewTimer = null;
+                this.resolvePreviews();
+            }, 100);
+        }
+    }
+
+    // Replace the default preview images of the queued cards with the best
+    // image the server finds
+    async resolvePreviews() {
+        const cards = new Map(this.pendingPreviews);
+        this.pendingPreviews.clear();
+        if (!cards.size) return;
+        try {
+            const response = await fetch('/api/previews', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    repositories: Array.from(cards.values()).map(card => card.previewRequest)
+                }),
+            });
+            if (!response.ok) return;
+            const { previews } = await response.json();
+
+            cards.forEach((card, fullName) => {
+                const image = previews[fullName];
+                const img = card.querySelector('img');
+                if (image && img && img.src !== image) img.src = image;
+            });
+        } catch (error) {
+            console.error('Preview resolution failed:', error);
+        }
+    }
+
+    updateNoResultsMessage(show) {
+        let message = document.getElementById('no-results');
+        if (!message) {
+            message = document.createElement('div');
+            message.id = 'no-results';
+            message.className = 'col-span-full py-8 text-center text-gray-500 hidden';
+            message.textContent = 'No repositories found matching your search.';
+            repoGrid.appendChild(message);
+        }
+        message.classList.toggle('hidden', !show);
+    }
+
+    filter(searchTerm) {
+        this.currentFilter = searchTerm.trim();
+        this.loadRepositories(1, this.currentFilter, this.currentSort, true);
+    }
+
+    sort(sortMethod) {
+        this.currentSort = sortMethod;
+        this.loadRepositories(1, this.currentFilter, this.currentSort, true);
+    }
+
+    loadMore() {
+        if (this.currentPage >= this.totalPages) return;
+        this.loadRepositories(this.currentPage + 1, this.currentFilter, this.currentSort, false);
+    }
+
     appendRepositories(repositoriesData) {
         repositoriesData.forEach(repoData => {
             const repoElement = this.createRepositoryElement(repoData);
             repoGrid.appendChild(repoElement);
+            this.observePreview(repoElement, repoData);
             this.repositories.push(repoElement);
         });
     }
@@ -222,12 +314,16 @@ generateForm.addEventListener('submit', async (e) => {
             throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
         }
 
-        const repoData = await response.json();
+        const job = await response.json();
+        const repoData = window.EventSource ?
+            await streamJob(job) :
+            await waitForJob(job.status_url);
 
         repoLink.href = repoData.repo_url;
         repoLink.textContent = repoData.repo_url;
 
         loadingOverlay.style.display = 'none';
+        resetGenerationProgress();
         successModal.style.display = 'flex';
 
         // Refresh the repository grid
@@ -236,6 +332,7 @@ generateForm.addEventListener('submit', async (e) => {
     } catch (error) {
         console.error('Error generating application:', error);
         loadingOverlay.style.display = 'none';
+        resetGenerationProgress();
         document.body.style.overflow = 'auto';
         showErrorModal("Uh oh! We encountered an error while generating your application. Please try again later.");
     } finally {
@@ -243,6 +340,94 @@ generateForm.addEventListener('submit', async (e) => {
     }
 });
 
+// Follow a generation job through Server-Sent Events and return its result.
+// Falls back to polling if the event stream cannot be kept open.
+function streamJob(job) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(job.events_url);
+        let doneCount = 0;
+
+        source.addEventListener('tree_ready', (e) => {
+            const data = JSON.parse(e.data);
+            generationProgress.textContent = `Generating ${data.files.length} files for ${data.repo_name}`;
+            generationFiles.innerHTML = '';
+            data.files.forEach(filePath => renderGenerationFile(filePath, 'pending'));
+        });
+        source.addEventListener('file_started', (e) => {
+            const data = JSON.parse(e.data);
+            renderGenerationFile(data.file_path, 'generating');
+        });
+        source.addEventListener('file_done', (e) => {
+            const data = JSON.parse(e.data);
+            doneCount += 1;
+            renderGenerationFile(data.file_path, `${data.size} bytes`);
+            generationProgress.textContent = `${doneCount} of ${data.total} files generated`;
+        });
+        source.addEventListener('push_started', () => {
+            generationProgress.textContent = 'Pushing the repository to GitHub...';
+        });
+        source.addEventListener('repo_created', (e) => {
+            generationProgress.textContent = `Repository created: ${JSON.parse(e.data).repo_url}`;
+        });
+        source.addEventListener('completed', (e) => {
+            source.close();
+            resolve(JSON.parse(e.data).result);
+        });
+        source.addEventListener('failed', (e) => {
+            source.close();
+            reject(new Error(JSON.parse(e.data).error || 'Generation failed'));
+        });
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                waitForJob(job.status_url).then(resolve, reject);
+            }
+        };
+    });
+}
+
+function renderGenerationFile(filePath, status) {
+    let item = Array.from(generationFiles.children).find(el => el.dataset.path === filePath);
+    if (!item) {
+        item = document.createElement('li');
+        item.dataset.path = filePath;
+        generationFiles.appendChild(item);
+    }
+    item.textContent = `${filePath} — ${status}`;
+}
+
+function resetGenerationProgress() {
+    generationProgress.textContent = '';
+    generationFiles.innerHTML = '';
+}
+
+// Poll a generation job until it finishes and return its result
+async function waitForJob(statusUrl) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+
+        const response = await fetch(statusUrl);
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        const job = await response.json();
+
+        if (job.status === 'completed') return job.result;
+        if (job.status === 'failed') throw new Error(job.error || 'Generation failed');
+
+        updateGenerationProgress(job);
+    }
+}
+
+function updateGenerationProgress(job) {
+    if (job.status === 'queued') {
+        generationProgress.textContent = `Waiting in queue (position ${job.queue_position + 1})`;
+        return;
+    }
+    const files = Object.values(job.progress.files || {});
+    const done = files.filter(status => status === 'done').length;
+    generationProgress.textContent = files.length ?
+        `${done} of ${files.length} files generated` :
+        'Planning the project structure...';
+}
+
 // New function to display an error modal using a separate errorModal element
 function showErrorModal(message) {
     const errorModal = document.getElementById('error-modal');
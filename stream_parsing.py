@@ -0,0 +1,206 @@
+# stream_parsing.py
+import json
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Trailing commas are the most common JSON mistake of models
+TRAILING_COMMA_PATTERN = re.compile(r',\s*([\]}])')
+
+
+def _parse_object(text: str, required_keys: Iterable[str]) -> Optional[dict]:
+    """Parses text as a JSON object holding required_keys, forgiving trailing commas."""
+    for candidate in (text, TRAILING_COMMA_PATTERN.sub(r'\1', text)):
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict) and all(key in value for key in required_keys):
+            return value
+    return None
+
+
+class JSONObjectExtractor:
+    """
+    Finds a JSON object in a model response while it streams.
+
+    Text around the object, such as markdown fences or explanations, is
+    ignored. The object is returned by feed() as soon as its closing brace
+    arrives, so the caller can act on it before the rest of the response is
+    received. Balanced objects without the required keys, like an example
+    in the explanation, are skipped.
+    """
+
+    def __init__(self, required_keys: Iterable[str] = ()):
+        self.required_keys = tuple(required_keys)
+        self.result = None
+        self._chunks = []  # Everything fed so far, for finish()
+        self._parts = []  # Text of the object being read, across chunks
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Optional[dict]:
+        """
+        Reads the next chunk of the response.
+
+        Returns:
+            dict: The object once it is complete, None until then
+        """
+        if self.result is not None:
+            return self.result
+        self._chunks.append(chunk)
+
+        start = 0
+        for index, char in enumerate(chunk):
+            if self._depth == 0:
+                if char == '{':
+                    self._depth, self._in_string, self._escaped = 1, False, False
+                    self._parts = []
+                    start = index
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(chunk[start:index + 1])
+                    self.result = _parse_object("".join(self._parts), self.required_keys)
+                    self._parts = []
+                    if self.result is not None:
+                        return self.result
+
+        if self._depth > 0:
+            self._parts.append(chunk[start:])
+        return None
+
+    def finish(self) -> Optional[dict]:
+        """
+        Returns the object once the whole response is received, also looking
+        for one after an unbalanced brace in the surrounding text.
+        """
+        if self.result is not None:
+            return self.result
+        text = "".join(self._chunks)
+        decoder = json.JSONDecoder()
+        for match in re.finditer(r'\{', text):
+            try:
+                value, _ = decoder.raw_decode(text, match.start())
+            except json.JSONDecodeError:
+                # Cut at the last closing brace to retry without trailing commas
+                value = _parse_object(text[match.start():text.rfind('}') + 1], self.required_keys)
+            if isinstance(value, dict) and all(key in value for key in self.required_keys):
+                self.result = value
+                return value
+        return None
+
+
+# A markdown fence line, with an optional language tag
+FENCE_LINE_PATTERN = re.compile(r'\s*```[\w+#.-]*\s*')
+
+# Delimiters of the files in a multi-file response
+FILE_BLOCK_START = "=== FILE: {path} ==="
+FILE_BLOCK_END = "=== END FILE ==="
+FILE_BLOCK_START_PATTERN = re.compile(r'\s*=== FILE: (.+?) ===\s*')
+FILE_BLOCK_END_PATTERN = re.compile(r'\s*=== END FILE ===\s*')
+
+
+class FenceStripper:
+    """
+    Removes the markdown fences a model wraps around a file, as the file
+    streams in.
+
+    Complete lines are passed through as soon as they arrive. A fence line
+    is dropped when it opens the file, and held back otherwise: it is kept
+    if more content follows (a code block inside a README, for instance) and
+    dropped if it turns out to close the file. Leading and trailing blank
+    space is removed, and the result ends with a single newline.
+    """
+
+    def __init__(self):
+        self._line = ''  # Incomplete last line
+        self._started = False
+        self._held = []  # Blank and fence lines waiting to know whether content follows
+
+    def _process(self, line: str) -> str:
+        if not self._started:
+            if not line.strip():
+                return ''
+            self._started = True
+            if FENCE_LINE_PATTERN.fullmatch(line):
+                return ''
+            line = line.lstrip()
+        if not line.strip() or FENCE_LINE_PATTERN.fullmatch(line):
+            self._held.append(line)
+            return ''
+        text = "".join(self._held) + line
+        self._held = []
+        return text
+
+    def feed(self, chunk: str) -> str:
+        """Returns the text of chunk that can be written already."""
+        self._line += chunk
+        if '\n' not in self._line:
+            return ''
+        lines = self._line.split('\n')
+        self._line = lines.pop()
+        return "".join(self._process(line + '\n') for line in lines)
+
+    def finish(self) -> str:
+        """Returns the rest of the text once the response is complete."""
+        if self._line.rstrip().endswith('```') and self._line.strip() != '```':
+            # Closing fence on the last line of content
+            self._line = self._line.rstrip()[:-3]
+        text = self._process(self._line + '\n') if self._line else ''
+        self._line = ''
+        self._held = []
+        return text
+
+
+def split_file_blocks(text: str, paths: List[str]) -> Dict[str, str]:
+    """
+    Splits a multi-file response into the content of each file, with the
+    markdown fences around each file removed.
+
+    Files are delimited by a FILE_BLOCK_START line and a FILE_BLOCK_END line;
+    anything outside the blocks is ignored. A block that is never closed or
+    holds a file outside paths is dropped, and so is every block of a file
+    the response holds twice, since either copy may be the wrong one. The
+    files dropped are left for the caller to generate some other way.
+
+    Args:
+        text: The complete response
+        paths: The files the response was asked for
+
+    Returns:
+        dict: path -> content of every complete block
+    """
+    expected = set(paths)
+    files = {}
+    duplicates = set()
+    current = None
+    lines = []
+    for line in text.split('\n'):
+        start = FILE_BLOCK_START_PATTERN.fullmatch(line)
+        if start:
+            path = start.group(1).strip()
+            current = path[2:] if path.startswith('./') else path
+            lines = []  # An unclosed block before it is dropped
+        elif current is not None and FILE_BLOCK_END_PATTERN.fullmatch(line):
+            if current in files:
+                duplicates.add(current)
+            elif current in expected:
+                fences = FenceStripper()
+                files[current] = fences.feed("\n".join(lines) + "\n") + fences.finish()
+            current = None
+        elif current is not None:
+            lines.append(line)
+    return {path: content for path, content in files.items() if path not in duplicates}
@@ -0,0 +1,72 @@
+# tests/test_batch_generate.py
+import threading
+import time
+
+import pytest
+
+from batch_generate import BatchManager, BatchRunningError
+
+
+class BlockingRunner:
+    """Runner that holds every batch until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.runs = []
+
+    def run(self, input_path, output_path):
+        self.runs.append(input_path)
+        self.release.wait(5)
+        return {}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def runner():
+    runner = BlockingRunner()
+    yield runner
+    runner.release.set()
+
+
+def test_other_process_sees_batch_running_and_cannot_resume_it(tmp_path, runner):
+    # Two managers on one directory stand for two server workers
+    first = BatchManager(runner, batches_dir=str(tmp_path), lease_seconds=0.3)
+    second = BatchManager(BlockingRunner(), batches_dir=str(tmp_path), lease_seconds=0.3)
+
+    batch_id = first.create('{"prompt": "a todo app"}\n')
+    time.sleep(0.5)  # Longer than the lease, kept alive by the heartbeat
+    assert second.get_batch(batch_id)['status'] == 'running'
+    with pytest.raises(BatchRunningError):
+        second.start(batch_id)
+
+    runner.release.set()
+    wait_for(lambda: second.get_batch(batch_id)['status'] == 'incomplete')
+    assert len(runner.runs) == 1
+
+
+def test_batch_of_dead_process_can_be_resumed_after_its_lease(tmp_path, runner):
+    manager = BatchManager(runner, batches_dir=str(tmp_path), lease_seconds=0.3)
+    batch_id = 'a' * 32
+    (tmp_path / batch_id).mkdir()
+    (tmp_path / batch_id / 'input.jsonl').write_text('{"prompt": "a todo app"}\n')
+    # Left behind by a process that was killed while running the batch
+    conn = manager._connect()
+    conn.execute("INSERT INTO batch_runs VALUES (?, 'dead-worker', ?)", (batch_id, time.time()))
+    conn.close()
+
+    assert manager.get_batch(batch_id)['status'] == 'running'
+    with pytest.raises(BatchRunningError):
+        manager.start(batch_id)
+
+    time.sleep(0.4)
+    assert manager.get_batch(batch_id)['status'] == 'incomplete'
+    manager.start(batch_id)
+    wait_for(lambda: len(runner.runs) == 1)
+    assert manager.get_batch(batch_id)['status'] == 'running'
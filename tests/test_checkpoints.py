@@ -0,0 +1,105 @@
+# tests/test_checkpoints.py
+import re
+import subprocess
+
+import pytest
+
+import pipeline_benchmark
+from checkpoints import CheckpointStore, PUSH_DONE
+from fake_github import FakeGitHub
+from github_handler import GitHubHandler
+from llm_providers import FakeProvider
+from pipeline import generate_repository
+
+FILE_LIST = pipeline_benchmark.synthetic_file_list(6)
+FAILING_FILE = FILE_LIST[3]
+
+
+@pytest.fixture
+def github(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake_github = FakeGitHub(pipeline_benchmark.USERNAME, str(tmp_path / 'remotes')).start()
+    monkeypatch.setenv('GITHUB_TOKEN', 'token')
+    monkeypatch.setenv('GITHUB_USERNAME', pipeline_benchmark.USERNAME)
+    monkeypatch.setenv('GITHUB_API_URL', fake_github.url)
+    monkeypatch.setenv('GITHUB_GIT_URL', f"file://{tmp_path / 'remotes'}")
+    monkeypatch.setenv('GIT_MIRROR_DIR', '')
+    yield fake_github
+    fake_github.stop()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / 'checkpoints.sqlite3'))
+
+
+def provider(fail=()):
+    """FakeProvider for FILE_LIST whose file prompts for the paths in fail raise."""
+    respond = pipeline_benchmark.mock_responder(FILE_LIST, 'Resumed', 200)
+
+    def responder(prompt):
+        match = re.search(r'the file "(.*?)"', prompt)
+        if match and match.group(1) in fail:
+            raise RuntimeError(f"model failed on {match.group(1)}")
+        return respond(prompt)
+
+    return FakeProvider(responder=responder)
+
+
+def generated_files(fake_provider):
+    return {match.group(1) for match in map(re.compile(r'the file "(.*?)"').search, fake_provider.prompts) if match}
+
+
+def pushed_files(tmp_path, repo_name):
+    remote = tmp_path / 'remotes' / pipeline_benchmark.USERNAME / f'{repo_name}.git'
+    return subprocess.run(['git', '--git-dir', str(remote), 'ls-tree', '-r', '--name-only', 'master'],
+                          check=True, capture_output=True, text=True).stdout.split()
+
+
+def test_retry_after_a_failed_file_generates_only_the_missing_files(tmp_path, github, store):
+    failing = provider(fail={FAILING_FILE})
+    with pytest.raises(RuntimeError):
+        generate_repository("A project", failing, GitHubHandler(), build_mode='memory',
+                            max_workers=1, checkpoint=store.open('job'))
+    assert not github.repos
+
+    saved = store.open('job')
+    assert saved.has_tree
+    assert saved.files and FAILING_FILE not in saved.files
+    missing = set(FILE_LIST + ['README.md']) - set(saved.files)
+
+    retry = provider()
+    result, _ = generate_repository("A project", retry, GitHubHandler(), build_mode='memory',
+                                    max_workers=1, checkpoint=saved)
+    # Neither the tree nor the saved files are asked for again
+    assert not any("Generate a JSON response" in prompt for prompt in retry.prompts)
+    assert generated_files(retry) == missing
+    assert set(FILE_LIST) <= set(pushed_files(tmp_path, result['repo_id']))
+    assert not store.open('job').has_tree
+
+
+def test_retry_after_the_push_only_fetches_the_repository(tmp_path, github, store, monkeypatch):
+    handler = GitHubHandler()
+    get_repository_info = handler.get_repository_info
+
+    def unavailable(repo_name):
+        raise ConnectionError("GitHub is unavailable")
+
+    monkeypatch.setattr(handler, 'get_repository_info', unavailable)
+    with pytest.raises(ConnectionError):
+        generate_repository("A project", provider(), handler, build_mode='memory', checkpoint=store.open('job'))
+    saved = store.open('job')
+    assert saved.push_state == PUSH_DONE
+    assert list(github.repos) == [saved.repo_name]
+
+    monkeypatch.setattr(handler, 'get_repository_info', get_repository_info)
+    retry = provider()
+    result, _ = generate_repository("A project", retry, handler, build_mode='memory', checkpoint=saved)
+    assert retry.prompts == []
+    assert result['repo_id'] == saved.repo_name
+    assert list(github.repos) == [saved.repo_name]
+    remote = tmp_path / 'remotes' / pipeline_benchmark.USERNAME / f'{saved.repo_name}.git'
+    commits = subprocess.run(['git', '--git-dir', str(remote), 'rev-list', '--count', 'master'],
+                             check=True, capture_output=True, text=True).stdout
+    assert commits.strip() == '1'
+    assert not store.open('job').has_tree
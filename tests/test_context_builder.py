@@ -0,0 +1,47 @@
+# tests/test_context_builder.py
+from context_builder import ContextBuilder, FileDigest, estimate_tokens
+
+
+def body(lines):
+    return "".join(f"value_{index} = compute({index})\n" for index in range(lines))
+
+
+def full_tokens(path, content):
+    return estimate_tokens(f"Content of {path}:\n") + estimate_tokens(content)
+
+
+def test_importer_ranks_above_a_file_of_the_same_directory():
+    candidates = {
+        'app/views.py': "def index():\n    pass\n" + body(40),
+        'cli/main.py': "from app.models import User\n\ndef run():\n    pass\n" + body(40),
+    }
+    # Room for one file in full and the digest of the other
+    budget = (full_tokens('cli/main.py', candidates['cli/main.py'])
+              + FileDigest('app/views.py', candidates['app/views.py']).summary_tokens)
+    sections = ContextBuilder(max_tokens=budget).select('app/models.py', candidates)
+
+    # Sections keep the candidate order
+    assert sections == [
+        FileDigest('app/views.py', candidates['app/views.py']).summary,
+        f"Content of cli/main.py:\n{candidates['cli/main.py']}",
+    ]
+
+
+def test_files_over_the_budget_become_digests_or_are_left_out():
+    candidates = {
+        'app/models.py': "import sqlite3\n\nclass User:\n    pass\n" + body(200),
+        'app/forms.py': "class LoginForm:\n    pass\n" + body(200),
+        'app/utils.py': "from app.views import index\n\ndef slugify(text):\n    return text\n",
+    }
+    models = FileDigest('app/models.py', candidates['app/models.py'])
+    header_tokens = 40
+    # The importer fits in full, then only the first digest of the others
+    budget = header_tokens + full_tokens('app/utils.py', candidates['app/utils.py']) + models.summary_tokens
+    sections = ContextBuilder(max_tokens=budget).select('app/views.py', candidates, header_tokens=header_tokens)
+
+    assert sections == [models.summary, f"Content of app/utils.py:\n{candidates['app/utils.py']}"]
+    assert 'class User:' in models.summary and 'value_' not in models.summary
+
+    # Without a budget every file is included in full
+    unlimited = ContextBuilder(max_tokens=0).select('app/views.py', candidates, header_tokens=header_tokens)
+    assert unlimited == [f"Content of {path}:\n{content}" for path, content in candidates.items()]
@@ -0,0 +1,219 @@
+# tests/test_generate_files.py
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import git
+import pytest
+
+from generate_files import FileGenerator
+from github_handler import GitHubHandler
+from llm_providers import FakeProvider
+
+
+def test_files_are_related_only_within_a_directory_and_extension():
+    generator = FileGenerator(FakeProvider())
+    assert generator._are_files_related('src/app.py', 'src/models.py')
+    assert not generator._are_files_related('src/app.py', 'src/index.js')
+    assert not generator._are_files_related('src/app.py', 'tests/test_app.py')
+    assert generator._are_files_related('README.md', 'CHANGELOG.md')
+
+
+def test_dependency_graph_leaves_unrelated_files_independent():
+    generator = FileGenerator(FakeProvider())
+    file_list = ['app.py', 'models.py', 'templates/index.html', 'static/main.js', 'templates/base.html',
+                 'tests/test_app.py']
+    assert generator._build_dependency_graph(file_list) == {
+        'app.py': [],
+        'models.py': ['app.py'],
+        'templates/index.html': [],
+        'static/main.js': [],
+        'templates/base.html': ['templates/index.html'],
+        'tests/test_app.py': [],
+    }
+
+
+class ScriptedProvider(FakeProvider):
+    """
+    Fake provider answering the tree prompt with file_list and each file
+    prompt with the script of its path: an exception to raise, or a number of
+    chunks streamed chunk_delay seconds apart.
+    """
+
+    def __init__(self, file_list, script, chunk_delay=0.0):
+        super().__init__()
+        self.file_list = file_list
+        self.script = script
+        self.chunk_delay = chunk_delay
+        self.streamed = {}  # path -> chunks yielded so far
+
+    def stream(self, prompt, system=None):
+        self._respond(prompt)
+        if "Generate a JSON response" in prompt:
+            yield json.dumps({'files': self.file_list, 'title': '<title>Scripted</title>'})
+            return
+        path = re.search(r'the file "(.*?)"', prompt).group(1)
+        action = self.script.get(path, 1)
+        if isinstance(action, Exception):
+            time.sleep(self.chunk_delay)
+            raise action
+        for index in range(action):
+            time.sleep(self.chunk_delay)
+            self.streamed[path] = index + 1
+            yield f"line {index} of {path}\n"
+
+
+def test_failed_file_stops_the_files_in_flight(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    provider = ScriptedProvider(['src/app.py', 'docs/guide.md'],
+                                {'src/app.py': ValueError("model error"), 'docs/guide.md': 50}, chunk_delay=0.02)
+    # A pool shared with other projects, like the one of the job workers
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        generator = FileGenerator(provider, max_workers=2, executor=executor)
+        with pytest.raises(ValueError):
+            generator.generate_project("a project")
+        # What generate_repository does with a failed project
+        shutil.rmtree(generator.output_dir)
+        time.sleep(0.3)
+
+    assert not os.path.exists(generator.output_dir)
+    assert provider.streamed['docs/guide.md'] < 50
+    assert 'docs/guide.md' not in generator.current_files
+
+
+def plan_responder(plan, contents=None):
+    """Answers the update plan prompt with plan and each file prompt with contents[path] or a default."""
+    def respond(prompt):
+        if "Change request:" in prompt:
+            return json.dumps(plan)
+        path = re.search(r'the file "(.*?)"', prompt).group(1)
+        return (contents or {}).get(path, f"new content of {path}\n")
+    return respond
+
+
+def test_plan_update_keeps_only_safe_paths_and_existing_deletions():
+    plan = {
+        'files': ['app.py', '/abs/app.py', '../outside.py', '.git/config', 'src/../app.py', 'new.py', 7, ''],
+        'delete': ['old.py', 'missing.py', 'app.py', '../etc/passwd']
+    }
+    generator = FileGenerator(FakeProvider(responder=plan_responder(plan)))
+
+    targets, deleted = generator.plan_update("Rename things", ['app.py', 'old.py', 'README.md'])
+    assert targets == ['app.py', 'abs/app.py', 'new.py']
+    # Only existing files that aren't rewritten are deleted
+    assert deleted == ['old.py']
+
+
+def test_plan_update_rejects_a_plan_without_files():
+    generator = FileGenerator(FakeProvider(responder=lambda prompt: '{"delete": []}'))
+    with pytest.raises(ValueError):
+        generator.plan_update("Change", ['app.py'])
+
+
+def test_update_project_rewrites_targets_deletes_files_and_skips_links_outside(tmp_path):
+    secret = tmp_path / 'secret.txt'
+    secret.write_text('host secret')
+    project = tmp_path / 'project'
+    (project / 'lib').mkdir(parents=True)
+    (project / 'app.py').write_text('print("old app")\n')
+    (project / 'lib' / 'util.py').write_text('def helper(): pass\n')
+    (project / 'old.py').write_text('obsolete\n')
+    os.symlink(secret, project / 'notes.txt')
+    os.symlink(tmp_path, project / 'linked')
+    file_list = ['app.py', 'lib/util.py', 'old.py', 'notes.txt']
+
+    plan = {'files': ['app.py', 'new.py', 'notes.txt', 'linked/escape.py'], 'delete': ['old.py', 'notes.txt']}
+    provider = FakeProvider(responder=plan_responder(plan, {'app.py': 'print("new app")\n'}))
+    generator = FileGenerator(provider)
+    changed, deleted = generator.update_project("Improve the app", str(project), file_list, 'project')
+
+    assert changed == ['app.py', 'new.py']
+    assert deleted == ['old.py']
+    assert (project / 'app.py').read_text() == 'print("new app")\n'
+    assert (project / 'new.py').read_text() == 'new content of new.py\n'
+    assert not (project / 'old.py').exists()
+    # Links leading outside the checkout are left alone and never reach a prompt
+    assert secret.read_text() == 'host secret'
+    assert not (tmp_path / 'escape.py').exists()
+    assert all('host secret' not in prompt for prompt in provider.prompts)
+    # Each rewritten file sees its old version, and only targets are regenerated
+    app_prompt = next(prompt for prompt in provider.prompts if 'the file "app.py"' in prompt)
+    assert 'print("old app")' in app_prompt
+    assert not any('the file "lib/util.py"' in prompt for prompt in provider.prompts)
+
+
+def test_update_without_changes_pushes_nothing(tmp_path, monkeypatch):
+    monkeypatch.setenv('GITHUB_TOKEN', 'token')
+    monkeypatch.setenv('GITHUB_USERNAME', 'octo')
+    monkeypatch.setenv('GIT_MIRROR_DIR', '')
+    remotes = tmp_path / 'remotes'
+    remote = git.Repo.init(str(remotes / 'octo' / 'app.git'), bare=True, initial_branch='master')
+    seed = git.Repo.init(str(tmp_path / 'seed'), initial_branch='master')
+    with seed.config_writer() as config:
+        config.set_value('user', 'name', 'Test')
+        config.set_value('user', 'email', 'test@example.com')
+    for name, content in (('app.py', 'print("app")\n'), ('LICENSE', 'MIT\n')):
+        (tmp_path / 'seed' / name).write_text(content)
+    seed.index.add(['app.py', 'LICENSE'])
+    seed.index.commit("Initial commit")
+    seed.create_remote('origin', remote.working_dir).push('master')
+    handler = GitHubHandler(git_url=f"file://{remotes}")
+
+    def update(content):
+        checkout = str(tmp_path / f"checkout-{len(os.listdir(tmp_path))}")
+        file_list = handler.clone_repository('app', checkout)
+        with git.Repo(checkout).config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+        generator = FileGenerator(FakeProvider(responder=plan_responder({'files': ['app.py']}, {'app.py': content})))
+        generator.update_project("Change the app", checkout, file_list, 'app')
+        assert handler.update_repository('app', checkout)
+        return int(remote.git.rev_list('--count', 'master'))
+
+    # Regenerated with the same content: same blob hash, so no commit
+    assert update('print("app")\n') == 1
+    assert update('print("changed")\n') == 2
+
+
+BATCH = ['pkg/__init__.py', 'tests/__init__.py', 'requirements.txt']
+
+
+def block(path, content, end=True):
+    return f"=== FILE: {path} ===\n{content}\n" + ("=== END FILE ===\n" if end else "")
+
+
+@pytest.mark.parametrize('response, fallback', [
+    # The block of requirements.txt is never closed
+    (block('pkg/__init__.py', '') + block('tests/__init__.py', '') + block('requirements.txt', 'flask', end=False),
+     ['requirements.txt']),
+    # A file nobody asked for is ignored, the others are kept
+    (block('pkg/__init__.py', '') + block('setup.py', 'setup()') + block('tests/__init__.py', '')
+     + block('requirements.txt', 'flask'), []),
+    # Two versions of pkg/__init__.py: neither is trusted
+    (block('pkg/__init__.py', '') + block('tests/__init__.py', '') + block('pkg/__init__.py', 'import os')
+     + block('requirements.txt', 'flask'), ['pkg/__init__.py']),
+    (block('requirements.txt', 'flask'), ['pkg/__init__.py', 'tests/__init__.py']),
+], ids=['unclosed', 'unexpected', 'duplicate', 'missing'])
+def test_malformed_batch_falls_back_only_for_the_affected_files(response, fallback):
+    def respond(prompt):
+        if 'each of these files' in prompt:
+            return response
+        path = re.search(r'the file "(.*?)"', prompt).group(1)
+        return f"single {path}\n"
+
+    provider = FakeProvider(responder=respond)
+    generator = FileGenerator(provider, keep_in_memory=True)
+    sizes = generator.generate_batch(BATCH, "A flask app", ['app.py'] + BATCH)
+
+    assert set(sizes) == set(BATCH)
+    single = [path for path in BATCH if any(f'the file "{path}"' in prompt for prompt in provider.prompts)]
+    assert single == fallback
+    for path in BATCH:
+        if path in fallback:
+            assert generator.current_files[path] == f"single {path}\n"
+    if 'setup.py' in response:
+        assert 'setup.py' not in generator.current_files
+        assert generator.current_files['requirements.txt'].strip() == 'flask'
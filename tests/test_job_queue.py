@@ -0,0 +1,154 @@
+# tests/test_job_queue.py
+import threading
+import time
+
+import pytest
+
+from job_queue import (AdmissionPolicy, ClientLimitError, JobQueue, JobReporter, JobStateError, QueueFullError,
+                       JOB_COMPLETED, JOB_FAILED, JOB_RUNNING)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.01)
+
+
+def test_expired_lease_fails_job_and_frees_its_slot(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    crashed = JobQueue(lambda payload, reporter: {}, db_path=db_path, max_in_flight=1, lease_seconds=0.1)
+    job_id = crashed.submit({'prompt': 'a'})
+    crashed._claim_job()  # Claimed by a process that never renews the lease
+
+    queue = JobQueue(lambda payload, reporter: {}, db_path=db_path, max_in_flight=1, lease_seconds=0.1)
+    with pytest.raises(QueueFullError):
+        queue.submit({'prompt': 'b'})
+
+    time.sleep(0.2)
+    assert queue.expire_leases() == 1
+    job = queue.get_job(job_id)
+    assert job['status'] == JOB_FAILED
+    assert 'interrupted' in job['error']
+    assert [event['event'] for event in queue.get_events(job_id)] == [JOB_FAILED]
+    queue.submit({'prompt': 'b'})
+
+
+def test_heartbeat_keeps_long_jobs_claimed(tmp_path):
+    release = threading.Event()
+    queue = JobQueue(lambda payload, reporter: release.wait(5) and {}, db_path=str(tmp_path / 'jobs.sqlite3'),
+                     num_workers=1, poll_interval=0.05, lease_seconds=0.3)
+    queue.start()
+    try:
+        job_id = queue.submit({'prompt': 'a'})
+        time.sleep(0.8)  # Well past one lease
+        assert queue.expire_leases() == 0
+        assert queue.get_job(job_id)['status'] == JOB_RUNNING
+        release.set()
+        wait_for(lambda: queue.get_job(job_id)['status'] == JOB_COMPLETED)
+    finally:
+        release.set()
+        queue.stop(5)
+
+
+def test_retry_accepts_running_job_with_expired_lease(tmp_path):
+    queue = JobQueue(lambda payload, reporter: {}, db_path=str(tmp_path / 'jobs.sqlite3'), lease_seconds=0.1)
+    job_id = queue.submit({'prompt': 'a'})
+    queue._claim_job()
+    with pytest.raises(JobStateError):
+        queue.retry(job_id)
+
+    time.sleep(0.2)
+    assert queue.retry(job_id) is not None
+    assert queue.get_job(job_id)['status'] == 'queued'
+
+
+def test_stop_fails_unfinished_jobs_within_one_deadline(tmp_path):
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def handler(payload, reporter):
+        started.release()
+        release.wait(10)
+        return {'late': True}
+
+    queue = JobQueue(handler, db_path=str(tmp_path / 'jobs.sqlite3'), num_workers=2, poll_interval=0.05)
+    queue.start()
+    job_ids = [queue.submit({'prompt': 'a'}), queue.submit({'prompt': 'b'})]
+    assert started.acquire(timeout=5) and started.acquire(timeout=5)
+
+    began = time.monotonic()
+    queue.stop(timeout=0.3)
+    assert time.monotonic() - began < 0.6  # Not 0.3 seconds per worker
+
+    for job_id in job_ids:
+        job = queue.get_job(job_id)
+        assert job['status'] == JOB_FAILED
+        assert 'server stopped' in job['error']
+
+    # A job finishing after it was given up does not overwrite the failure
+    release.set()
+    time.sleep(0.2)
+    assert all(queue.get_job(job_id)['status'] == JOB_FAILED for job_id in job_ids)
+    assert queue.retry(job_ids[0]) is not None
+
+
+def test_batches_take_one_token_per_prompt(tmp_path):
+    queue = JobQueue(lambda payload, reporter: {}, db_path=str(tmp_path / 'jobs.sqlite3'),
+                     admission=AdmissionPolicy(rate=1, burst=2))
+    queue.admit('batcher', cost=5)  # Accepted with a token left, leaving the bucket in debt
+    with pytest.raises(ClientLimitError) as error:
+        queue.submit({'prompt': 'a'}, client_id='batcher')
+    assert error.value.reason == 'rate_limited'
+    assert error.value.retry_after > 3
+    with pytest.raises(ClientLimitError):
+        queue.admit('batcher', cost=1)
+    queue.submit({'prompt': 'a'}, client_id='other')
+
+
+def test_batches_respect_the_client_in_flight_limit(tmp_path):
+    queue = JobQueue(lambda payload, reporter: {}, db_path=str(tmp_path / 'jobs.sqlite3'),
+                     admission=AdmissionPolicy(max_in_flight=1))
+    queue.submit({'prompt': 'a'}, client_id='busy')
+    with pytest.raises(ClientLimitError) as error:
+        queue.admit('busy', cost=3)
+    assert error.value.reason == 'client_in_flight'
+    queue.admit('idle', cost=3)
+
+
+def test_progress_of_a_lost_lease_is_not_saved(tmp_path):
+    queue = JobQueue(lambda payload, reporter: {}, db_path=str(tmp_path / 'jobs.sqlite3'), lease_seconds=0.1)
+    job_id = queue.submit({'prompt': 'a'})
+    _, lost_lease = queue._claim_job()
+    time.sleep(0.2)
+    assert queue.expire_leases() == 1
+    queue.retry(job_id)
+    _, lease_id = queue._claim_job()
+
+    # The worker that lost the job is still running and reporting
+    JobReporter(queue, job_id, lost_lease).set_stage('stale')
+    assert queue.get_job(job_id)['progress'].get('stage') != 'stale'
+    JobReporter(queue, job_id, lease_id).set_stage('generating')
+    assert queue.get_job(job_id)['progress']['stage'] == 'generating'
+
+
+def test_finished_jobs_and_their_events_expire(tmp_path):
+    db_path = str(tmp_path / 'jobs.sqlite3')
+    queue = JobQueue(lambda payload, reporter: {}, db_path=db_path, lease_seconds=0.1)
+    old, recent, queued = (queue.submit({'prompt': prompt}) for prompt in 'abc')
+    for job_id in (old, recent):
+        queue._claim_job()
+    time.sleep(0.2)
+    queue.expire_leases()
+    conn = queue._connect()
+    conn.execute("UPDATE jobs SET finished_at = ? WHERE id = ?", (time.time() - 3600, old))
+    conn.close()
+
+    reopened = JobQueue(lambda payload, reporter: {}, db_path=db_path, ttl=60)
+    assert reopened.get_job(old) is None
+    assert reopened.get_events(old) == []
+    assert reopened.get_job(recent)['status'] == JOB_FAILED
+    assert reopened.get_events(recent)
+    assert reopened.get_job(queued)['status'] == 'queued'
+    assert reopened.purge(60) == 0
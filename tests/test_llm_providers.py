@@ -0,0 +1,114 @@
+# tests/test_llm_providers.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_providers import ConcurrencyLimitedProvider, FakeProvider, find_provider_layer
+from resilience import ResilientProvider
+from response_cache import CachedProvider, ResponseCache
+from router import ProviderRouter, RouteTarget
+
+
+class TrackingProvider(FakeProvider):
+    """Fake provider recording how many calls run at once and whether it was closed."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.running = 0
+        self.max_running = 0
+        self.closed = False
+
+    def stream(self, prompt, system=None):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            yield from super().stream(prompt, system=system)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def astream(self, prompt, system=None):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            async for chunk in super().astream(prompt, system=system):
+                yield chunk
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def close(self):
+        self.closed = True
+
+
+def build_stack(targets, max_concurrency=2):
+    """Wraps the fakes the way pipeline.build_provider_from_env() does."""
+    router = ProviderRouter([RouteTarget(provider, key_id=f"fake:{index}") for index, provider in enumerate(targets)])
+    resilient = ResilientProvider([router], backoff_base=0)
+    cached = CachedProvider(resilient, ResponseCache(cache_dir=None))
+    return ConcurrencyLimitedProvider(cached, max_concurrency)
+
+
+def test_stack_answers_and_caches_identical_calls():
+    fake = TrackingProvider(responder=lambda prompt: f"answer to {prompt}", chunk_size=3)
+    stack = build_stack([fake])
+
+    assert stack.complete("hello") == "answer to hello"
+    assert asyncio.run(stack.acomplete("hello")) == "answer to hello"
+    assert fake.prompts == ["hello"]
+    assert find_provider_layer(stack, ResilientProvider) is not None
+
+
+def test_stack_limits_concurrent_calls():
+    fake = TrackingProvider(latency=0.05)
+    stack = build_stack([fake], max_concurrency=2)
+
+    threads = [threading.Thread(target=stack.complete, args=(f"prompt {index}",)) for index in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(fake.prompts) == 6
+    assert fake.max_running == 2
+
+
+def test_async_stack_limits_concurrent_calls():
+    fake = TrackingProvider(latency=0.05)
+    stack = build_stack([fake], max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(stack.acomplete(f"prompt {index}") for index in range(6)))
+
+    assert len(asyncio.run(run())) == 6
+    assert fake.max_running == 2
+
+
+def test_cancelled_waiter_gives_back_its_slot():
+    fake = TrackingProvider(latency=0.2)
+    limited = ConcurrencyLimitedProvider(fake, 1)
+
+    async def run():
+        holder = asyncio.ensure_future(limited.acomplete("first"))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(limited.acomplete("second"))
+        await asyncio.sleep(0.05)
+        waiter.cancel()  # Still waiting for the slot held by the first call
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await holder
+        await asyncio.sleep(0.05)  # The executor thread takes the slot and gives it back
+
+    asyncio.run(run())
+    assert limited._semaphore.acquire(timeout=1)
+    limited._semaphore.release()
+    assert limited.complete("third")
+
+
+def test_close_reaches_every_provider():
+    fakes = [TrackingProvider(), TrackingProvider()]
+    build_stack(fakes).close()
+    assert all(fake.closed for fake in fakes)
@@ -0,0 +1,36 @@
+# tests/test_metrics.py
+import os
+import time
+
+from github_handler import rate_limiter
+from metrics import REGISTRY, Trace, load_trace, prune_traces
+
+
+def save_trace(trace_dir, trace_id, age):
+    Trace(trace_id).save(str(trace_dir))
+    path = os.path.join(str(trace_dir), f"{trace_id}.json")
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def test_prune_traces_by_age_then_count(tmp_path):
+    for index, age in enumerate([10, 20, 30, 4000, 5000]):
+        save_trace(tmp_path, f"trace{index}", age)
+
+    assert prune_traces(str(tmp_path), max_age=3600, max_files=2) == 3
+    assert sorted(os.listdir(tmp_path)) == ['trace0.json', 'trace1.json']
+    assert load_trace(str(tmp_path), 'trace0')['trace_id'] == 'trace0'
+    assert prune_traces(str(tmp_path), max_age=0, max_files=0) == 0
+    assert prune_traces(str(tmp_path / 'missing'), max_age=1, max_files=1) == 0
+
+
+def test_rate_limit_is_exported_as_gauges():
+    rate_limiter.update_from_headers({
+        'X-RateLimit-Remaining': '4321', 'X-RateLimit-Limit': '5000', 'X-RateLimit-Reset': '1900000000'
+    })
+
+    # Collected from the shared rate limiter when the metrics are rendered
+    rendered = REGISTRY.render()
+    assert 'github_rate_limit_remaining 4321' in rendered
+    assert 'github_rate_limit_limit 5000' in rendered
+    assert 'github_rate_limit_reset_timestamp_seconds 1900000000.0' in rendered
@@ -0,0 +1,91 @@
+# tests/test_mirror_cache.py
+import os
+import time
+
+import git
+import pytest
+
+from mirror_cache import MirrorCache
+
+
+class Remote:
+    """Bare repository used as the remote, with a working clone to push commits from."""
+
+    def __init__(self, root, name):
+        self.path = str(root / 'remotes' / f"{name}.git")
+        git.Repo.init(self.path, bare=True, initial_branch='master')
+        self.url = f"file://{self.path}"
+        self.work = git.Repo.init(str(root / 'work' / name), initial_branch='master')
+        with self.work.config_writer() as config:
+            config.set_value('user', 'name', 'Test')
+            config.set_value('user', 'email', 'test@example.com')
+        self.work.create_remote('origin', self.path)
+        self.commits = 0
+
+    def commit(self, file_name, content):
+        with open(os.path.join(self.work.working_dir, file_name), 'w') as f:
+            f.write(content)
+        self.work.index.add([file_name])
+        self.work.index.commit(f"Add {file_name}")
+        self.work.remote('origin').push('master')
+        self.commits += 1
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MirrorCache(str(tmp_path / 'mirrors'), max_mirrors=2)
+
+
+def mirror_commits(cache, key):
+    """Counts the commit objects stored in a mirror, reachable or not."""
+    objects = git.Repo(cache._mirror_path(key)).git.cat_file('--batch-all-objects', '--batch-check')
+    return sum(1 for line in objects.splitlines() if line.split()[1] == 'commit')
+
+
+def test_first_checkout_fetches_only_the_latest_commit(tmp_path, cache):
+    remote = Remote(tmp_path, 'app')
+    for index in range(3):
+        remote.commit(f"file{index}.txt", f"version {index}")
+
+    checkout = cache.checkout('user/app', remote.url, str(tmp_path / 'checkout'))
+
+    assert sorted(os.listdir(checkout.working_dir)) == ['.git', 'file0.txt', 'file1.txt', 'file2.txt']
+    assert checkout.head.commit.hexsha == remote.work.head.commit.hexsha
+    assert checkout.remote('origin').url == remote.url
+    assert mirror_commits(cache, 'user/app') == 1
+
+
+def test_second_checkout_fetches_only_the_new_commit(tmp_path, cache):
+    remote = Remote(tmp_path, 'app')
+    for index in range(3):
+        remote.commit(f"file{index}.txt", f"version {index}")
+    cache.checkout('user/app', remote.url, str(tmp_path / 'first'))
+
+    remote.commit('file3.txt', 'version 3')
+    checkout = cache.checkout('user/app', remote.url, str(tmp_path / 'second'))
+
+    assert checkout.head.commit.hexsha == remote.work.head.commit.hexsha
+    with open(os.path.join(checkout.working_dir, 'file3.txt')) as f:
+        assert f.read() == 'version 3'
+    # Only the new commit was fetched, next to the previous tip, and none of the older history
+    assert mirror_commits(cache, 'user/app') == 2
+    assert remote.commits == 4
+
+
+def test_least_recently_used_mirrors_are_evicted(tmp_path, cache):
+    remotes = {name: Remote(tmp_path, name) for name in ('one', 'two', 'three')}
+    for name, remote in remotes.items():
+        remote.commit('README.md', name)
+
+    cache.checkout('user/one', remotes['one'].url, str(tmp_path / 'c1'))
+    time.sleep(0.05)
+    cache.checkout('user/two', remotes['two'].url, str(tmp_path / 'c2'))
+    time.sleep(0.05)
+    cache.checkout('user/one', remotes['one'].url, str(tmp_path / 'c3'))  # Used again, now the most recent
+    time.sleep(0.05)
+    checkout = cache.checkout('user/three', remotes['three'].url, str(tmp_path / 'c4'))
+
+    assert sorted(os.path.basename(path) for path in cache._mirrors()) == ['one.git', 'three.git']
+    # Checkouts don't depend on the mirror they were cloned from
+    assert os.path.exists(os.path.join(tmp_path, 'c2', 'README.md'))
+    assert checkout.head.commit.hexsha == remotes['three'].work.head.commit.hexsha
@@ -0,0 +1,60 @@
+# tests/test_pipeline_benchmark.py
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pipeline_benchmark
+
+# Added to every repository by the GitHub handler
+HANDLER_FILES = ['.gitignore', 'LICENSE', 'README.md']
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'pipeline_benchmark.py')
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # run_single points the GitHub handler at the fake server through the environment
+    for name in ('GITHUB_TOKEN', 'GITHUB_USERNAME', 'GITHUB_API_URL', 'GITHUB_GIT_URL'):
+        monkeypatch.setenv(name, '')
+    return tmp_path
+
+
+@pytest.mark.parametrize('build_mode', ['disk', 'memory'])
+def test_run_single_pushes_every_generated_file(work_dir, build_mode):
+    result = pipeline_benchmark.run_single(8, 4, build_mode, latency=0, file_bytes=300, small_files=2)
+
+    assert result['files'] == 8
+    assert result['pushed_files'] == 8 + len(HANDLER_FILES)
+    assert result['github_requests'] > 0
+    remotes = os.listdir(work_dir / 'remotes' / pipeline_benchmark.USERNAME)
+    assert len(remotes) == 1
+    remote = work_dir / 'remotes' / pipeline_benchmark.USERNAME / remotes[0]
+    pushed = subprocess.run(['git', '--git-dir', str(remote), 'ls-tree', '-r', '--name-only', 'master'],
+                            check=True, capture_output=True, text=True).stdout.split()
+    generated = pipeline_benchmark.synthetic_file_list(8, 2)
+    assert sorted(pushed) == sorted(generated + HANDLER_FILES)
+    content = subprocess.run(['git', '--git-dir', str(remote), 'show', f'master:{generated[-1]}'],
+                             check=True, capture_output=True, text=True).stdout
+    assert 'padding for the benchmark' in content
+
+
+def test_benchmark_writes_results_and_compares_them_with_a_baseline(tmp_path):
+    output = tmp_path / 'results.json'
+    command = [sys.executable, BENCHMARK, '--files', '3', '--concurrency', '2', '--build-mode', 'memory',
+               '--latency', '0', '--file-bytes', '200']
+    subprocess.run(command + ['--output', str(output)], check=True, capture_output=True, text=True, timeout=120)
+
+    results = json.loads(output.read_text())
+    assert len(results) == 1
+    assert results[0]['files'] == 3
+    assert results[0]['pushed_files'] == 3 + len(HANDLER_FILES)
+    assert results[0]['build_mode'] == 'memory'
+
+    # A baseline far better than any real run is reported as a regression
+    baseline = [dict(results[0], wall_seconds=results[0]['wall_seconds'] / 100)]
+    assert pipeline_benchmark.compare(results, baseline, 0.1)
+    assert not pipeline_benchmark.compare(results, results, 0.1)
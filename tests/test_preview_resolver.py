@@ -0,0 +1,123 @@
+# tests/test_preview_resolver.py
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from preview_resolver import PreviewResolver
+
+
+class StandIn:
+    """Local HTTP server answering HEAD requests with a status and delay per path prefix."""
+
+    def __init__(self):
+        self.routes = {}  # path prefix -> (status, delay)
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                with stand_in._lock:
+                    stand_in.requests.append(self.path)
+                    stand_in.in_flight += 1
+                    stand_in.max_in_flight = max(stand_in.max_in_flight, stand_in.in_flight)
+                try:
+                    status, delay = next(
+                        (route for prefix, route in stand_in.routes.items() if self.path.startswith(prefix)),
+                        (404, 0)
+                    )
+                    time.sleep(delay)
+                    self.send_response(status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                finally:
+                    with stand_in._lock:
+                        stand_in.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def resolver(self, **options) -> PreviewResolver:
+        return PreviewResolver(
+            opengraph_url=f"{self.url}/og", social_url=f"{self.url}/social", raw_url=f"{self.url}/raw",
+            avatar_url=f"{self.url}/avatar", default_image=f"{self.url}/default.png", **options
+        )
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def test_highest_priority_working_candidate_wins(stand_in):
+    stand_in.routes = {'/social/': (200, 0.2), '/raw/': (200, 0), '/avatar/': (200, 0), '/default': (200, 0)}
+    resolver = stand_in.resolver()
+
+    assert resolver.candidates('octo/app', 7) == [
+        f"{stand_in.url}/og/1/octo/app", f"{stand_in.url}/social/7/social",
+        f"{stand_in.url}/raw/octo/app/master/preview.png", f"{stand_in.url}/avatar/octo.png",
+        f"{stand_in.url}/default.png"
+    ]
+    # The social card answers last but outranks the faster candidates
+    assert resolver.resolve('octo/app', repo_id=7) == f"{stand_in.url}/social/7/social"
+    assert resolver.resolve('other/app') == f"{stand_in.url}/raw/other/app/master/preview.png"
+
+
+def test_results_and_misses_are_cached_for_their_ttl(stand_in):
+    stand_in.routes = {'/og/1/found/': (200, 0)}
+    resolver = stand_in.resolver(ttl=60, negative_ttl=0.2)
+
+    assert resolver.resolve('found/app') == f"{stand_in.url}/og/1/found/app"
+    assert resolver.resolve('missing/app') is None
+    assert resolver.resolve('found/app') == f"{stand_in.url}/og/1/found/app"
+    assert resolver.resolve('missing/app') is None
+
+    time.sleep(0.3)
+    stand_in.routes['/og/1/missing/'] = (200, 0)
+    assert resolver.resolve('missing/app') == f"{stand_in.url}/og/1/missing/app"
+    assert resolver.resolve('found/app') == f"{stand_in.url}/og/1/found/app"
+
+    # Lower-priority probes may still be answering after a result is chosen
+    time.sleep(0.2)
+    # Three candidates each round: only the expired miss was probed again
+    assert sum('found' in path for path in stand_in.requests) == 3
+    assert sum('missing' in path for path in stand_in.requests) == 6
+    assert resolver.stats()['hits'] == 3
+
+
+def test_probes_are_bounded_by_max_workers(stand_in):
+    stand_in.routes = {'/': (404, 0.05)}
+    resolver = stand_in.resolver(max_workers=3)
+
+    previews = resolver.resolve_many([{'full_name': f"owner/repo-{index}"} for index in range(6)])
+    assert previews == {f"owner/repo-{index}": None for index in range(6)}
+    assert len(stand_in.requests) == 6 * 4
+    assert stand_in.max_in_flight <= 3
+
+
+def test_timed_out_candidates_fall_back_to_the_default_image(stand_in):
+    stand_in.routes = {'/default': (200, 0), '/': (200, 2)}
+    resolver = stand_in.resolver(timeout=0.2)
+
+    started = time.monotonic()
+    assert resolver.resolve('slow/app', repo_id=1) == f"{stand_in.url}/default.png"
+    assert time.monotonic() - started < 1.5
+
+
+def test_only_owner_and_name_are_accepted(stand_in):
+    resolver = stand_in.resolver()
+    for full_name in ('owner/../../admin', 'owner/app/extra', 'http://internal/app'):
+        with pytest.raises(ValueError):
+            resolver.candidates(full_name)
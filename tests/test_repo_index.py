@@ -0,0 +1,164 @@
+# tests/test_repo_index.py
+import pytest
+
+from repo_index import RepositoryIndex, SORT_RELEVANCE
+
+
+def github_repo(repo_id, name, description=None, language=None, updated_at='2024-01-01T00:00:00Z', **fields):
+    """A repository in the GitHub REST API format."""
+    return {
+        'id': repo_id, 'name': name, 'full_name': f"octo/{name}", 'html_url': f"https://github.com/octo/{name}",
+        'description': description, 'language': language, 'stargazers_count': fields.pop('stars', 0),
+        'forks_count': 0, 'created_at': f"2024-01-{repo_id:02d}T00:00:00Z", 'updated_at': updated_at, **fields
+    }
+
+
+@pytest.fixture
+def index(tmp_path):
+    return RepositoryIndex(db_path=str(tmp_path / 'repositories.sqlite3'), token='token', username='octo',
+                           api_url='https://github.invalid')
+
+
+def names(result):
+    return [repo['repo_name'] for repo in result['repositories']]
+
+
+def test_search_matches_word_prefixes(index):
+    index.upsert([
+        github_repo(1, 'weather-dashboard', 'Shows forecasts', 'JavaScript'),
+        github_repo(2, 'todo-api', 'A REST service for tasks', 'Python'),
+        github_repo(3, 'pytorch-notes', 'Notebooks', 'Jupyter Notebook', prompt='Explain deep learning'),
+    ])
+
+    assert names(index.query(search='weath')) == ['weather-dashboard']
+    assert names(index.query(search='pyth')) == ['todo-api']
+    assert names(index.query(search='deep learn')) == ['pytorch-notes']  # Every word must match
+    assert names(index.query(search='deep weather')) == []
+    assert index.query(search='forecast')['total'] == 1
+    assert index.query(search='!!')['total'] == 3  # No words: no filter
+
+
+def test_relevance_ranks_name_matches_first(index):
+    index.upsert([
+        github_repo(1, 'notes-app', prompt='a chess engine with a web board'),
+        github_repo(2, 'board-games', 'Classic games'),
+        github_repo(3, 'chess-engine', 'Plays chess'),
+        github_repo(4, 'web-tools', 'Utilities', prompt='chess clock'),
+    ])
+
+    # Name weighs more than description, which weighs more than the prompt
+    assert names(index.query(search='chess', sort=SORT_RELEVANCE)) == ['chess-engine', 'web-tools', 'notes-app']
+    # A sort option orders the same matches by its column instead
+    assert names(index.query(search='chess', sort='name')) == ['chess-engine', 'notes-app', 'web-tools']
+
+
+def test_totals_hold_across_pages(index):
+    index.upsert([github_repo(repo_id, f"flask-app-{repo_id}") for repo_id in range(1, 8)])
+    index.upsert([github_repo(repo_id, f"django-site-{repo_id}") for repo_id in range(8, 11)])
+
+    pages = [index.query(page=page, per_page=3, search='flask') for page in (1, 2, 3, 4)]
+    assert [page['total'] for page in pages] == [7, 7, 7, 7]
+    assert [page['total_pages'] for page in pages] == [3, 3, 3, 3]
+    assert [len(page['repositories']) for page in pages] == [3, 3, 1, 0]
+    listed = [name for page in pages for name in names(page)]
+    assert sorted(listed) == sorted(f"flask-app-{repo_id}" for repo_id in range(1, 8))
+
+    everything = index.query(page=2, per_page=4)
+    assert everything['total'] == 10 and everything['total_pages'] == 3
+    assert names(everything) == ['flask-app-6', 'flask-app-5', 'flask-app-4', 'flask-app-3']  # Most recent first
+
+
+class StubResponse:
+    def __init__(self, status_code, body=None, headers=None, next_url=None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = headers or {}
+        self.links = {'next': {'url': next_url}} if next_url else {}
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class StubGitHub:
+    """Stands in for the requests session, answering the queued responses and recording each request."""
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append({'url': url, 'params': dict(params or {}), 'headers': dict(headers or {})})
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def github(index):
+    stub = StubGitHub()
+    index._session = stub
+    return stub
+
+
+def test_refresh_sends_since_and_etag_and_handles_not_modified(index, github):
+    github.responses = [StubResponse(200, [
+        github_repo(1, 'alpha', updated_at='2024-03-01T00:00:00Z'),
+        github_repo(2, 'beta', updated_at='2024-03-05T00:00:00Z'),
+    ], headers={'ETag': '"v1"'})]
+    assert index.refresh() == 2
+    first = github.requests[0]
+    assert 'since' not in first['params'] and 'If-None-Match' not in first['headers']
+    assert first['headers']['Authorization'] == 'token token'
+
+    github.responses = [StubResponse(200, [
+        github_repo(2, 'beta', 'Now with a description', updated_at='2024-03-09T00:00:00Z'),
+    ], headers={'ETag': '"v2"'})]
+    assert index.refresh() == 1
+    second = github.requests[1]
+    assert second['params']['since'] == '2024-03-05T00:00:00Z'  # Newest updated_at seen so far
+    assert 'If-None-Match' not in second['headers']  # The previous ETag was for another request
+    assert index.query(search='description')['total'] == 1
+
+    # The same request again carries its ETag, and a 304 changes nothing
+    index._set_state('high_water', '2024-03-05T00:00:00Z')
+    github.responses = [StubResponse(304)]
+    assert index.refresh() == 0
+    third = github.requests[2]
+    assert third['params']['since'] == '2024-03-05T00:00:00Z'
+    assert third['headers']['If-None-Match'] == '"v2"'
+    assert index.query()['total'] == 2
+
+
+def test_full_refresh_follows_pages_and_removes_deleted_repositories(index, github):
+    index.upsert([github_repo(repo_id, f"repo-{repo_id}") for repo_id in range(1, 5)])
+    github.responses = [
+        StubResponse(200, [github_repo(1, 'repo-1'), github_repo(2, 'renamed-2', stars=7)],
+                     next_url='https://github.invalid/user/repos?page=2'),
+        StubResponse(200, [github_repo(4, 'repo-4')]),
+    ]
+    assert not index.has_synced()
+    assert index.refresh(full=True) == 3
+
+    assert github.requests[1]['url'] == 'https://github.invalid/user/repos?page=2'
+    assert github.requests[1]['params'] == {}  # The next link already holds the query
+    assert sorted(names(index.query(sort='name'))) == ['renamed-2', 'repo-1', 'repo-4']
+    assert index.query(search='renamed')['repositories'][0]['link_preview']['stars'] == 7
+    assert index.has_synced()
+
+
+def test_generated_repository_is_listed_before_the_next_refresh(index, github):
+    index.add_repository_info({
+        'id': 9, 'name': 'recipe-box', 'full_name': 'octo/recipe-box', 'url': 'https://github.com/octo/recipe-box',
+        'description': 'Recipes', 'stars': 0, 'created_at': '2024-05-01T00:00:00Z',
+        'updated_at': '2024-05-01T00:00:00Z'
+    }, prompt='An app to store cooking recipes')
+    assert names(index.query(search='cooking')) == ['recipe-box']
+    assert github.requests == []
+
+    # A refresh updates the row from GitHub and keeps the prompt it was generated from
+    github.responses = [StubResponse(200, [github_repo(9, 'recipe-box', 'Recipes and more')])]
+    index.refresh()
+    assert names(index.query(search='cooking')) == ['recipe-box']
+    assert index.query(search='more')['total'] == 1
@@ -0,0 +1,66 @@
+# tests/test_resilience.py
+import time
+
+from llm_providers import FakeProvider
+from resilience import CircuitBreaker, ResilientProvider
+
+
+class FailingProvider(FakeProvider):
+    """Fake provider whose calls fail with a retryable error."""
+
+    def stream(self, prompt, system=None):
+        self._respond(prompt)
+        raise ConnectionError("connection reset")
+        yield
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_unused_fallback_keeps_its_half_open_trial():
+    primary, fallback = FakeProvider(responder=lambda prompt: "ok"), FakeProvider(responder=lambda prompt: "fallback")
+    resilient = ResilientProvider([primary, fallback], breaker_cooldown=0.05)
+    fallback_breaker = resilient.providers[1].breaker
+    open_breaker(fallback_breaker)
+    time.sleep(0.1)
+
+    assert resilient.complete("prompt") == "ok"
+    assert fallback.prompts == []
+    # The call never went to the fallback, so its trial slot is still free
+    assert fallback_breaker.available()
+    assert fallback_breaker.allow()
+
+
+def test_half_open_trial_is_taken_by_the_provider_used():
+    primary, fallback = FakeProvider(responder=lambda prompt: "ok"), FakeProvider(responder=lambda prompt: "fallback")
+    resilient = ResilientProvider([primary, fallback], breaker_cooldown=0.05)
+    primary_breaker = resilient.providers[0].breaker
+    open_breaker(primary_breaker)
+    time.sleep(0.1)
+
+    assert resilient.complete("prompt") == "ok"
+    assert primary_breaker.state == CircuitBreaker.CLOSED
+    assert fallback.prompts == []
+
+
+def test_busy_half_open_provider_is_skipped():
+    primary, fallback = FakeProvider(responder=lambda prompt: "ok"), FakeProvider(responder=lambda prompt: "fallback")
+    resilient = ResilientProvider([primary, fallback], breaker_cooldown=30)
+    primary_breaker = resilient.providers[0].breaker
+    open_breaker(primary_breaker)
+    primary_breaker.opened_at -= 30
+    assert primary_breaker.allow()  # Trial taken by a call still in progress
+
+    assert resilient.complete("prompt") == "fallback"
+    assert primary.prompts == []
+
+
+def test_failure_fails_over_to_the_next_provider():
+    failing, fallback = FailingProvider(), FakeProvider(responder=lambda prompt: "fallback")
+    resilient = ResilientProvider([failing, fallback], backoff_base=0, breaker_threshold=1)
+
+    assert resilient.complete("prompt") == "fallback"
+    assert len(failing.prompts) == 1
+    assert resilient.providers[0].breaker.state == CircuitBreaker.OPEN
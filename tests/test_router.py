@@ -0,0 +1,81 @@
+# tests/test_router.py
+import asyncio
+
+import pytest
+
+from llm_providers import FakeProvider
+from resilience import CircuitBreaker, LLMTimeoutError
+from router import ProviderRouter, RouteTarget
+
+
+def fake(name):
+    return FakeProvider(responder=lambda prompt: f"{name}:{prompt}", chunk_size=4)
+
+
+def open_streams(router, count):
+    """Starts count calls and keeps them in flight, returning their streams and first chunks."""
+    streams = [router.stream(f"prompt {index}") for index in range(count)]
+    return streams, [next(stream) for stream in streams]
+
+
+def test_routing_follows_weight_and_load():
+    router = ProviderRouter([RouteTarget(fake('a'), 'a', weight=2), RouteTarget(fake('b'), 'b')])
+    streams, chunks = open_streams(router, 4)
+    # Costs (in flight + 1) / weight: a 0.5 < b 1, tie at 1 goes to a, then a 1.5 > b 1, a 1.5 < b 2
+    assert [chunk[0] for chunk in chunks] == ['a', 'a', 'b', 'a']
+    for stream in streams:
+        list(stream)
+    assert [target.outstanding for target in router.targets] == [0, 0]
+
+
+def test_target_out_of_quota_is_skipped():
+    router = ProviderRouter([RouteTarget(fake('a'), 'a', weight=10, requests_per_minute=2), RouteTarget(fake('b'), 'b')])
+    streams, chunks = open_streams(router, 4)
+    assert [chunk[0] for chunk in chunks] == ['a', 'a', 'b', 'b']
+    assert router.stats()['targets'][0]['quota_remaining'] == 0
+    for stream in streams:
+        stream.close()
+
+
+def test_call_fails_when_no_target_frees_up_in_time():
+    router = ProviderRouter([RouteTarget(fake('a'), 'a', max_concurrency=1)], acquire_timeout=0.1)
+    streams, _ = open_streams(router, 1)
+    with pytest.raises(LLMTimeoutError):
+        router.complete("waiting")
+    assert router.waits == 1
+    streams[0].close()
+    assert router.complete("later") == "a:later"
+
+
+def test_abandoned_stream_is_neither_success_nor_failure():
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    router = ProviderRouter([RouteTarget(fake('a'), 'a', breaker=breaker)])
+
+    stream = router.stream("a long prompt")
+    next(stream)
+    stream.close()  # The caller stops reading before the end
+    target = router.targets[0]
+    assert target.outstanding == 0
+    assert target.latency is None
+    assert target.error_rate == 0.0
+    assert breaker.failures == 2
+
+    router.complete("prompt")
+    assert breaker.failures == 0
+
+
+def test_cancelled_async_stream_is_neither_success_nor_failure():
+    breaker = CircuitBreaker(failure_threshold=3)
+    breaker.record_failure()
+    router = ProviderRouter([RouteTarget(fake('a'), 'a', breaker=breaker)])
+
+    async def abandon():
+        stream = router.astream("a long prompt")
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(abandon())
+    assert router.targets[0].outstanding == 0
+    assert breaker.failures == 1